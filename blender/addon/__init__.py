@@ -28,7 +28,7 @@ RADIANCE_BIN_FOLDER = "/usr/local/bin"
 RADIANCE_LIB_FOLDER = "/usr/local/lib/radiance"
 
 
-classes = [SceneSettingsRadiance, MaterialSettingsRadiance, ModifiersSettingsRadiance, LightSettingsRadiance, MOD_OT_Remove, MOD_OT_Add, MOD_OT_Clear, LIGHT_OT_Color, RAD_OT_Preview, RAD_OT_Export, RAD_OT_Render, RAD_PT_Scene, RAD_PT_Sky, RAD_PT_Render, RAD_PT_Material, RAD_PT_Light]
+classes = [SceneSettingsRadiance, MaterialSettingsRadiance, ModifiersSettingsRadiance, LightSettingsRadiance, MOD_OT_Remove, MOD_OT_Add, MOD_OT_Clear, LIGHT_OT_Color, RAD_OT_Preview, RAD_OT_Export, RAD_OT_Render, RAD_OT_Sensors, RAD_PT_Scene, RAD_PT_Sky, RAD_PT_Render, RAD_PT_Material, RAD_PT_Light]
 
 def register():
     for cls in classes:
@@ -0,0 +1,187 @@
+"""Ambient files shared by the renders of the same scene and settings
+
+An ambient file only stays valid for the geometry, materials and sky it
+was computed with and for the ambient settings of the renderer, so it is
+named by a hash of both: every view of a scene, and every process
+rendering it, then uses the same file. The first user warms it with a low
+resolution pass of all the views; rpict locks the file itself while
+appending to it, the cache only needs to keep the warm-up to one process
+and the files in use out of the eviction of stale ones.
+
+    python ambient.py scene.rif rad scene.rif
+"""
+
+import argparse
+import fcntl
+import os
+import shlex
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+from cache import new_hash
+from pool import errors, run, run_all
+from rif import Rif
+from tracing import TRACER, stage
+
+AMBIENT_DIR = "ambient"
+DISK_BUDGET = 1 << 30
+MAX_AGE = 30 * 24 * 3600  # seconds without being used
+WARMUP_SCALE = 8  # the warm-up resolution is divided by this
+
+# rpict options the ambient values depend on, with their number of values
+AMBIENT_OPTIONS = {
+    "-ab": 1, "-aa": 1, "-ar": 1, "-ad": 1, "-as": 1, "-av": 3, "-aw": 1,
+    "-lr": 1, "-lw": 1, "-me": 3, "-ma": 3, "-mg": 1, "-ms": 1,
+}
+
+
+def ambient_options(options):
+    """The ambient settings in a list of rpict options, last one wins"""
+    found = {}
+    i = 0
+    while i < len(options):
+        n = AMBIENT_OPTIONS.get(options[i])
+        if n is None:
+            i += 1
+            continue
+        found[options[i]] = options[i + 1 : i + 1 + n]
+        i += 1 + n
+    return [w for opt in sorted(found) for w in [opt, *found[opt]]]
+
+
+class AmbientCache:
+    """Directory of ambient files named by scene and settings
+
+    Paths are relative to the directory the renderer runs in (cwd).
+    """
+
+    def __init__(self, directory=AMBIENT_DIR, budget=DISK_BUDGET, max_age=MAX_AGE,
+                 cwd=None):
+        self.directory = directory
+        self.budget = budget
+        self.max_age = max_age
+        self.cwd = cwd if cwd is not None else os.getcwd()
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def file(self, scene_key, options):
+        """Ambient file for a scene content key and rpict options"""
+        h = new_hash()
+        h.update(scene_key.encode())
+        h.update(" ".join(ambient_options(options)).encode())
+        os.makedirs(self.path(self.directory), exist_ok=True)
+        amb = os.path.join(self.directory, f"{h.hexdigest()}.amb")
+        if os.path.isfile(self.path(amb)):
+            os.utime(self.path(amb))  # used again, not stale
+        return amb
+
+    @contextmanager
+    def lock(self, amb, shared=True, blocking=True):
+        """Holds a lock on an ambient file
+
+        Renders take it shared so the file is not evicted under them, the
+        warm-up and the eviction take it exclusive.
+        """
+        with open(self.path(f"{amb}.lock"), "a") as f:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            fcntl.flock(f, flags if blocking else flags | fcntl.LOCK_NB)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def warm(self, amb, octree, views, resolution, options, workers=None):
+        """Fills the ambient file with a low resolution pass of the views
+
+        views are lists of rpict view options. Only the first caller renders,
+        the others wait for it; returns the error messages.
+        """
+        marker = self.path(f"{amb}.warm")
+        with self.lock(amb, shared=False):
+            if os.path.isfile(marker) and os.path.isfile(self.path(amb)):
+                return []
+            x, y = (str(max(1, r // WARMUP_SCALE)) for r in resolution)
+            commands = [
+                ["rpict", *options, "-af", amb, "-x", x, "-y", y, *view, octree]
+                for view in views
+            ]
+            discard = [subprocess.DEVNULL] * len(commands)
+            with stage("ambient warm-up", ambfile=amb, views=len(views)):
+                results = run_all(commands, workers, discard, self.cwd)
+            msgs = errors(results)
+            if not msgs:
+                with open(marker, "w"):
+                    pass
+            return msgs
+
+    def evict(self, keep=None):
+        """Removes the ambient files unused for too long or above the budget
+
+        Files locked by a render are left alone.
+        """
+        directory = self.path(self.directory)
+        if not os.path.isdir(directory):
+            return
+        ambs = sorted(
+            (os.path.join(self.directory, f) for f in os.listdir(directory) if f.endswith(".amb")),
+            key=lambda p: os.path.getmtime(self.path(p)),
+        )
+        total = sum(os.path.getsize(self.path(p)) for p in ambs)
+        now = time.time()
+        for amb in ambs:
+            stale = now - os.path.getmtime(self.path(amb)) > self.max_age
+            if amb == keep or not (stale or total > self.budget):
+                continue
+            try:
+                with self.lock(amb, shared=False, blocking=False):
+                    size = os.path.getsize(self.path(amb))
+                    for p in (amb, f"{amb}.warm"):
+                        if os.path.exists(self.path(p)):
+                            os.remove(self.path(p))
+                    total -= size
+            except BlockingIOError:
+                continue  # in use
+
+
+def warm_rif(rif, workers=None):
+    """Warms the ambient file of a rif file, returns the error messages"""
+    # rad removes an ambient file older than the octree, so update it first
+    result = run(["rad", "-v", "0", os.path.abspath(rif.filename)], cwd=rif.cwd)
+    if result.returncode != 0:
+        return errors([result])
+    views = [shlex.split(options) for _, options in rif.views]
+    return AmbientCache(cwd=rif.cwd).warm(
+        rif.ambfile, rif.octree, views, rif.resolution, rif.render_options(), workers
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Warms the ambient file of a rif file and runs a command using it"
+    )
+    parser.add_argument("--no-warm", action="store_true")
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("rif")
+    parser.add_argument("command", nargs=argparse.REMAINDER)
+    args = parser.parse_args(argv)
+    rif = Rif(os.path.join(args.cwd, args.rif), args.cwd)
+    if not rif.ambfile:
+        return TRACER.run(args.command, cwd=args.cwd).returncode if args.command else 0
+    if not args.no_warm:
+        msgs = warm_rif(rif)
+        for msg in msgs:
+            print(msg, file=sys.stderr)
+        if msgs:
+            return 1
+    if not args.command:
+        return 0
+    # the shared lock keeps the file from being evicted while in use
+    with AmbientCache(cwd=args.cwd).lock(rif.ambfile):
+        return TRACER.run(args.command, cwd=args.cwd).returncode
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,283 @@
+"""Renders every scene, view and time of rif files as one resumable batch
+
+The jobs of a scene at a time are run together, from the same cached
+octree (its geometry part shared by every time step, and by the scenes
+with the same geometry) and the same ambient file, warmed once for all
+its views. Jobs run on every core as long as their memory estimate, from
+the size of the octree and of the meshes it loads, fits in the memory
+available. Finished pictures are written to a manifest with their timings,
+with what they were rendered from (date and time, view and a hash of the
+scene and settings), so a killed batch resumes with the missing ones and
+a picture left from another date or scene is rendered again. The
+throughput of the run is reported at the end.
+
+    python batch.py -C radiance scenes/*/scene.rif --start 1990-08-01T08:00 \\
+        --end 1990-08-01T18:00 --step 120
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from ambient import AmbientCache
+from hdr import expose
+from cache import new_hash
+from octree import OctreeCache, included_files
+from pool import errors, run
+from rif import Rif
+from sweep import picture_at, sky_at, split_scene, time_steps
+
+MANIFEST = "manifest.json"
+MEMORY_FRACTION = 0.8  # of the available memory the jobs may use
+BASE_MEMORY = 64 << 20  # an rpict before it loads the scene
+SCENE_FACTOR = 2  # bytes of memory per byte of octree and meshes
+PIXEL_BYTES = 16
+
+
+def available_memory():
+    """Bytes of memory available to new processes"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+class MemoryGate:
+    """Admits jobs while the sum of their memory estimates fits a budget"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, n):
+        with self.condition:
+            # a job larger than the budget runs alone
+            self.condition.wait_for(lambda: self.used == 0 or self.used + n <= self.budget)
+            self.used += n
+
+    def release(self, n):
+        with self.condition:
+            self.used -= n
+            self.condition.notify_all()
+
+
+class Batch:
+    """Pictures of the views of rif files at time steps, paths relative to cwd
+
+    times holds datetimes, or None for the sky written in the scene.
+    """
+
+    def __init__(self, rifs, times=(None,), directory="batch", cwd=".", workers=None,
+                 memory=None):
+        self.rifs = rifs
+        self.times = list(times)
+        self.directory = directory
+        self.cwd = cwd
+        self.workers = workers or os.cpu_count()
+        self.budget = memory or MEMORY_FRACTION * available_memory()
+        self.octrees = OctreeCache(cwd=cwd)
+        self.ambient = AmbientCache(cwd=cwd)
+        self.lock = threading.Lock()
+        self.manifest = os.path.join(directory, MANIFEST)
+        self.done = {}
+        if os.path.isfile(self.path(self.manifest)):
+            with open(self.path(self.manifest)) as f:
+                self.done = json.load(f)["done"]
+        self.finished = []  # (picture, seconds, pixels) of this run
+        self.keys = {}  # rif file -> scene key
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def stamp(self, when):
+        one_day = len({t.date() for t in self.times}) == 1
+        return f"{when:%H:%M}" if one_day else f"{when:%m-%d_%H:%M}"
+
+    def picture(self, rif, when, view):
+        if when is None:
+            return rif.view_picture(view)
+        return picture_at(rif.picture, self.stamp(when), view)
+
+    def scene_key(self, rif):
+        """Hash of the scene content and of the render settings of a rif file"""
+        if rif.filename not in self.keys:
+            h = new_hash()
+            h.update(self.octrees.key(rif.files("materials") + rif.files("scene")).encode())
+            x, y = rif.resolution
+            h.update(" ".join([*rif.render_options(), str(x), str(y),
+                               rif.get("EXPOSURE", "1")]).encode())
+            self.keys[rif.filename] = h.hexdigest()
+        return self.keys[rif.filename]
+
+    def record(self, rif, when, view):
+        """What a picture is rendered from"""
+        return {
+            "time": when.isoformat() if when is not None else None, "view": view,
+            "options": dict(rif.views)[view], "scene": self.scene_key(rif),
+        }
+
+    def is_done(self, rif, when, view):
+        picture = self.picture(rif, when, view)
+        done = self.done.get(picture, {})
+        return (done.get("record") == self.record(rif, when, view)
+                and os.path.isfile(self.path(picture)))
+
+    def groups(self):
+        """(rif, time, pending views) sharing an octree and an ambient file"""
+        for rif in self.rifs:
+            for when in self.times:
+                views = [view for view, _ in rif.views if not self.is_done(rif, when, view)]
+                if views:
+                    yield rif, when, views
+
+    def octree(self, rif, when):
+        """Cached octree of a scene, with its sky moved to a time"""
+        files = rif.files("materials") + rif.files("scene")
+        if when is None:
+            return self.octrees.get(files)
+        geometry, sky, dependent = split_scene(rif)
+        # without comments, scenes with the same geometry share its octree
+        geometry = [
+            l for block in geometry for l in block.splitlines()
+            if l.strip() and not l.lstrip().startswith("#")
+        ]
+        directory = os.path.join(self.directory, rif.root.replace(os.sep, "_"))
+        os.makedirs(self.path(directory), exist_ok=True)
+        names = [os.path.join(directory, "geometry.rad"),
+                 os.path.join(directory, f"sky{self.stamp(when).replace(':', '')}.rad")]
+        for name, lines in zip(names, [geometry, sky_at(sky, when) + dependent]):
+            with open(self.path(name), "w") as f:
+                f.write("\n".join(lines) + "\n")
+        return self.octrees.get(names, lights=names[1:])
+
+    def memory(self, rif, octree):
+        """Memory estimate of an rpict of the scene"""
+        size = os.path.getsize(self.path(octree))
+        for f in rif.files("materials") + rif.files("scene"):
+            for p in included_files(self.path(f), self.cwd):
+                with open(p, errors="replace") as text:
+                    data = self.octrees.data_files(text.read(), os.path.dirname(p))
+                size += sum(os.path.getsize(d) for d in data)
+        x, y = rif.resolution
+        return BASE_MEMORY + SCENE_FACTOR * size + PIXEL_BYTES * x * y
+
+    def save_manifest(self):
+        path = self.path(self.manifest)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"done": self.done}, f, indent=1)
+        os.replace(f"{path}.tmp", path)
+
+    def render(self, command, picture, amb, exposure, pixels, record):
+        start = time.time()
+        with self.ambient.lock(amb):  # not evicted while in use
+            result = run(command, picture, cwd=self.cwd)
+        seconds = time.time() - start
+        if result.returncode == 0:
+            expose(self.path(picture), exposure)
+            with self.lock:
+                self.done[picture] = {
+                    "seconds": round(seconds, 3), "pixels": pixels, "record": record,
+                }
+                self.finished.append((picture, seconds, pixels))
+                self.save_manifest()
+        return result
+
+    def run(self):
+        """Renders the missing pictures, returns the error messages"""
+        os.makedirs(self.path(self.directory), exist_ok=True)
+        gate = MemoryGate(self.budget)
+        msgs, futures = [], []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for rif, when, views in self.groups():
+                try:
+                    octree = self.octree(rif, when)
+                except Exception as e:
+                    msgs.append(f"{rif.filename}: {e}")
+                    continue
+                options = rif.render_options()
+                # the octree is named by the hash of its content
+                amb = self.ambient.file(os.path.basename(octree), options)
+                words = {v: shlex.split(o) for v, o in rif.views}
+                warm = self.ambient.warm(
+                    amb, octree, [words[v] for v in views], rif.resolution, options,
+                    self.workers,
+                )
+                if warm:
+                    msgs += warm
+                    continue
+                x, y = rif.resolution
+                exposure = float(rif.get("EXPOSURE", "1").split()[0])
+                memory = self.memory(rif, octree)
+                for view in views:
+                    picture = self.picture(rif, when, view)
+                    os.makedirs(os.path.dirname(self.path(picture)) or ".", exist_ok=True)
+                    command = ["rpict", *options, "-af", amb, "-x", str(x), "-y", str(y),
+                               *words[view], octree]
+                    gate.acquire(memory)  # waits for room before queueing more
+                    future = executor.submit(
+                        self.render, command, picture, amb, exposure, x * y,
+                        self.record(rif, when, view),
+                    )
+                    future.add_done_callback(lambda _, m=memory: gate.release(m))
+                    futures.append(future)
+        msgs += errors([f.result() for f in futures])
+        self.octrees.save_index()
+        return msgs
+
+    def report(self, seconds):
+        """Per picture and total throughput of this run"""
+        lines = []
+        for picture, t, pixels in self.finished:
+            lines.append(f"{picture}: {t:.1f} s, {pixels / t / 1e6:.3f} Mpixel/s")
+        if self.finished:
+            busy = sum(t for _, t, _ in self.finished)
+            pixels = sum(p for _, _, p in self.finished)
+            lines.append(
+                f"{len(self.finished)} pictures in {seconds:.1f} s, "
+                f"{3600 * len(self.finished) / seconds:.1f} per hour, "
+                f"{pixels / seconds / 1e6:.3f} Mpixel/s, "
+                f"{100 * busy / (seconds * self.workers):.0f}% of {self.workers} workers busy"
+            )
+        return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rifs", nargs="+")
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument("--step", type=int, default=60, help="minutes")
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("-d", "--directory", default="batch")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("-m", "--memory", type=float, default=None,
+                        help="GiB the jobs may use, by default most of the available memory")
+    args = parser.parse_args(argv)
+    times = [None]
+    if args.start is not None:
+        times = time_steps(args.start, args.end or args.start, args.step)
+    rifs = [Rif(os.path.join(args.cwd, r), args.cwd) for r in args.rifs]
+    memory = args.memory * (1 << 30) if args.memory else None
+    batch = Batch(rifs, times, args.directory, args.cwd, args.workers, memory)
+    start = time.time()
+    msgs = batch.run()
+    for line in batch.report(time.time() - start):
+        print(line)
+    for msg in msgs:
+        print(msg, file=sys.stderr)
+    return 1 if msgs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
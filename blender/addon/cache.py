@@ -0,0 +1,151 @@
+"""Content hashes of the exported Blender data"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+CHUNK_SIZE = 1 << 20
+
+
+def new_hash():
+    return hashlib.blake2b(digest_size=16)
+
+
+def hash_file(path, h=None):
+    """Hashes the content of a file"""
+    h = h or new_hash()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+    return h
+
+
+def _update(h, collection, attr, dtype, width=1):
+    a = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, a)
+    h.update(a.tobytes())
+
+
+def hash_mesh(ob, depsgraph):
+    """Hashes the evaluated mesh of ob in object space"""
+    h = new_hash()
+    eval_ob = ob.evaluated_get(depsgraph)
+    mesh = eval_ob.to_mesh()
+    try:
+        _update(h, mesh.vertices, "co", np.float32, 3)
+        _update(h, mesh.loops, "vertex_index", np.int32)
+        _update(h, mesh.polygons, "loop_start", np.int32)
+        _update(h, mesh.polygons, "material_index", np.int32)
+        _update(h, mesh.polygons, "use_smooth", np.bool_)
+        if mesh.uv_layers.active is not None:
+            _update(h, mesh.uv_layers.active.data, "uv", np.float32, 2)
+    finally:
+        eval_ob.to_mesh_clear()
+    for slot in ob.material_slots:
+        h.update(slot.name.encode())
+    return h.hexdigest()
+
+
+def hash_image(image, h=None):
+    """Hashes the pixels of a Blender image and the colour space they are in"""
+    import bpy
+
+    h = h or new_hash()
+    # an sRGB image is linearized when converted, a Non-Color one is not
+    h.update(f"{image.colorspace_settings.name};".encode())
+    path = bpy.path.abspath(image.filepath) if image.filepath else ""
+    if image.packed_file is not None:
+        h.update(image.packed_file.data)
+    elif os.path.isfile(path) and not image.is_dirty:
+        hash_file(path, h)
+    else:
+        pixels = np.empty(len(image.pixels), dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+        h.update(pixels.tobytes())
+    return h
+
+
+def _hash_settings(h, settings):
+    for prop in settings.bl_rna.properties:
+        if prop.identifier == "rna_type":
+            continue
+        value = getattr(settings, prop.identifier)
+        if hasattr(value, "__len__") and not isinstance(value, str):
+            value = tuple(value)
+        h.update(f"{prop.identifier}={value!r};".encode())
+
+
+def hash_material(mat):
+    """Hashes the Radiance settings, modifiers and texture of a material
+
+    An empty material slot (None) hashes to a fixed marker.
+    """
+    h = new_hash()
+    if mat is None:
+        h.update(b"\0empty slot")
+        return h.hexdigest()
+    h.update(mat.name.encode())
+    _hash_settings(h, mat.radiance)
+    for mod in mat.modifier:
+        h.update(mod.material.encode())
+    if mat.radiance.is_texture:
+        surface = (
+            mat.node_tree.nodes.get("Material Output")
+            .inputs["Surface"]
+            .links[0]
+            .from_node
+        )
+        if surface.inputs["Base Color"].is_linked:
+            hash_image(surface.inputs["Base Color"].links[0].from_node.image, h)
+    return h.hexdigest()
+
+
+def hash_materials(materials):
+    """Hashes a list of materials (the material slots of an object)"""
+    h = new_hash()
+    for mat in materials:
+        h.update(hash_material(mat).encode())
+    return h.hexdigest()
+
+
+class Manifest:
+    """Hashes of the objects exported in the previous run"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.objects = {}
+        self.previous = {}
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                self.previous = json.load(f).get("objects", {})
+
+    def changed(self, name, key, value):
+        """Checks if the value stored for the object has changed"""
+        return self.previous.get(name, {}).get(key) != value
+
+    def get(self, name, key, default=None):
+        """Value stored for the object in the previous run"""
+        return self.previous.get(name, {}).get(key, default)
+
+    def set(self, name, **values):
+        self.objects.setdefault(name, {}).update(values)
+
+    def converted(self, conversions, results):
+        """Sets the values of the conversions of the groups that all succeeded
+
+        conversions are (group, name, values), one per result, such as the
+        chunks of a mesh, which are only up to date together.
+        """
+        failed = {
+            group for (group, _, _), result in zip(conversions, results)
+            if result.returncode != 0
+        }
+        for group, name, values in conversions:
+            if group not in failed:
+                self.set(name, **values)
+
+    def save(self):
+        with open(self.filename, "w") as f:
+            json.dump({"objects": self.objects}, f, indent=1, sort_keys=True)
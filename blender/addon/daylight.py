@@ -0,0 +1,368 @@
+"""Daylight coefficients: one contribution calculation, then any sky
+
+rcontrib computes, for every pixel of a view (or every sensor), the light
+it receives from each patch of a Reinhart/Tregenza subdivision of the sky
+of unit brightness. The coefficients are stored as a float32 .npy file and
+an image or sensor reading for any sky becomes a matrix product with the
+sky vector (the mean radiance of each patch), done in chunks of points so
+it fits in memory. The sky vectors come from sky.py, so a year of hourly
+skies costs seconds once the coefficients exist.
+
+In the coefficient scene the sky is a glow of unit brightness and the
+illums lit by skyfunc (the windows) are replaced by their alternate
+materials, since their distribution would bake one sky in.
+
+    python daylight.py scenes/gwindow1/scene.rif --start 1990-08-01T08:00 \\
+        --end 1990-08-01T18:00 --step 60
+"""
+
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from cache import new_hash
+from hdr import Header, write_hdr
+from octree import OctreeCache
+from rif import Rif
+from sensors import rtrace_options
+from sky import parse_gensky, parse_time, skybright, sky_values, sun_position
+from sweep import gensky_at, split_scene, time_steps
+from tiles import parse_view, resolution, view_options
+
+DAYLIGHT_DIR = "daylight"
+MF = 1  # Reinhart subdivision, 1 is Tregenza's 145 patches (+ ground)
+SAMPLES = 1 << 15  # directions averaged per sky vector
+CHUNK = 1 << 14  # points per matrix product
+SKY_BATCH = 64  # skies per matrix product
+SUN_SOLID_ANGLE = 6.7967e-5  # sr, a 0.533 degree sun
+SKY_COLOR = (0.9, 0.9, 1.15)  # the sky and ground glows of sky.rad
+GROUND_COLOR = (1.4, 0.9, 0.6)
+READ_SIZE = 1 << 20
+
+DC_SKY = """void glow sky_glow
+0
+0
+4 1 1 1 0
+
+sky_glow source sky
+0
+0
+4 0 0 1 180
+
+sky_glow source ground
+0
+0
+4 0 0 -1 180
+"""
+
+
+def primitives(text):
+    """(modifier, type, identifier, strings, integers, reals) of a description"""
+    words = " ".join(l.split("#", 1)[0] for l in text.splitlines()).split()
+    i = 0
+    while i < len(words):
+        mod, type, id = words[i : i + 3]
+        i += 3
+        if type == "alias" and not words[i].isdigit():  # short form
+            yield mod, type, id, [words[i]], [], []
+            i += 1
+            continue
+        args = []
+        for _ in range(3):
+            n = int(words[i])
+            args.append(words[i + 1 : i + 1 + n])
+            i += 1 + n
+        yield (mod, type, id, *args)
+
+
+def format_primitive(mod, type, id, strings, integers, reals):
+    if type == "alias" and not integers and not reals:
+        return f"{mod} alias {id} {strings[0]}\n"
+    return "\n".join([
+        f"{mod} {type} {id}",
+        " ".join([str(len(strings)), *strings]),
+        " ".join([str(len(integers)), *integers]),
+        " ".join([str(len(reals)), *reals]),
+    ]) + "\n"
+
+
+def without_sky(text, sky_modifiers=("skyfunc",)):
+    """Description with the primitives modified by the sky taken out
+
+    Patterns of the sky are dropped and the illums they modify become
+    their alternate material (or clear glass without one).
+    """
+    derived = set(sky_modifiers)
+    out = []
+    for mod, type, id, strings, integers, reals in primitives(text):
+        if mod not in derived:
+            out.append(format_primitive(mod, type, id, strings, integers, reals))
+        elif type == "illum" and strings:
+            out.append(f"void alias {id} {strings[0]}\n")
+        elif type == "illum":
+            out.append(format_primitive("void", "glass", id, [], [], ["1", "1", "1"]))
+        else:
+            derived.add(id)
+    return "\n".join(out)
+
+
+def coefficient_scene(rif, directory=DAYLIGHT_DIR):
+    """Writes the scene with the sky of unit brightness, returns its files"""
+    geometry, _, dependent = split_scene(rif)
+    files = {"geometry.rad": "\n".join(geometry), "sky.rad": DC_SKY}
+    text = []
+    for line in dependent:
+        if line.startswith("!"):
+            line = subprocess.run(
+                line[1:], shell=True, cwd=rif.cwd, capture_output=True, text=True,
+                check=True,
+            ).stdout
+        text.append(line)
+    files["dependent.rad"] = without_sky("\n".join(text))
+    os.makedirs(rif.path(directory), exist_ok=True)
+    for name, content in files.items():
+        with open(rif.path(os.path.join(directory, name)), "w") as f:
+            f.write(content)
+    return [os.path.join(directory, name) for name in files]
+
+
+def sphere_directions(n):
+    """n directions evenly spread over the sphere (Fibonacci lattice)"""
+    i = np.arange(n) + 0.5
+    z = 1 - 2 * i / n
+    r = np.sqrt(1 - z * z)
+    phi = np.pi * (1 + 5**0.5) * i
+    return np.stack([r * np.cos(phi), r * np.sin(phi), z], axis=-1)
+
+
+class Patches:
+    """Sky patches of reinhart.cal, as rcontrib numbers them
+
+    The patch of each sampled direction is computed once with rcalc and
+    kept, so the sky vectors agree with rcontrib's bins by construction.
+    """
+
+    def __init__(self, mf=MF, directory=DAYLIGHT_DIR, cwd="."):
+        self.mf = mf
+        self.dirs = sphere_directions(SAMPLES)
+        cache = os.path.join(cwd, directory, f"patches_MF{mf}.npy")
+        if os.path.isfile(cache):
+            self.bins = np.load(cache)
+        else:
+            out = subprocess.run(
+                ["rcalc", "-f", "reinhart.cal", "-e", f"MF:{mf}",
+                 "-e", "Dx=$1;Dy=$2;Dz=$3", "-e", "$1=rbin"],
+                input="\n".join(f"{x} {y} {z}" for x, y, z in self.dirs),
+                capture_output=True, text=True, check=True,
+            ).stdout
+            self.bins = np.array(out.split(), dtype=np.int32)
+            os.makedirs(os.path.dirname(cache), exist_ok=True)
+            np.save(cache, self.bins)
+        self.count = self.bins.max() + 1
+        samples = np.bincount(self.bins, minlength=self.count)
+        self.solid_angle = samples * (4 * np.pi / SAMPLES)
+        self.mean = np.zeros((SAMPLES, self.count), dtype=np.float32)
+        self.mean[np.arange(SAMPLES), self.bins] = 1.0 / samples[self.bins]
+        self.color = np.tile(np.array(SKY_COLOR, dtype=np.float32), (self.count, 1))
+        self.color[0] = GROUND_COLOR  # bin 0 is everything below the horizon
+
+    def sky_vectors(self, values):
+        """Mean radiance of each patch for each sky, (skies, patches, 3)"""
+        radiance = skybright(values, self.dirs).astype(np.float32) @ self.mean
+        vectors = radiance[:, :, None] * self.color
+        solar = np.atleast_1d(values["solar"])
+        sundir = np.atleast_2d(values["sundir"])
+        for k in np.flatnonzero(solar > 0):  # the sun goes in its patch
+            b = self.bins[np.argmax(self.dirs @ sundir[k])]
+            vectors[k, b] += solar[k] * SUN_SOLID_ANGLE / self.solid_angle[b]
+        return vectors
+
+
+def rcontrib_command(octree, options, patches, irradiance=False):
+    command = ["rcontrib", "-h", "-ff", "-c", "1", "-e", f"MF:{patches.mf}",
+               "-f", "reinhart.cal", "-b", "rbin", "-bn", "Nrbins", "-m", "sky_glow"]
+    command += options + (["-I+"] if irradiance else []) + [octree]
+    return command
+
+
+def compute(command, rays, npoints, nbins, filename, cwd=".", input=None):
+    """Runs rcontrib and streams its output into a float32 .npy file
+
+    rays is the command writing the rays (vwrays), or None to send input.
+    """
+    tmp = os.path.join(cwd, f"{filename}.tmp")
+    out = np.lib.format.open_memmap(tmp, "w+", np.float32, (npoints, nbins, 3))
+    source = None
+    if rays is not None:
+        source = subprocess.Popen(rays, cwd=cwd, stdout=subprocess.PIPE)
+    process = subprocess.Popen(
+        command, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        stdin=source.stdout if source else subprocess.PIPE,
+    )
+    if source is not None:
+        source.stdout.close()  # rcontrib owns it now
+    else:
+        write_input(process.stdin, input)
+    view = memoryview(out.reshape(-1)).cast("B")
+    pos = 0
+    while pos < len(view):
+        n = process.stdout.readinto(view[pos : pos + READ_SIZE])
+        if not n:
+            break
+        pos += n
+    err = process.stderr.read()
+    if process.wait() != 0 or pos != len(view):
+        os.remove(tmp)
+        raise Exception(f"{' '.join(command)}: {err.decode(errors='replace').strip()}")
+    out.flush()
+    del out
+    os.replace(tmp, os.path.join(cwd, filename))
+    return filename
+
+
+def write_input(stream, data):
+    """Writes data to a pipe from a thread, so reading does not block"""
+
+    def write():
+        try:
+            stream.write(data)
+            stream.close()
+        except BrokenPipeError:
+            pass  # the error is reported from the exit status
+
+    threading.Thread(target=write, daemon=True).start()
+
+
+def relight(coefficients, vectors, out=None, chunk=CHUNK):
+    """Values (skies, points, 3) of the coefficients under the sky vectors"""
+    npoints = coefficients.shape[0]
+    if out is None:
+        out = np.empty((len(vectors), npoints, 3), dtype=np.float32)
+    for start in range(0, npoints, chunk):
+        c = np.asarray(coefficients[start : start + chunk])
+        for channel in range(3):
+            out[:, start : start + len(c), channel] = (
+                vectors[:, :, channel] @ c[:, :, channel].T
+            )
+    return out
+
+
+def strip_option(options, name):
+    """Options without an option of one value"""
+    out, i = [], 0
+    while i < len(options):
+        if options[i] == name:
+            i += 2
+        else:
+            out.append(options[i])
+            i += 1
+    return out
+
+
+class Daylight:
+    """Daylight coefficients of the views of a rif file"""
+
+    def __init__(self, rif, directory=DAYLIGHT_DIR, mf=MF):
+        self.rif = rif
+        self.directory = directory
+        self.patches = Patches(mf, directory, rif.cwd)
+        files = coefficient_scene(rif, directory)
+        self.octree = OctreeCache(cwd=rif.cwd).get(files, lights=[])
+        # the rtrace options of the renders; rcontrib cannot use an ambient cache
+        self.options = strip_option(rtrace_options(rif.render_options()), "-aa")
+        self.options += ["-aa", "0"]
+
+    def key(self, *parts):
+        h = new_hash()
+        for p in (os.path.basename(self.octree), *self.options, *parts):
+            h.update(str(p).encode())
+        return h.hexdigest()
+
+    def view_coefficients(self, view):
+        """Coefficients of a view, (height * width, patches, 3), and its size"""
+        x, y = resolution(view, *self.rif.resolution)
+        rays = ["vwrays", "-ff", "-x", str(x), "-y", str(y), "-pa", "0", *view_options(view)]
+        filename = os.path.join(self.directory, f"{self.key(*rays)}.npy")
+        if not os.path.isfile(self.rif.path(filename)):
+            command = rcontrib_command(self.octree, self.options, self.patches)
+            compute(command, rays, x * y, self.patches.count, filename, self.rif.cwd)
+        return np.load(self.rif.path(filename), mmap_mode="r"), (x, y)
+
+    def sensor_coefficients(self, points):
+        """Coefficients of sensors, points (n, 6) of positions and normals"""
+        points = np.ascontiguousarray(points, dtype=np.float32)
+        filename = os.path.join(self.directory, f"{self.key(points.tobytes())}.npy")
+        if not os.path.isfile(self.rif.path(filename)):
+            command = rcontrib_command(self.octree, self.options, self.patches, True)
+            compute(command, None, len(points), self.patches.count, filename,
+                    self.rif.cwd, points.tobytes())
+        return np.load(self.rif.path(filename), mmap_mode="r")
+
+    def sky_vectors(self, times):
+        """Sky vectors of the rif's sky moved to each datetime"""
+        _, template, _ = split_scene(self.rif)
+        for line in template:
+            words = line.split()
+            if words[:1] == ["!gensky"] or words[:2] == ["#", "gensky"]:
+                args = parse_gensky(gensky_at(words[1 if words[0] == "!gensky" else 2 :], times[0]))
+                break
+        else:
+            raise Exception(f"{self.rif.filename} has no gensky sky")
+        _, solar, zone = parse_time(args["time"])
+        meridian = args["meridian"] if args["meridian"] is not None else zone
+        _, altitude, azimuth = sun_position(
+            np.array([t.month for t in times]), np.array([t.day for t in times]),
+            np.array([t.hour + t.minute / 60 for t in times]),
+            args["latitude"], args["longitude"], meridian, solar,
+            np.array([t.year for t in times]) if args["year"] else None,
+        )
+        return self.patches.sky_vectors(sky_values(args["sky_type"], altitude, azimuth))
+
+    def render(self, times, names):
+        """Writes a picture per view and time, names[i] is the stamp of times[i]"""
+        vectors = self.sky_vectors(times)
+        written = []
+        for name, options in self.rif.views:
+            view = parse_view(shlex.split(options), self.rif.cwd)
+            coefficients, (x, y) = self.view_coefficients(view)
+            lines = [f"VIEW= {' '.join(view_options(view))}"]
+            exposure = float(self.rif.get("EXPOSURE", "1").split()[0])
+            if exposure != 1:  # as pfilt does for rad
+                lines.append(f"EXPOSURE={exposure:g}")
+            header = Header(lines)
+            for start in range(0, len(times), SKY_BATCH):
+                batch = relight(coefficients, vectors[start : start + SKY_BATCH])
+                for stamp, rgb in zip(names[start : start + SKY_BATCH], batch):
+                    picture = os.path.join(self.directory, f"{name}_{stamp}.hdr")
+                    rgb = rgb.reshape(y, x, 3) * exposure
+                    write_hdr(self.rif.path(picture), rgb, header)
+                    written.append(picture)
+        return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rif")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--step", type=int, default=60, help="minutes")
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("-d", "--directory", default=DAYLIGHT_DIR)
+    parser.add_argument("--mf", type=int, default=MF, help="Reinhart subdivision")
+    args = parser.parse_args(argv)
+    rif = Rif(os.path.join(args.cwd, args.rif), args.cwd)
+    times = time_steps(args.start, args.end, args.step)
+    names = [f"{t:%m%d_%H%M}" for t in times]
+    for picture in Daylight(rif, args.directory, args.mf).render(times, names):
+        print(picture)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""False colour illuminance and luminance maps computed with NumPy
+
+Works like the Radiance falsecolor program on the arrays read by hdr.py and
+writes PNG files, so a whole tree of renders can be mapped in a process pool
+without running one program per picture.
+
+    python falsecolor.py -s 500 -l Lux radiance/scenes
+"""
+
+import argparse
+import os
+import struct
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from hdr import read_hdr
+
+WHITE_EFFICACY = 179.0  # lm/W, as used by Radiance
+
+PALETTES = {
+    "def": [
+        (0.00, (0.10, 0.00, 0.30)),
+        (0.16, (0.00, 0.00, 1.00)),
+        (0.33, (0.00, 0.80, 1.00)),
+        (0.50, (0.00, 0.90, 0.20)),
+        (0.66, (1.00, 1.00, 0.00)),
+        (0.83, (1.00, 0.40, 0.00)),
+        (1.00, (1.00, 0.00, 0.60)),
+    ],
+    "spec": [
+        (0.00, (0.50, 0.00, 1.00)),
+        (0.25, (0.00, 0.00, 1.00)),
+        (0.50, (0.00, 1.00, 0.00)),
+        (0.75, (1.00, 1.00, 0.00)),
+        (1.00, (1.00, 0.00, 0.00)),
+    ],
+    "hot": [
+        (0.00, (0.00, 0.00, 0.00)),
+        (0.40, (1.00, 0.00, 0.00)),
+        (0.80, (1.00, 1.00, 0.00)),
+        (1.00, (1.00, 1.00, 1.00)),
+    ],
+    "gray": [(0.00, (0.00, 0.00, 0.00)), (1.00, (1.00, 1.00, 1.00))],
+}
+
+# 5x7 bitmap font for the legend
+FONT = {
+    "0": ["01110", "10001", "10011", "10101", "11001", "10001", "01110"],
+    "1": ["00100", "01100", "00100", "00100", "00100", "00100", "01110"],
+    "2": ["01110", "10001", "00001", "00110", "01000", "10000", "11111"],
+    "3": ["11110", "00001", "00001", "01110", "00001", "00001", "11110"],
+    "4": ["00010", "00110", "01010", "10010", "11111", "00010", "00010"],
+    "5": ["11111", "10000", "11110", "00001", "00001", "10001", "01110"],
+    "6": ["00110", "01000", "10000", "11110", "10001", "10001", "01110"],
+    "7": ["11111", "00001", "00010", "00100", "01000", "01000", "01000"],
+    "8": ["01110", "10001", "10001", "01110", "10001", "10001", "01110"],
+    "9": ["01110", "10001", "10001", "01111", "00001", "00010", "01100"],
+    ".": ["00000", "00000", "00000", "00000", "00000", "01100", "01100"],
+    "-": ["00000", "00000", "00000", "11111", "00000", "00000", "00000"],
+    "+": ["00000", "00100", "00100", "11111", "00100", "00100", "00000"],
+    "/": ["00001", "00010", "00010", "00100", "01000", "01000", "10000"],
+    "e": ["00000", "00000", "01110", "10001", "11111", "10000", "01110"],
+    "L": ["10000", "10000", "10000", "10000", "10000", "10000", "11111"],
+    "N": ["10001", "11001", "10101", "10011", "10001", "10001", "10001"],
+    "W": ["10001", "10001", "10001", "10101", "10101", "11011", "10001"],
+    "c": ["00000", "00000", "01110", "10000", "10000", "10001", "01110"],
+    "d": ["00001", "00001", "01101", "10011", "10001", "10011", "01101"],
+    "i": ["00100", "00000", "01100", "00100", "00100", "00100", "01110"],
+    "m": ["00000", "00000", "11010", "10101", "10101", "10101", "10101"],
+    "r": ["00000", "00000", "10110", "11001", "10000", "10000", "10000"],
+    "s": ["00000", "00000", "01111", "10000", "01110", "00001", "11110"],
+    "t": ["01000", "01000", "11100", "01000", "01000", "01001", "00110"],
+    "u": ["00000", "00000", "10001", "10001", "10001", "10011", "01101"],
+    "x": ["00000", "00000", "10001", "01010", "00100", "01010", "10001"],
+    " ": ["00000"] * 7,
+}
+GLYPHS = {
+    c: np.array([[b == "1" for b in row] for row in rows]) for c, rows in FONT.items()
+}
+
+
+def illuminance(rgb):
+    """Illuminance (lux) of an irradiance picture, or luminance of a radiance one"""
+    return WHITE_EFFICACY * (
+        0.265 * rgb[..., 0] + 0.670 * rgb[..., 1] + 0.065 * rgb[..., 2]
+    )
+
+
+def normalize(values, scale=1000.0, log=0):
+    """Maps the values to [0, 1], linearly or over log decades"""
+    if log:
+        with np.errstate(divide="ignore"):
+            v = 1.0 + np.log10(np.maximum(values, 1e-30) / scale) / log
+    else:
+        v = values / scale
+    return np.clip(v, 0.0, 1.0)
+
+
+def colormap(v, palette="def"):
+    """Colours of normalized values as float RGB"""
+    points = PALETTES[palette]
+    x = np.array([p[0] for p in points])
+    rgb = np.array([p[1] for p in points])
+    return np.stack([np.interp(v, x, rgb[:, c]) for c in range(3)], axis=-1)
+
+
+def contour_lines(levels, width=1):
+    """Pixels where the division level changes between neighbours"""
+    edge = np.zeros(levels.shape, dtype=bool)
+    edge[:-1] |= levels[:-1] != levels[1:]
+    edge[:, :-1] |= levels[:, :-1] != levels[:, 1:]
+    for _ in range(width - 1):  # widen the lines into bands
+        grown = edge.copy()
+        grown[1:] |= edge[:-1]
+        grown[:-1] |= edge[1:]
+        grown[:, 1:] |= edge[:, :-1]
+        grown[:, :-1] |= edge[:, 1:]
+        edge = grown
+    return edge
+
+
+def falsecolor(values, scale=1000.0, ndivs=8, log=0, palette="def",
+               contour=None, background=None):
+    """False colour float RGB image of the values
+
+    contour is None (continuous colours), "posterize", "lines" or "bands";
+    lines and bands are drawn over the grey background picture if given.
+    """
+    v = normalize(values, scale, log)
+    levels = np.minimum((v * ndivs).astype(np.int32), ndivs - 1)
+    if contour is None:
+        return colormap(v, palette)
+    if contour == "posterize":
+        return colormap((levels + 0.5) / ndivs, palette)
+    if background is None:
+        out = np.zeros(values.shape + (3,))
+    else:
+        grey = normalize(background, np.percentile(background, 99) or 1.0)
+        out = np.repeat(grey[..., None] ** (1 / 2.2), 3, axis=-1)
+    edge = contour_lines(levels, 1 if contour == "lines" else 3)
+    out[edge] = colormap((levels[edge] + 0.5) / ndivs, palette)
+    return out
+
+
+def draw_text(img, text, x, y, color=(1.0, 1.0, 1.0), size=2):
+    """Draws text with the bitmap font, (x, y) is the top left corner"""
+    for c in text:
+        glyph = GLYPHS.get(c, GLYPHS[" "])
+        glyph = glyph.repeat(size, axis=0).repeat(size, axis=1)
+        h, w = glyph.shape
+        region = img[y : y + h, x : x + w]
+        region[glyph[: region.shape[0], : region.shape[1]]] = color
+        x += w + size
+
+
+def legend(height, scale=1000.0, ndivs=8, log=0, palette="def", label="Lux",
+           width=100):
+    """Legend bar with one labelled box per division, top is the maximum"""
+    img = np.zeros((height, width, 3))
+    draw_text(img, label, 4, 4)
+    top = 24
+    box = (height - top) / ndivs
+    for i in range(ndivs):
+        level = ndivs - 1 - i
+        y0, y1 = int(top + i * box), int(top + (i + 1) * box)
+        img[y0:y1, :] = colormap((level + 0.5) / ndivs, palette)
+        if log:
+            value = scale * 10 ** (log * ((level + 0.5) / ndivs - 1))
+        else:
+            value = scale * (level + 0.5) / ndivs
+        text = f"{value:.3g}"
+        draw_text(img, text, 4, (y0 + y1) // 2 - 7, (0.0, 0.0, 0.0))
+    return img
+
+
+def write_png(filename, rgb):
+    """Writes a float RGB image in [0, 1] as an 8 bit PNG"""
+    data = (np.clip(rgb, 0, 1) * 255 + 0.5).astype(np.uint8)
+    height, width = data.shape[:2]
+    raw = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 0] = 0  # no filter
+    raw[:, 1:] = data.reshape(height, -1)
+
+    def chunk(tag, body):
+        return (
+            struct.pack(">I", len(body))
+            + tag
+            + body
+            + struct.pack(">I", zlib.crc32(tag + body) & 0xFFFFFFFF)
+        )
+
+    with open(filename, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def falsecolor_picture(infile, outfile, scale=1000.0, ndivs=8, log=0,
+                       palette="def", contour=None, label="Lux",
+                       background=None):
+    """Maps an HDR picture to a false colour PNG with its legend
+
+    The EXPOSURE of the pictures is undone, as falsecolor does.
+    """
+    rgb, header = read_hdr(infile)
+    values = illuminance(rgb) / header.exposure
+    if background is None:
+        background = values
+    else:
+        rgb, header = read_hdr(background)
+        background = illuminance(rgb) / header.exposure
+    img = falsecolor(values, scale, ndivs, log, palette, contour, background)
+    img = np.concatenate(
+        [legend(img.shape[0], scale, ndivs, log, palette, label), img], axis=1
+    )
+    write_png(outfile, img)
+    return outfile
+
+
+def find_pictures(paths):
+    """The .hdr files given, and those in the img folders of the directories"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in sorted(os.walk(path)):
+                if os.path.basename(root) == "img":
+                    for name in sorted(files):
+                        if name.endswith(".hdr"):
+                            yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def output_name(infile, prefix="falseC_"):
+    """falseC_<picture>.png next to the picture"""
+    head, tail = os.path.split(infile)
+    return os.path.join(head, prefix + os.path.splitext(tail)[0] + ".png")
+
+
+def _map_one(job):
+    infile, kwargs = job
+    return falsecolor_picture(infile, output_name(infile), **kwargs)
+
+
+def batch(paths, workers=None, **kwargs):
+    """Maps every picture found in paths across a process pool"""
+    jobs = [(p, kwargs) for p in find_pictures(paths)]
+    if len(jobs) <= 1 or workers == 1:
+        return [_map_one(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_map_one, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="pictures or scene folders")
+    parser.add_argument("-s", "--scale", type=float, default=1000.0)
+    parser.add_argument("-n", "--ndivs", type=int, default=8)
+    parser.add_argument("--log", type=float, default=0, help="decades")
+    parser.add_argument("-l", "--label", default="Lux")
+    parser.add_argument("-p", "--palette", choices=sorted(PALETTES), default="def")
+    parser.add_argument(
+        "-c", "--contour", choices=["posterize", "lines", "bands"], default=None
+    )
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    for out in batch(
+        args.paths,
+        args.workers,
+        scale=args.scale,
+        ndivs=args.ndivs,
+        log=args.log,
+        palette=args.palette,
+        contour=args.contour,
+        label=args.label,
+    ):
+        print(out)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
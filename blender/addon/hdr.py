@@ -0,0 +1,285 @@
+"""Radiance HDR (RGBE) pictures as NumPy arrays
+
+Pictures are read into float32 arrays of shape (height, width, 3), top row
+first. New-style run length encoded scanlines are decoded by scanning the
+run headers once and expanding all of them with a single NumPy gather;
+flat (uncompressed) files are memory mapped.
+"""
+
+import re
+
+import numpy as np
+
+BUFFER_SIZE = 1 << 20
+MINRUN = 4  # shortest run worth encoding, as in Radiance
+MINELEN = 8  # scanline widths outside [MINELEN, MAXELEN] are never encoded
+MAXELEN = 0x7FFF
+
+RESOLUTION = re.compile(rb"([-+])([XY])\s+(\d+)\s+([-+])([XY])\s+(\d+)")
+
+
+def rgbe_encode(rgb):
+    """Encodes float RGB values (..., 3) into RGBE bytes (..., 4)"""
+    rgb = np.asarray(rgb, dtype=np.float32)
+    v = rgb.max(axis=-1)
+    mantissa, exponent = np.frexp(v)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale = np.where(v > 1e-32, mantissa * 255.9999 / v, 0.0)
+    rgbe = np.empty(rgb.shape[:-1] + (4,), dtype=np.uint8)
+    rgbe[..., :3] = np.clip(rgb * scale[..., None], 0, 255)
+    rgbe[..., 3] = np.where(v > 1e-32, exponent + 128, 0)
+    return rgbe
+
+
+def rgbe_decode(rgbe):
+    """Decodes RGBE bytes (..., 4) into float32 RGB values (..., 3)"""
+    rgbe = np.asarray(rgbe, dtype=np.uint8)
+    e = rgbe[..., 3].astype(np.int32)
+    f = np.where(e > 0, np.ldexp(1.0, e - 136), 0.0).astype(np.float32)
+    return (rgbe[..., :3].astype(np.float32) + np.float32(0.5)) * f[..., None]
+
+
+def _old_runs(rgbe):
+    """Checks for the (1, 1, 1, n) run markers of old-style run length encoding"""
+    return bool(np.any((rgbe[..., 0] == 1) & (rgbe[..., 1] == 1) & (rgbe[..., 2] == 1)))
+
+
+class Header:
+    """Information lines of a Radiance picture"""
+
+    def __init__(self, lines=(), resolution=None):
+        self.lines = list(lines)
+        self.resolution = resolution
+
+    @property
+    def view(self):
+        """View options, VIEW lines accumulate"""
+        return " ".join(
+            l[5:].strip() for l in self.lines if l.startswith("VIEW=")
+        )
+
+    @property
+    def exposure(self):
+        """Product of the EXPOSURE lines"""
+        e = 1.0
+        for l in self.lines:
+            if l.startswith("EXPOSURE="):
+                e *= float(l[9:])
+        return e
+
+    @property
+    def format(self):
+        for l in self.lines:
+            if l.startswith("FORMAT="):
+                return l[7:].strip()
+        return "32-bit_rle_rgbe"
+
+
+def read_header(f):
+    """Reads the header of an open picture, returns (Header, width, height)"""
+    magic = f.readline()
+    if not magic.startswith(b"#?"):
+        raise Exception(f"{f.name} is not a Radiance picture")
+    lines = []
+    for line in iter(f.readline, b""):
+        if line in (b"\n", b"\r\n"):
+            break
+        lines.append(line.decode("latin-1").rstrip("\r\n"))
+    res = f.readline()
+    m = RESOLUTION.match(res)
+    if m is None:
+        raise Exception(f"{f.name} has a bad resolution string")
+    header = Header(lines, " ".join(res.decode().split()))
+    if header.format != "32-bit_rle_rgbe":
+        raise Exception(f"{f.name} has unsupported format {header.format}")
+    sizes = {m.group(2): int(m.group(3)), m.group(5): int(m.group(6))}
+    return header, sizes[b"X"], sizes[b"Y"]
+
+
+def _orient(a, resolution):
+    """Puts an array in file order into top row first, left to right"""
+    t = resolution.split()
+    if t[0][1] == "X":  # x is the slow axis
+        a = a.swapaxes(0, 1)
+        sy, sx = t[2][0], t[0][0]
+    else:
+        sy, sx = t[0][0], t[2][0]
+    if sy == "+":
+        a = a[::-1]
+    if sx == "-":
+        a = a[:, ::-1]
+    return a
+
+
+def _scan_runs(buf, offset, nlines, width):
+    """Serial pass over the scanlines collecting where each byte run comes from
+
+    Returns (starts, lengths, strides) arrays describing the runs in output
+    order, scanline by scanline and channel by channel. A stride of 1 is a
+    literal run, 0 a repeated byte and 4 a channel of a flat scanline.
+    Scanlines with old-style runs are rejected.
+    """
+    try:
+        return _scan(buf, offset, nlines, width)
+    except IndexError:
+        raise Exception("picture is truncated") from None
+
+
+def _scan(buf, offset, nlines, width):
+    starts, lengths, strides = [], [], []
+    p = offset
+    for _ in range(nlines):
+        if (
+            MINELEN <= width <= MAXELEN
+            and buf[p] == 2
+            and buf[p + 1] == 2
+            and not buf[p + 2] & 0x80
+        ):
+            if (buf[p + 2] << 8 | buf[p + 3]) != width:
+                raise Exception("scanline length mismatch")
+            p += 4
+            for _ in range(4):
+                n = 0
+                while n < width:
+                    c = buf[p]
+                    if c > 128:
+                        starts.append(p + 1)
+                        lengths.append(c - 128)
+                        strides.append(0)
+                        n += c - 128
+                        p += 2
+                    elif c > 0:
+                        starts.append(p + 1)
+                        lengths.append(c)
+                        strides.append(1)
+                        n += c
+                        p += 1 + c
+                    else:
+                        raise Exception("bad run length in scanline")
+                if n != width:
+                    raise Exception("overrun in scanline")
+        else:  # flat scanline
+            n = min(width, (len(buf) - p) // 4)
+            if _old_runs(np.frombuffer(buf, np.uint8, 4 * n, p).reshape(-1, 4)):
+                raise Exception("old-style run length encoding is not supported")
+            if n < width:
+                raise IndexError(p + 4 * width)
+            for c in range(4):
+                starts.append(p + c)
+                lengths.append(width)
+                strides.append(4)
+            p += 4 * width
+    if p > len(buf):
+        raise Exception("picture is truncated")
+    return np.array(starts), np.array(lengths), np.array(strides)
+
+
+def _expand(buf, nlines, width, starts, lengths, strides):
+    """Gathers all the runs at once into an (nlines, width, 4) RGBE array"""
+    run = np.repeat(np.arange(len(starts)), lengths)
+    first = np.cumsum(lengths) - lengths
+    step = np.arange(len(run)) - first[run]
+    src = starts[run] + step * strides[run]
+    data = np.frombuffer(buf, dtype=np.uint8)[src]
+    return data.reshape(nlines, 4, width).transpose(0, 2, 1)
+
+
+def read_rgbe(filename, mmap=True):
+    """Reads the raw RGBE bytes of a picture, returns (rgbe, Header)
+
+    Flat files are returned as a read-only memory map.
+    """
+    with open(filename, "rb") as f:
+        header, width, height = read_header(f)
+        offset = f.tell()
+        t = header.resolution.split()
+        nlines, linelen = int(t[1]), int(t[3])
+        if mmap:
+            first = f.read(4)
+            f.seek(0, 2)
+            flat = f.tell() - offset == nlines * linelen * 4
+            if flat and not (
+                MINELEN <= linelen <= MAXELEN and first[:2] == b"\x02\x02"
+            ):
+                rgbe = np.memmap(
+                    filename,
+                    dtype=np.uint8,
+                    mode="r",
+                    offset=offset,
+                    shape=(nlines, linelen, 4),
+                )
+                if _old_runs(rgbe):
+                    raise Exception(f"{filename} has old-style run length encoding")
+                return _orient(rgbe, header.resolution), header
+        f.seek(0)
+        buf = f.read()
+    runs = _scan_runs(buf, offset, nlines, linelen)
+    rgbe = _expand(buf, nlines, linelen, *runs)
+    return _orient(rgbe, header.resolution), header
+
+
+def read_hdr(filename, mmap=True):
+    """Reads a picture as float32 RGB values, returns (rgb, Header)"""
+    rgbe, header = read_rgbe(filename, mmap)
+    return rgbe_decode(rgbe), header
+
+
+def _encode_channel(out, a):
+    """Appends the run length encoding of one scanline channel to out"""
+    width = len(a)
+    change = np.flatnonzero(a[1:] != a[:-1]) + 1
+    starts = np.r_[0, change]
+    lengths = np.diff(np.r_[starts, width])
+    long = lengths >= MINRUN
+    p = 0
+    for start, length in zip(starts[long].tolist(), lengths[long].tolist()):
+        while p < start:  # literal bytes before the run
+            n = min(128, start - p)
+            out.append(n)
+            out += a[p : p + n].tobytes()
+            p += n
+        value = int(a[start])
+        while length >= MINRUN:
+            n = min(127, length)
+            out += bytes((128 + n, value))
+            length -= n
+            p += n
+        # a leftover shorter than MINRUN joins the next literal
+    while p < width:
+        n = min(128, width - p)
+        out.append(n)
+        out += a[p : p + n].tobytes()
+        p += n
+
+
+def write_hdr(filename, rgb, header=None, rle=True):
+    """Writes a float RGB image (height, width, 3), top row first
+
+    The information lines of header (VIEW, EXPOSURE, ...) are kept.
+    """
+    height, width = rgb.shape[:2]
+    rgbe = rgbe_encode(rgb)
+    lines = [l for l in (header.lines if header else []) if not l.startswith("FORMAT=")]
+    with open(filename, "wb", buffering=BUFFER_SIZE) as f:
+        f.write(b"#?RADIANCE\n")
+        for l in lines:
+            f.write(f"{l}\n".encode("latin-1"))
+        f.write(b"FORMAT=32-bit_rle_rgbe\n\n")
+        f.write(f"-Y {height} +X {width}\n".encode())
+        if not rle or not MINELEN <= width <= MAXELEN:
+            f.write(rgbe.tobytes())
+            return
+        prefix = bytes((2, 2, width >> 8, width & 0xFF))
+        for row in rgbe:
+            out = bytearray(prefix)
+            for c in range(4):
+                _encode_channel(out, np.ascontiguousarray(row[:, c]))
+            f.write(out)
+
+
+def expose(filename, exposure):
+    """Scales a picture in place by an exposure, recording it like pfilt"""
+    if exposure == 1:
+        return
+    rgb, header = read_hdr(filename, mmap=False)
+    write_hdr(filename, rgb * exposure, Header([*header.lines, f"EXPOSURE={exposure:g}"]))
@@ -0,0 +1,145 @@
+"""Radiance jobs run in the background, with their progress
+
+A job is a list of commands run one after the other (rad, then falsecolor
+for instance) in a process group of its own, so cancelling it stops every
+program rad started. Jobs wait in a queue and are started and followed by
+polling, which lets the Blender operators track them from a modal timer
+without blocking the interface. The progress and the time left come from
+the REPORT lines rpict writes on its error output.
+"""
+
+import os
+import re
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from tracing import TRACER
+
+# rpict: 1234 rays, 12.34% after 0.001u 0.000s 0.010r hours on host (PID 42)
+PROGRESS = re.compile(r"([\d.]+)% after .*?([\d.]+)r hours")
+MAX_RUNNING = 1  # each render already uses the cores it needs
+
+
+class Job:
+    """Commands run in sequence in the background"""
+
+    def __init__(self, name, commands, cwd=None, picture=None):
+        self.name = name
+        self.commands = [list(c) for c in commands]
+        self.cwd = cwd
+        self.picture = picture  # file to show once done
+        self.state = "queued"
+        self.progress = 0.0
+        self.eta = None
+        self.lines = deque(maxlen=20)  # last lines of error output
+        self.process = None
+        self.reader = None
+        self.begun = None  # what the trace records of the running command
+        self.step = 0
+        self.started = None
+
+    def start(self):
+        self.state = "running"
+        self.started = time.time()
+        self.spawn()
+
+    def spawn(self):
+        self.begun = TRACER.begin(self.commands[self.step], self.cwd)
+        self.process = subprocess.Popen(
+            self.commands[self.step],
+            cwd=self.cwd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+        self.reader = threading.Thread(target=self.read, args=(self.process.stderr,))
+        self.reader.daemon = True
+        self.reader.start()
+
+    def read(self, stream):
+        for line in stream:
+            m = PROGRESS.search(line)
+            if m is None:
+                self.lines.append(line.rstrip())
+                continue
+            progress, hours = float(m.group(1)), float(m.group(2))
+            self.progress = progress
+            if progress > 0:
+                self.eta = hours * 3600 * (100 - progress) / progress
+
+    def poll(self):
+        """Updates the state of a running job, returns it"""
+        if self.state != "running" or TRACER.poll(self.process, self.begun) is None:
+            return self.state
+        self.reader.join()
+        if self.process.returncode != 0:
+            self.state = "failed"
+        elif self.step + 1 < len(self.commands):
+            self.step += 1
+            self.spawn()
+        else:
+            self.progress, self.eta = 100.0, 0
+            self.state = "done"
+        return self.state
+
+    def cancel(self):
+        if self.state == "running":
+            try:
+                os.killpg(self.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if self.state in ("queued", "running"):
+            self.state = "cancelled"
+
+    @property
+    def finished(self):
+        return self.state in ("done", "failed", "cancelled")
+
+    def error(self):
+        command = " ".join(self.commands[self.step])
+        return f"{command}: {' '.join(self.lines) or 'exit status %d' % self.process.returncode}"
+
+    def status(self, width=20):
+        """One line status with a progress bar and the time left"""
+        if self.state == "queued":
+            return f"{self.name}: queued"
+        done = int(width * self.progress / 100)
+        text = f"{self.name} [{'#' * done}{'.' * (width - done)}] {self.progress:.0f}%"
+        if self.eta is not None and self.state == "running":
+            m, s = divmod(int(self.eta), 60)
+            text += f" {m // 60}:{m % 60:02d}:{s:02d} left"
+        return text
+
+
+class JobQueue:
+    """Jobs started in order, at most max_running at once"""
+
+    def __init__(self, max_running=MAX_RUNNING):
+        self.max_running = max_running
+        self.jobs = []
+
+    def submit(self, job):
+        self.jobs.append(job)
+        self.update()
+        return job
+
+    def update(self):
+        """Polls the running jobs and starts the queued ones that fit"""
+        for job in self.jobs:
+            job.poll()
+        self.jobs = [job for job in self.jobs if not job.finished]
+        running = sum(job.state == "running" for job in self.jobs)
+        for job in self.jobs:
+            if running >= self.max_running:
+                break
+            if job.state == "queued":
+                job.start()
+                running += 1
+
+
+QUEUE = JobQueue()
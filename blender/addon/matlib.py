@@ -0,0 +1,82 @@
+"""Project-wide material library, each distinct definition written once
+
+Materials are keyed by a hash of their Radiance definition, written with
+a placeholder for their name, so the Blender materials that define the
+same thing share one entry named after the first of them. The library is
+written to a single .mat file, referenced materials (the alternate
+material of an illum or a mirror, the modifiers of an antimatter) before
+the ones using them, with an alias for every merged name that is referred
+to.
+"""
+
+import os
+
+from cache import new_hash
+from scenegraph import MODIFIER_ARGS, SceneGraph
+
+ID = "@ID@"  # stands for the material name in the keyed definitions
+
+
+class MaterialLibrary:
+    """Distinct material definitions and the name each material maps to"""
+
+    def __init__(self):
+        self.entries = {}  # key -> (name, definition with ID)
+        self.names = {}  # material name -> name of its entry
+
+    def add(self, name, definition):
+        """Adds a definition written with ID for the name, returns its entry name"""
+        h = new_hash()
+        h.update(definition.encode())
+        entry = self.entries.setdefault(h.hexdigest(), (name, definition))
+        self.names[name] = entry[0]
+        return entry[0]
+
+    def references(self, text):
+        """Names a definition refers to, as modifier or argument"""
+        graph = SceneGraph()
+        graph.parse(text, 0)
+        refs = []
+        for p in graph:
+            n = MODIFIER_ARGS.get(p.type, 0)
+            refs += [p.modifier, *(p.strings if n is None else p.strings[:n])]
+        return refs
+
+    def text(self):
+        """The library, each definition after the ones it refers to"""
+        texts = {name: d.replace(ID, name) for name, d in self.entries.values()}
+        aliases = {}
+        for name, canonical in self.names.items():
+            if name != canonical:
+                aliases[name] = f"void alias {name} {canonical}\n"
+        out, written = [], set()
+
+        def write(name, path=()):
+            if name in written or name in path:
+                return
+            if name in aliases:
+                write(self.names[name], path)
+                out.append(aliases[name])
+            elif name in texts:
+                for ref in self.references(texts[name]):
+                    write(ref, (*path, name))
+                out.append(texts[name])
+            written.add(name)
+
+        for name in texts:  # aliases only get written when referred to
+            write(name)
+        return "\n".join(out)
+
+    def write(self, filename):
+        """Writes the library, leaving the file alone when unchanged
+
+        Returns whether the file was written.
+        """
+        text = self.text()
+        if os.path.isfile(filename):
+            with open(filename) as f:
+                if f.read() == text:
+                    return False
+        with open(filename, "w") as f:
+            f.write(text)
+        return True
@@ -0,0 +1,137 @@
+"""Writes Blender meshes as the OBJ files obj2mesh reads
+
+The mesh buffers are read with foreach_get into NumPy arrays and the OBJ
+text is formatted a chunk of rows at a time, so no Python code runs per
+vertex or per triangle.
+"""
+
+import numpy as np
+
+BUFFER_SIZE = 1 << 20
+CHUNK_ROWS = 1 << 16
+
+# Y forward and Z up are already the Blender axes
+AXIS_MATRIX = np.identity(4)
+
+
+def _get(collection, attr, dtype, width=1):
+    a = np.empty(len(collection) * width, dtype=dtype)
+    collection.foreach_get(attr, a)
+    return a.reshape(-1, width) if width > 1 else a
+
+
+def mesh_arrays(mesh):
+    """Reads the vertices, normals, UVs and loop triangles of a mesh"""
+    mesh.calc_loop_triangles()
+    if hasattr(mesh, "calc_normals_split"):  # automatic since Blender 4.1
+        mesh.calc_normals_split()
+    uv = None
+    if mesh.uv_layers.active is not None:
+        uv = _get(mesh.uv_layers.active.data, "uv", np.float32, 2)
+    return {
+        "co": _get(mesh.vertices, "co", np.float32, 3),
+        "normal": _get(mesh.loops, "normal", np.float32, 3),
+        "uv": uv,
+        "tri_verts": _get(mesh.loop_triangles, "vertices", np.int32, 3),
+        "tri_loops": _get(mesh.loop_triangles, "loops", np.int32, 3),
+        "tri_mat": _get(mesh.loop_triangles, "material_index", np.int32),
+    }
+
+
+def _write_rows(f, fmt, rows):
+    for start in range(0, len(rows), CHUNK_ROWS):
+        chunk = rows[start : start + CHUNK_ROWS]
+        f.write((fmt * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def write_obj(filename, arrays, materials, matrix=None, triangles=None):
+    """Writes the mesh arrays as an OBJ grouped by usemtl
+
+    matrix is an optional 4x4 object transform, combined with the axis
+    conversion into a single matrix multiply. triangles optionally selects
+    the loop triangles to write.
+    """
+    m = AXIS_MATRIX if matrix is None else AXIS_MATRIX @ np.asarray(matrix)
+    tri_verts, tri_loops = arrays["tri_verts"], arrays["tri_loops"]
+    tri_mat = arrays["tri_mat"]
+    if triangles is not None:
+        tri_verts, tri_loops = tri_verts[triangles], tri_loops[triangles]
+        tri_mat = tri_mat[triangles]
+
+    # only the vertices and loops used by the triangles are written
+    verts, tri_verts = np.unique(tri_verts, return_inverse=True)
+    loops, tri_loops = np.unique(tri_loops, return_inverse=True)
+    tri_verts = tri_verts.reshape(-1, 3) + 1
+    tri_loops = tri_loops.reshape(-1, 3) + 1
+
+    co = arrays["co"][verts] @ m[:3, :3].T + m[:3, 3]
+    normal = arrays["normal"][loops] @ np.linalg.inv(m[:3, :3])
+    normal /= np.maximum(np.linalg.norm(normal, axis=1), 1e-12)[:, None]
+
+    if arrays["uv"] is not None:
+        face = np.stack([tri_verts, tri_loops, tri_loops], axis=2).reshape(-1, 9)
+        fmt_f = "f %d/%d/%d %d/%d/%d %d/%d/%d\n"
+    else:
+        face = np.stack([tri_verts, tri_loops], axis=2).reshape(-1, 6)
+        fmt_f = "f %d//%d %d//%d %d//%d\n"
+
+    # faces without a material go first, before any usemtl
+    named = np.array([bool(name) for name in materials] + [False])
+    tri_mat = np.where(named[np.clip(tri_mat, 0, len(materials))], tri_mat, -1)
+    order = np.argsort(tri_mat, kind="stable")
+    face, tri_mat = face[order], tri_mat[order]
+    groups = np.flatnonzero(np.diff(tri_mat)) + 1
+    bounds = zip(np.r_[0, groups], np.r_[groups, len(face)]) if len(face) else ()
+
+    with open(filename, "w", buffering=BUFFER_SIZE) as f:
+        _write_rows(f, "v %.6f %.6f %.6f\n", co)
+        if arrays["uv"] is not None:
+            _write_rows(f, "vt %.6f %.6f\n", arrays["uv"][loops])
+        _write_rows(f, "vn %.6f %.6f %.6f\n", normal)
+        for start, end in bounds:
+            if tri_mat[start] >= 0:
+                f.write(f"usemtl {materials[tri_mat[start]]}\n")
+            _write_rows(f, fmt_f, face[start:end])
+    return len(face)
+
+
+def spatial_chunks(arrays, size):
+    """Loop triangle indices of spatially coherent chunks of at most size triangles
+
+    The triangles are split in halves at the median of their centroids
+    along the longest side of their bounds, until the halves are small
+    enough.
+    """
+    centroids = arrays["co"][arrays["tri_verts"]].mean(axis=1)
+    chunks, stack = [], [np.arange(len(centroids))]
+    while stack:
+        tris = stack.pop()
+        if len(tris) <= size:
+            chunks.append(np.sort(tris))
+            continue
+        c = centroids[tris]
+        axis = np.argmax(c.max(axis=0) - c.min(axis=0))
+        half = len(tris) // 2
+        order = np.argpartition(c[:, axis], half)
+        stack += [tris[order[half:]], tris[order[:half]]]
+    return chunks
+
+
+def ob_arrays(ob, depsgraph):
+    """Mesh arrays of the evaluated mesh of a Blender object"""
+    eval_ob = ob.evaluated_get(depsgraph)
+    mesh = eval_ob.to_mesh()
+    try:
+        return mesh_arrays(mesh)
+    finally:
+        eval_ob.to_mesh_clear()
+
+
+def ob2obj(ob, depsgraph, filename, matrix=None, triangles=None, materials=None):
+    """Writes the evaluated mesh of a Blender object as an OBJ
+
+    materials are the usemtl names of the slots, the slot names by default.
+    """
+    if materials is None:
+        materials = [slot.name for slot in ob.material_slots]
+    return write_obj(filename, ob_arrays(ob, depsgraph), materials, matrix, triangles)
@@ -0,0 +1,223 @@
+"""Octrees cached by the content of their input files
+
+The key of an octree is a hash of its oconv options and of every input:
+the scene files, the output of their ! commands and the data files they
+name (meshes, pictures, data). Command outputs are memoized by command line
+and the hashes of the files the command reads, file hashes by size and
+modification time, so an unchanged scene is recognised without running
+anything. The least recently used octrees are evicted to stay within a
+disk budget.
+"""
+
+import json
+import os
+import re
+import subprocess
+import threading
+
+from cache import hash_file, new_hash
+from pool import errors, run
+
+CACHE_DIR = "octree_cache"
+DISK_BUDGET = 4 << 30
+
+# files holding these go in the light part of the octree
+LIGHT_WORDS = re.compile(
+    r"gensky|gendaylit|skyfunc|^\S+\s+(light|illum|glow|spotlight)\s", re.MULTILINE
+)
+
+
+def resolve(token, dirs):
+    """Existing file named by token, looked up in dirs"""
+    for d in dirs:
+        p = os.path.join(d, token)
+        if os.path.isfile(p):
+            return p
+    return None
+
+
+def command_files(line, dirs):
+    """Files read by a ! command line"""
+    files = []
+    for token in line[1:].split()[1:]:
+        p = resolve(token, dirs)
+        if p is not None:
+            files.append(p)
+    return files
+
+
+def included_files(path, cwd, seen=None):
+    """The file and those it reads through ! commands, recursively"""
+    seen = seen if seen is not None else []
+    if path in seen:
+        return seen
+    seen.append(path)
+    with open(path, errors="replace") as f:
+        for line in f:
+            if line.startswith("!"):
+                for p in command_files(line, [os.path.dirname(path), cwd]):
+                    included_files(p, cwd, seen)
+    return seen
+
+
+def mentions(path, words, cwd):
+    """Checks if a file, or a file it includes with !, contains a word
+
+    words is a sequence of strings or a compiled regular expression.
+    """
+    for p in included_files(path, cwd):
+        with open(p, errors="replace") as f:
+            text = f.read()
+        if hasattr(words, "search"):
+            if words.search(text):
+                return True
+        elif any(w in text for w in words):
+            return True
+    return False
+
+
+class OctreeCache:
+    """Directory of octrees named by the hash of their inputs
+
+    Paths are relative to the directory oconv runs in (cwd).
+    """
+
+    def __init__(self, directory=CACHE_DIR, budget=DISK_BUDGET, cwd=None):
+        self.directory = directory
+        self.budget = budget
+        self.cwd = cwd if cwd is not None else os.getcwd()
+        self.index_file = self.path(os.path.join(directory, "index.json"))
+        self.lock = threading.Lock()
+        self.index = {"files": {}, "commands": {}}
+        if os.path.isfile(self.index_file):
+            with open(self.index_file) as f:
+                self.index = json.load(f)
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def save_index(self):
+        """Keeps the file hashes for the next run, they are only redone on change"""
+        with self.lock:
+            os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+            with open(f"{self.index_file}.tmp", "w") as f:
+                json.dump(self.index, f)
+            os.replace(f"{self.index_file}.tmp", self.index_file)
+
+    def file_hash(self, path):
+        """Hash of a file, computed again only when its size or date change"""
+        st = os.stat(path)
+        stamp = [st.st_size, st.st_mtime_ns]
+        path = os.path.abspath(path)
+        entry = self.index["files"].get(path)
+        if entry is None or entry[0] != stamp:
+            entry = [stamp, hash_file(path).hexdigest()]
+            with self.lock:
+                self.index["files"][path] = entry
+        return entry[1]
+
+    def data_files(self, text, directory):
+        """Files named by the string arguments of primitives"""
+        files = []
+        for token in set(text.split()):
+            if "." in token:
+                p = resolve(token, [self.cwd, directory])
+                if p is not None:
+                    files.append(p)
+        return sorted(files)
+
+    def command_output(self, line):
+        """(hash, data files) of the output of a ! command
+
+        The command only runs when it, or a file it reads, changed.
+        """
+        h = new_hash()
+        h.update(line.encode())
+        for f in command_files(line, [self.cwd]):
+            for p in included_files(f, self.cwd):
+                h.update(self.file_hash(p).encode())
+        key = h.hexdigest()
+        entry = self.index["commands"].get(key)
+        if entry is None:
+            out = subprocess.run(
+                line[1:], shell=True, cwd=self.cwd, capture_output=True, text=True
+            ).stdout
+            h = new_hash()
+            h.update(out.encode())
+            entry = [h.hexdigest(), self.data_files(out, self.cwd)]
+            with self.lock:
+                self.index["commands"][key] = entry
+        return entry
+
+    def update(self, h, path):
+        """Adds the content of a scene file to a hash"""
+        with open(path, errors="replace") as f:
+            lines = f.read().splitlines()
+        text = "\n".join(l for l in lines if not l.startswith("!"))
+        h.update(text.encode())
+        files = self.data_files(text, os.path.dirname(path))
+        for line in lines:
+            if line.startswith("!"):
+                out, out_files = self.command_output(line)
+                h.update(out.encode())
+                files += out_files
+        for p in files:
+            h.update(self.file_hash(p).encode())
+
+    def key(self, files, options=()):
+        """Hash of the oconv options and of the content of the inputs"""
+        h = new_hash()
+        h.update(" ".join(options).encode())
+        for f in files:
+            self.update(h, self.path(f))
+        return h.hexdigest()
+
+    def build(self, files, options=(), base=None):
+        """Cached octree of the files, made with oconv when missing"""
+        if base is not None:  # named by the hash of its own inputs
+            options = [*options, "-i", base]
+        octree = os.path.join(self.directory, f"{self.key(files, options)}.oct")
+        if os.path.isfile(self.path(octree)):
+            os.utime(self.path(octree))  # most recently used
+        else:
+            result = run(["oconv", *options, *files], octree, cwd=self.cwd)
+            if result.returncode != 0:
+                raise Exception("\n".join(errors([result])))
+            self.evict(keep=octree)
+        return octree
+
+    def get(self, files, lights=None):
+        """Octree of the scene files, relative to cwd
+
+        The geometry goes in a frozen octree of its own and the light
+        dependent files (skies, lights, illums) are added to it with
+        oconv -i, so changing the lighting does not rebuild the geometry.
+        lights defaults to the files that mention a sky or light material.
+        """
+        os.makedirs(self.path(self.directory), exist_ok=True)
+        if lights is None:
+            lights = [f for f in files if mentions(self.path(f), LIGHT_WORDS, self.cwd)]
+        geometry = [f for f in files if f not in lights]
+        try:
+            if not geometry or not lights:
+                return self.build(files)
+            return self.build(lights, base=self.build(geometry, ["-f"]))
+        finally:
+            self.save_index()
+
+    def evict(self, keep=None):
+        """Removes the least recently used octrees above the disk budget"""
+        directory = self.path(self.directory)
+        octs = sorted(
+            (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".oct")),
+            key=os.path.getmtime,
+        )
+        total = sum(os.path.getsize(p) for p in octs)
+        keep = self.path(keep) if keep is not None else None
+        for p in octs:
+            if total <= self.budget:
+                break
+            if p == keep:
+                continue
+            total -= os.path.getsize(p)
+            os.remove(p)
@@ -1,23 +1,67 @@
 import bpy
+import functools
+import io
+import numpy as np
 import os
 import subprocess
+import sys
+from contextlib import nullcontext
 from mathutils import Vector
 
+from ambient import AmbientCache
+from cache import Manifest, hash_materials, hash_mesh, new_hash
+from falsecolor import output_name
+from jobs import QUEUE, Job
+from matlib import ID, MaterialLibrary
+from objwriter import ob2obj, ob_arrays, spatial_chunks, write_obj
+from octree import OctreeCache
+from pool import errors, run, run_all
+from rif import Rif
+from sensors import heat_colors, sensor_illuminance, vertex_values
+from sky import gensky
+from textures import text2hdr
+from tracing import save as save_trace, stage, traced
+from xform import is_similarity, mesh_primitive, xform_args
+
+BUFFER_SIZE = 1 << 20
+FALSECOLOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "falsecolor.py")
+TILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiles.py")
+AMBIENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ambient.py")
+
+
+def traced_execute(name):
+    """Records an operator execute as a stage and saves the trace after it
+
+    The wrapper keeps the arguments bpy checks when registering the class.
+    """
+
+    def decorator(execute):
+        @functools.wraps(execute)
+        def wrapper(self, context):
+            try:
+                with stage(name):
+                    return execute(self, context)
+            finally:
+                save_trace()
+
+        return wrapper
+
+    return decorator
+
 
 def generate_sky(context):
     s = context.scene.radiance
+    time = f"{s.sky_time_h}:{s.sky_time_min:02d}"
+    meridian = None
+    if s.is_sky_time_zone:
+        time += s.sky_DST if s.is_sky_DST else s.sky_LST
+    else:
+        meridian = s.sky_meridian
+    year = s.sky_year if s.is_sky_year else None
     with open("sky.rad", "w") as f:
-        f.write(f"!gensky {s.sky_month} {s.sky_day} ")
-        if s.is_sky_time_zone:
-            TZone = s.sky_DST if s.is_sky_DST else s.sky_LST
-            f.write(f"{s.sky_time_h}:{s.sky_time_min}{TZone} ")
-        else:
-            f.write(f"{s.sky_meridian}")
-
-        if s.is_sky_year:
-            f.write(f"-y {s.sky_year} {s.sky_type}")
-        f.write(f" -a {s.sky_latitude} -o {s.sky_longitude}\n\n")
-        f.write("skyfunc glow sky_glow\n0\n0\n4 .9 .9 1.15 0\n")
+        f.write(gensky(s.sky_month, s.sky_day, time, s.sky_latitude, s.sky_longitude,
+                       s.sky_type, year, meridian))
+        f.write("\nskyfunc glow sky_glow\n0\n0\n4 .9 .9 1.15 0\n")
         f.write("sky_glow source sky\n0\n0\n4 0 0 1 180\n")
         f.write("skyfunc glow ground_glow\n0\n0\n4 1.4 .9 .6 0\n")
         f.write("ground_glow source ground\n0\n0\n4 0 0 -1 180")
@@ -34,13 +78,25 @@ def generate_view(context, cam_name):
         f.write(f"rvu -vtv -vp {lx} {ly} {lz} -vd {dx} {dy} {dz} -vu {ux} {uy} {uz} -vo {vo} -va {va}")
 
 
-def generate_rif(context, cam_name):
+@traced("rif")
+def generate_rif(context, cam_name, lod=None):
+    """Writes the rif file, returns its name
+
+    lod renders the decimated meshes of the export, by default for the Low
+    quality; they get their own rif file and octree.
+    """
     s = context.scene.radiance
     resol = s.resolution
-    with open(f"{s.file_name}.rif", "w") as f:
-        f.write(f"OCTREE= {s.file_name}.oct\n")
-        f.write(f"AMB = {s.amb_file}\n")
-        f.write(f"scene = sky.rad {s.file_name}.rad\n\n")
+    if lod is None:
+        lod = s.quality == "L"
+    name = s.file_name
+    if lod and os.path.isfile(f"{s.file_name}_lod.rad"):
+        name = f"{s.file_name}_lod"
+    with open(f"{name}.rif", "w") as f:
+        f.write(f"OCTREE= {name}.oct\n")
+        if s.amb_file:
+            f.write(f"AMB = {s.amb_file}\n")
+        f.write(f"scene = sky.rad {name}.rad\n\n")
         f.write(f"EXPOSURE = {str(s.exposure)}\n")
         f.write(f"VARIABILITY = {s.variability}\n")
         f.write(f"DETAIL = {s.detail}\n")
@@ -52,97 +108,180 @@ def generate_rif(context, cam_name):
             f.write("render = -i\n")
         f.write(f"PICTURE = {s.file_name}\n")
         f.write(f"view = {cam_name} -vf {cam_name}.vf\n")
-        f.write(f"REPORT = 0.2")
+        f.write(f"REPORT = 0.2\n")
+    if s.amb_file:
+        return f"{name}.rif"
+
+    # ambient file shared by every render of this scene and settings
+    rif = Rif(f"{name}.rif")
+    octrees = OctreeCache()
+    scene_key = octrees.key(rif.files("materials") + rif.files("scene"))
+    # the next click only hashes the files that changed
+    octrees.save_index()
+    ambient = AmbientCache()
+    amb = ambient.file(scene_key, rif.render_options())
+    ambient.evict(keep=amb)
+    with open(rif.filename, "a") as f:
+        f.write(f"AMBFILE = {amb}\n")
+    return rif.filename
 
 
 class Material:
-    """ Define the materials of the Scene in Radiance language"""
+    """ Define the materials of the Scene in Radiance language
 
-    def __init__(self, filename):
+    The definitions are streamed to a buffered file handle (or to any sink
+    with a write method) as they are added.
+    """
+
+    def __init__(self, filename, sink=None):
         self.filename = filename
-        self.content = ""
+        self.file = sink if sink is not None else open(
+            filename, "w", buffering=BUFFER_SIZE
+        )
+        self.owned = sink is None  # a sink given by the caller is left open
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def write(self, s):
+        self.file.write(s)
+
+    def save(self):
+        if self.owned:
+            self.file.close()
+        elif hasattr(self.file, "flush"):
+            self.file.flush()
 
     def addMaterialLight(self, id, input, modifier=""):
         color = input.color
-        self.content += f"void light {id} \n 0 \n 0 \n 3 {color[0]} {color[1]} {color[2]}"
-        self.content += "\n"
+        self.write(f"void light {id} \n 0 \n 0 \n 3 {color[0]} {color[1]} {color[2]}\n")
        
     def addMaterialIllum(self, id, input, modifier=""):
         color = input.color
         mod = "void" if len(modifier) == 0 else modifier[0].material
-        self.content += f"void illum {id} \n 1 {mod} \n 0 \n 3 {color[0]} {color[1]} {color[2]}"
-        self.content += "\n"
+        self.write(f"void illum {id} \n 1 {mod} \n 0 \n 3 {color[0]} {color[1]} {color[2]}\n")
 
     def addMaterialGlow(self, id, input, modifier=""):
         color = input.color
-        self.content += f"void glow {id} \n 0 \n 0 \n 4 {color[0]} {color[1]} {color[2]} {input.maxrad}"
-        self.content += "\n"
+        self.write(f"void glow {id} \n 0 \n 0 \n 4 {color[0]} {color[1]} {color[2]} {input.maxrad}\n")
        
     def addMaterialSpotlight(self, id, input, modifier=""):
         color = input.color
         dir = input.direction
-        self.content += f"void spotlight {id} \n 0 \n 0 \n 7 {color[0]} {color[1]} {color[2]} {input.angle} {dir[0]} {dir[1]} {dir[2]}"
-        self.content += "\n"
+        self.write(f"void spotlight {id} \n 0 \n 0 \n 7 {color[0]} {color[1]} {color[2]} {input.angle} {dir[0]} {dir[1]} {dir[2]}\n")
        
     def addMaterialMirror(self, id, input, modifier):
         color = input.color
         if modifier.values() == []:
-            self.content += f"void mirror {id} \n 0 \n 0 \n 3 {color[0]} {color[1]} {color[2]}"
+            self.write(f"void mirror {id} \n 0 \n 0 \n 3 {color[0]} {color[1]} {color[2]}\n")
         else:
-            self.content += f"void mirror {id} \n 1 {modifier[0].material} \n 0 \n 3 {color[0]} {color[1]} {color[2]}"
-        self.content += "\n"
+            self.write(f"void mirror {id} \n 1 {modifier[0].material} \n 0 \n 3 {color[0]} {color[1]} {color[2]}\n")
        
     def addMaterialPlastic(self,id, input, modifier = ""): 
         color = input.color
-        self.content += f"void plastic {id} \n 0 \n 0 \n 5 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough}"
-        self.content += "\n"
+        self.write(f"void plastic {id} \n 0 \n 0 \n 5 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough}\n")
         
     def addMaterialMetal(self,id, input, modifier = ""):
         color = input.color
-        self.content += f"void metal {id} \n 0 \n 0 \n 5 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough}"
-        self.content += "\n"
+        self.write(f"void metal {id} \n 0 \n 0 \n 5 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough}\n")
         
     def addMaterialTrans(self,id, input, modifier = ""):
         color = input.color
-        self.content += f"void trans {id} \n 0 \n 0 \n 7 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough} {input.trans} {input.tspec}"
-        self.content += "\n"
+        self.write(f"void trans {id} \n 0 \n 0 \n 7 {color[0]} {color[1]} {color[2]} {input.spec} {input.rough} {input.trans} {input.tspec}\n")
 
     def addMaterialDielectric(self,id, input, modifier = ""):
         colortn = input.color
-        self.content += f"void dielectric {id} \n 0 \n 0 \n 5 {colortn[0]} {colortn[1]} {colortn[2]} {input.n1} {input.hc}"
-        self.content += "\n"
+        self.write(f"void dielectric {id} \n 0 \n 0 \n 5 {colortn[0]} {colortn[1]} {colortn[2]} {input.n1} {input.hc}\n")
             
     def addMaterialGlass(self,id, input, modifier = ""):
         colortn = input.color
-        self.content += f"void glass {id} \n 0 \n 0 \n 5 {colortn[0]} {colortn[1]} {colortn[2]}"
-        self.content += "\n"
+        self.write(f"void glass {id} \n 0 \n 0 \n 5 {colortn[0]} {colortn[1]} {colortn[2]}\n")
         
     def addMaterialAntimatter(self,id,input="", modifier=""):
         mods = [m.material for m in modifier]
-        self.content += f"void antimatter {id} \n {len(mods)} {' '.join(mods)} \n 0 \n 0"
-        self.content += "\n"
+        self.write(f"void antimatter {id} \n {len(mods)} {' '.join(mods)} \n 0 \n 0\n")
 
     def addMaterialColorTexture(self, id, textureHdr, inp):
         mat = inp.material_type
-        self.content += f"void colorpict {id}_map\n 7 red green blue {textureHdr}.hdr .  frac(Lu)  frac(Lv) \n 0 \n 0"
-        self.content += "\n"
-        self.content += f"{id}_map {mat} {id} \n 0 \n 0 \n 5 1 1 1 {inp.spec} {inp.rough}"
-        self.content += "\n"
-
-
-def obj2rad(context, ob, materials, mod):
-    """Specifies the materials (mod) of the mesh"""
-
-    bpy.ops.export_scene.obj(
-        filepath=f"{ob.name}.obj", use_selection=True, axis_forward="Y", axis_up="Z"
-    )
-
-    command = f"obj2mesh -a {materials} {ob.name}.obj {ob.name}.rtm"
-    os.system(command)
-
-    with open(f"{ob.name}.rad", "w") as f:
-        f.write(f"{mod} mesh {ob.name}\n")
-        f.write(f"1 {ob.name}.rtm\n0\n0\n")
+        self.write(f"void colorpict {id}_map\n 7 red green blue {textureHdr}.hdr .  frac(Lu)  frac(Lv) \n 0 \n 0\n")
+        self.write(f"{id}_map {mat} {id} \n 0 \n 0 \n 5 1 1 1 {inp.spec} {inp.rough}\n")
+
+
+@traced("obj export")
+def obj2rad(context, ob, materials, mod, name=None, names=None, matrix=None):
+    """Specifies the materials (mod) of the mesh
+
+    The files are named after name (the object name by default) and the
+    faces use the material names of names (the slot names by default).
+    Returns the obj2mesh command, so the conversions can run in a pool
+    """
+    name = name or ob.name
+
+    # the mesh is exported in object space unless given a matrix to bake,
+    # the scene file places it
+    ob2obj(ob, context.evaluated_depsgraph_get(), f"{name}.obj", matrix, materials=names)
+
+    with open(f"{name}.rad", "w") as f:
+        f.write(mesh_primitive(mod, name, f"{name}.rtm"))
+
+    return ["obj2mesh", "-a", materials, f"{name}.obj", f"{name}.rtm"]
+
+
+@traced("obj export")
+def chunks2rad(context, ob, materials, mod, name, names, size, matrix=None):
+    """Splits the mesh into chunks of at most size triangles, like obj2rad
+
+    The chunks are the files of name.i, converted in parallel and placed
+    as one mesh primitive each. Returns their obj2mesh commands.
+    """
+    arrays = ob_arrays(ob, context.evaluated_depsgraph_get())
+    commands = []
+    with open(f"{name}.rad", "w") as f:
+        for i, triangles in enumerate(spatial_chunks(arrays, size)):
+            write_obj(f"{name}.{i}.obj", arrays, names, matrix, triangles)
+            f.write(mesh_primitive(mod, f"{name}.{i}", f"{name}.{i}.rtm"))
+            commands.append(["obj2mesh", "-a", materials, f"{name}.{i}.obj", f"{name}.{i}.rtm"])
+    return commands
+
+
+@traced("lod export")
+def lod2rad(context, ob, materials, name, names, ratio, matrix=None):
+    """Decimated copy of the mesh in the _lod files of name
+
+    A Decimate modifier keeping ratio of the triangles is added for the
+    time of the export. Returns the obj2mesh command, like obj2rad.
+    """
+    depsgraph = context.evaluated_depsgraph_get()
+    mod = ob.modifiers.new("Radiance LOD", "DECIMATE")
+    try:
+        mod.ratio = ratio
+        depsgraph.update()
+        ob2obj(ob, depsgraph, f"{name}_lod.obj", matrix, materials=names)
+    finally:
+        ob.modifiers.remove(mod)
+        depsgraph.update()
+    return ["obj2mesh", "-a", materials, f"{name}_lod.obj", f"{name}_lod.rtm"]
+
+
+def triangle_count(ob, depsgraph):
+    """Number of triangles of the evaluated mesh of ob"""
+    mesh = ob.evaluated_get(depsgraph).data
+    sizes = np.empty(len(mesh.polygons), dtype=np.int64)
+    mesh.polygons.foreach_get("loop_total", sizes)
+    return int(sizes.sum()) - 2 * len(sizes)
+
+
+def mesh_name(ob, key, meshes):
+    """Name of the files shared by every object with the same mesh (key)"""
+    if key not in meshes:
+        name = ob.data.name
+        if name in meshes.values():  # same datablock, other modifiers
+            name = f"{ob.data.name}_{ob.name}"
+        meshes[key] = name
+    return meshes[key]
 
 
 def get_text2hdr(context, m):
@@ -153,22 +292,21 @@ def get_text2hdr(context, m):
     )
     if surface.inputs["Base Color"].is_linked:
         texture = surface.inputs["Base Color"].links[0].from_node
-
-        texture.image.save_render(m.name)
-        command = f"mogrify -format hdr {m.name}"
-        os.system(command)
-        return m.name
+        return text2hdr(texture.image)
     else:
         raise Exception("There is no texture linked in Base Color")
 
 
-def generate_material(context, mat, file):
-    """Converts all the object materials (visibles) in Radiance material"""
+def generate_material(context, mat, file, id=None):
+    """Converts all the object materials (visibles) in Radiance material
 
+    The material is named id, its own name by default.
+    """
+    id = id or mat.name
     rad = mat.radiance
     if rad.is_texture:
         hdr = get_text2hdr(context, mat)
-        file.addMaterialColorTexture(mat.name, hdr, rad)
+        file.addMaterialColorTexture(id, hdr, rad)
     else:
         mod = mat.modifier
         addMaterials = {
@@ -184,7 +322,18 @@ def generate_material(context, mat, file):
             "glass": file.addMaterialGlass,
             "antimatter": file.addMaterialAntimatter,
         }
-        addMaterials[rad.material_type](mat.name, rad, mod)
+        addMaterials[rad.material_type](id, rad, mod)
+
+
+@traced("materials")
+def material_library(context, materials):
+    """Library of the distinct definitions of the materials"""
+    library = MaterialLibrary()
+    for mat in sorted(materials, key=lambda m: m.name):
+        sink = io.StringIO()
+        generate_material(context, mat, Material(None, sink), ID)
+        library.add(mat.name, sink.getvalue())
+    return library
 
 
 class RAD_OT_Export(bpy.types.Operator):
@@ -193,78 +342,336 @@ class RAD_OT_Export(bpy.types.Operator):
     bl_idname = "radiance.export"
     bl_label = "Export Export the thebjects to rad"
 
+    @traced_execute("export")
     def execute(self, context):
-        file_name = context.scene.radiance.file_name
-
-        scene = ""
-        bpy.ops.object.select_all(action="DESELECT")
-        for ob in context.scene.objects:
-            if ob.visible_get() and ob.type == "MESH":
-                ob.select_set(True)
-
-                # material automatitzation
-                file = Material(f"{ob.name}.mat")
-                for mat in ob.material_slots:
-                    generate_material(context, mat.material, file)
-
-                with open(f"{file.filename}", "w") as f:
-                    f.write(file.content)
-
-                obj2rad(context, ob, file.filename, "void")
-                ob.select_set(False)
-
-            if ob.visible_get() and (ob.type == "MESH" or ob.type == "LIGHT"):
-                lx, ly, lz = ob.location
-                rx, ry, rz = ob.rotation_euler
-                scene += f"!xform -t {lx} {ly} {lz} -rx {rx} -ry {ry} -rz {rz} {ob.name}.rad\n"
+        s = context.scene.radiance
+        file_name = s.file_name
+
+        depsgraph = context.evaluated_depsgraph_get()
+        manifest = Manifest(f"{file_name}.manifest")
+        converted, commands, msgs = [], [], []
+        meshes, lods, rtms = {}, {}, {}
+
+        # one library of the distinct materials for every conversion
+        obs = [ob for ob in context.scene.objects if ob.visible_get() and ob.type == "MESH"]
+        library = material_library(context, {
+            slot.material for ob in obs for slot in ob.material_slots if slot.material
+        })
+        mat_file = f"{file_name}.mat"
+        library.write(mat_file)
+
+        # the preview scene places the decimated meshes the same way
+        with open(f"{file_name}.rad", "w", buffering=BUFFER_SIZE) as scene, \
+                open(f"{file_name}_lod.rad", "w", buffering=BUFFER_SIZE) as lod_scene:
+            for ob in context.scene.objects:
+                if ob.visible_get() and ob.type == "MESH":
+                    materials = [slot.material for slot in ob.material_slots]
+                    names = [library.names[m.name] if m else "" for m in materials]
+                    h = new_hash()
+                    h.update(hash_materials(materials).encode())
+                    h.update(" ".join(names).encode())
+                    mat_key = h.hexdigest()
+                    mesh_key = hash_mesh(ob, depsgraph)
+                    matrix = None
+                    if not is_similarity(ob.matrix_world):
+                        # xform cannot place a mesh scaled along one axis or
+                        # sheared, its world matrix is baked into its own files
+                        matrix = np.array(ob.matrix_world, dtype=np.float64)
+                        h = new_hash()
+                        h.update(mesh_key.encode())
+                        h.update(matrix.tobytes())
+                        mesh_key = h.hexdigest()
+
+                    # linked duplicates are converted once and instanced
+                    new = (mesh_key, mat_key) not in meshes
+                    name = mesh_name(ob, (mesh_key, mat_key), meshes)
+                    if new:
+                        triangles = triangle_count(ob, depsgraph)
+                        # huge meshes are split to convert them in parallel
+                        chunk = s.chunk_triangles if 0 < s.chunk_triangles < triangles else 0
+                        values = {"materials": mat_key, "mesh": mesh_key, "chunk": chunk}
+                        count = manifest.get(name, "chunks", 0) if chunk else 0
+                        rtms[name] = [f"{name}.{i}.rtm" for i in range(count)] if chunk else [f"{name}.rtm"]
+
+                        # the mesh holds its materials, it only changes with them
+                        changed = any(manifest.changed(name, k, v) for k, v in values.items())
+                        if changed or not all(os.path.isfile(f) for f in rtms[name]):
+                            if chunk:
+                                chunks = chunks2rad(
+                                    context, ob, mat_file, "void", name, names, chunk, matrix
+                                )
+                                rtms[name] = [c[-1] for c in chunks]
+                            else:
+                                chunks = [obj2rad(context, ob, mat_file, "void", name, names, matrix)]
+                            values["chunks"] = len(chunks) if chunk else 0
+                            commands += chunks
+                            converted += [((name, "chunks"), name, values)] * len(chunks)
+                        else:
+                            manifest.set(name, chunks=count, **values)
+
+                        # meshes within the budget are previewed as they are
+                        lods[name] = 0 < s.lod_triangles < triangles
+                        if lods[name]:
+                            h = new_hash()
+                            h.update(f"{mesh_key} {mat_key} {s.lod_triangles}".encode())
+                            lod_key = h.hexdigest()
+                            if (manifest.changed(name, "lod", lod_key)
+                                    or not os.path.isfile(f"{name}_lod.rtm")):
+                                commands.append(lod2rad(
+                                    context, ob, mat_file, name, names,
+                                    s.lod_triangles / triangles, matrix,
+                                ))
+                                converted.append(((name, "lod"), name, {"lod": lod_key}))
+                            else:
+                                manifest.set(name, lod=lod_key)
+
+                    # every chunk is a mesh of its own under the same modifier
+                    xform = xform_args(ob.matrix_world) if matrix is None else ""
+                    for i, rtm in enumerate(rtms[name]):
+                        id = f"{ob.name}.{i}" if len(rtms[name]) > 1 else ob.name
+                        scene.write(mesh_primitive("void", id, rtm, xform))
+                        if not lods[name]:
+                            lod_scene.write(mesh_primitive("void", id, rtm, xform))
+                    if lods[name]:
+                        lod_scene.write(mesh_primitive("void", ob.name, f"{name}_lod.rtm", xform))
+
+                elif ob.visible_get() and ob.type == "LIGHT":
+                    if not is_similarity(ob.matrix_world):
+                        msgs.append(f"{ob.name}: a light cannot be scaled along one axis")
+                        continue
+                    light = f"!xform {xform_args(ob.matrix_world)} {ob.name}.rad\n"
+                    scene.write(light)
+                    lod_scene.write(light)
+
+        with stage("mesh conversion", meshes=len(commands)):
+            results = run_all(commands)
+        manifest.converted(converted, results)
+        manifest.save()
+
+        msgs += errors(results)
+        for msg in msgs:
+            self.report({"ERROR"}, msg)
+        return {"CANCELLED"} if msgs else {"FINISHED"}
+
+
+class JobModal:
+    """Follows a background job from a modal timer, ESC cancels it"""
+
+    def follow(self, context, job):
+        self.job = job
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.5, window=context.window)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self.job.cancel()
+        elif event.type != "TIMER":
+            return {"PASS_THROUGH"}
+        QUEUE.update()
+        self.job.poll()
+        if not self.job.finished:
+            context.workspace.status_text_set(self.job.status())
+            return {"RUNNING_MODAL"} if event.type == "ESC" else {"PASS_THROUGH"}
+
+        context.window_manager.event_timer_remove(self.timer)
+        context.workspace.status_text_set(None)
+        save_trace()  # with the commands of the job
+        if self.job.state == "failed":
+            self.report({"ERROR"}, self.job.error())
+            return {"CANCELLED"}
+        if self.job.state == "cancelled":
+            self.report({"WARNING"}, f"{self.job.name} cancelled")
+            return {"CANCELLED"}
+        if self.job.picture is not None:
+            show_image(context, self.job.picture)
+        self.report({"INFO"}, f"{self.job.name} finished")
+        return {"FINISHED"}
 
-        with open(f"{file_name}.rad", "w") as f:
-            f.write(scene)
 
-        return {"FINISHED"}
+def show_image(context, filename):
+    """Loads a picture, or reloads it, and shows it in the image editors"""
+    image = bpy.data.images.load(os.path.abspath(filename), check_existing=True)
+    image.reload()
+    for area in context.screen.areas:
+        if area.type == "IMAGE_EDITOR":
+            area.spaces.active.image = image
 
 
-class RAD_OT_Preview(bpy.types.Operator):
+class RAD_OT_Preview(JobModal, bpy.types.Operator):
     """Preview the scene in Radiance"""
 
     bl_idname = "radiance.preview"
     bl_label = "Preview rendering"
     
+    @traced_execute("preview")
     def execute(self, context):
         s = context.scene.radiance
         cam_name = context.scene.radiance.camera.name_full
 
         generate_sky(context)
         generate_view(context, cam_name)
-        generate_rif(context, cam_name)
-        command = f"rad -o x11 {s.file_name}.rif"
-        os.system(command)
-        return {"FINISHED"}
+        rif = generate_rif(context, cam_name, lod=True)
+        # previews start at once, they do not wait for the renders
+        job = Job(f"Preview {cam_name}", [
+            [sys.executable, AMBIENT, "--no-warm", rif, "rad", "-o", "x11", rif]
+        ])
+        job.start()
+        return self.follow(context, job)
 
 
-class RAD_OT_Render(bpy.types.Operator):
+class RAD_OT_Render(JobModal, bpy.types.Operator):
     """Render the scene in Radiance"""
 
     bl_idname = "radiance.render"
     bl_label = "Preview rendering"
 
+    @traced_execute("render")
     def execute(self, context):
         s = context.scene.radiance
         cam_name = context.scene.radiance.camera.name_full
         
         generate_sky(context)
         generate_view(context, cam_name)
-        generate_rif(context, cam_name)
-
-        command = f"bash -c 'rad  {s.file_name}.rif ; $SHELL'"
-        os.system(f"mate-terminal --command=\"{command}\" &") ####### ¡¡¡¡ not evry one has mate-terminal !!!!
-
+        rif = generate_rif(context, cam_name)
+        picture = f"{s.file_name}_{cam_name}.hdr"
+        if s.tiles > 1:
+            # warms the ambient file and holds its lock itself
+            commands = [[sys.executable, TILES, "-n", str(s.tiles), rif]]
+        else:
+            commands = [[sys.executable, AMBIENT, rif, "rad", rif]]
         if s.is_false_color:
-            file = f"{s.file_name}_{s.camera.name_full}.hdr"
-            command = f"falsecolor -ip {file} -l Lux > falseC_{file}"
-            os.system(command)
+            # runs once rad has written the picture
+            commands.append([sys.executable, FALSECOLOR, "-l", "Lux", picture])
+            picture = output_name(picture)
+        return self.follow(context, QUEUE.submit(Job(f"Render {cam_name}", commands, picture=picture)))
+
+
+def face_triangles(ob, depsgraph):
+    """World space vertices and the triangles of the selected faces (all if none)
+
+    They are those of the evaluated mesh, the surface ob2obj exports.
+    """
+    eval_ob = ob.evaluated_get(depsgraph)
+    mesh = eval_ob.to_mesh()
+    try:
+        return mesh_triangles(mesh, np.array(ob.matrix_world))
+    finally:
+        eval_ob.to_mesh_clear()
+
+
+def mesh_triangles(mesh, m):
+    """Vertices transformed by m and the triangles of the selected faces"""
+    mesh.calc_loop_triangles()
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    co = co.reshape(-1, 3) @ m[:3, :3].T + m[:3, 3]
+    tris = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", tris)
+    polygons = np.empty(len(mesh.loop_triangles), dtype=np.int64)
+    mesh.loop_triangles.foreach_get("polygon_index", polygons)
+    selected = np.empty(len(mesh.polygons), dtype=bool)
+    mesh.polygons.foreach_get("select", selected)
+    tris = tris.reshape(-1, 3)
+    return co, tris[selected[polygons]] if selected.any() else tris
+
+
+def write_heat_map(mesh, values, scale, name="Illuminance"):
+    """Writes vertex values as colours, vertices without values keep theirs"""
+    colors = heat_colors(values, scale)
+    known = ~np.isnan(values)
+    if hasattr(mesh, "color_attributes"):
+        attr = mesh.color_attributes.get(name) or mesh.color_attributes.new(
+            name, "FLOAT_COLOR", "POINT"
+        )
+        old = np.empty(len(mesh.vertices) * 4, dtype=np.float32)
+        attr.data.foreach_get("color", old)
+        old = old.reshape(-1, 4)
+        old[known] = colors[known]
+        attr.data.foreach_set("color", old.ravel())
+        mesh.color_attributes.active_color = attr
+    else:  # before Blender 3.2, colours are per face corner
+        layer = mesh.vertex_colors.get(name) or mesh.vertex_colors.new(name=name)
+        verts = np.empty(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", verts)
+        old = np.empty(len(mesh.loops) * 4, dtype=np.float32)
+        layer.data.foreach_get("color", old)
+        old = old.reshape(-1, 4)
+        old[known[verts]] = colors[verts][known[verts]]
+        layer.data.foreach_set("color", old.ravel())
+        mesh.vertex_colors.active = layer
+    mesh.update()
+
+
+class RAD_OT_Sensors(bpy.types.Operator):
+    """Compute the illuminance on a grid of sensors over the selected faces"""
+
+    bl_idname = "radiance.sensors"
+    bl_label = "Sensor grid illuminance"
+
+    @traced_execute("sensors")
+    def execute(self, context):
+        s = context.scene.radiance
+        obs = [ob for ob in context.selected_objects if ob.type == "MESH"]
+        if not obs:
+            self.report({"ERROR"}, "Select the meshes to place the sensors on")
+            return {"CANCELLED"}
+        for ob in obs:
+            ob.update_from_editmode()  # the face selection of edit mode
+        cam_name = s.camera.name_full
+
+        generate_sky(context)
+        generate_view(context, cam_name)
+        # the illuminance of the full resolution meshes
+        rif = Rif(generate_rif(context, cam_name, lod=False))
+        # rad only builds the octree
+        with stage("octree"):
+            msgs = errors([run(["rad", "-v", "0", rif.filename])])
+        if msgs:
+            self.report({"ERROR"}, msgs[0])
+            return {"CANCELLED"}
+        options = rif.render_options()
+        if rif.ambfile:
+            options += ["-af", rif.ambfile]
+        lock = AmbientCache().lock(rif.ambfile) if rif.ambfile else nullcontext()
+
+        wm = context.window_manager
+        wm.progress_begin(0, len(obs))
+        try:
+            with lock:
+                sensors = [self.sensors(context, ob, rif, options, i) for i, ob in enumerate(obs)]
+        except Exception as e:
+            self.report({"ERROR"}, str(e))
+            return {"CANCELLED"}
+        finally:
+            wm.progress_end()
+        for ob, lux in zip(obs, sensors):
+            if len(lux):
+                self.report({"INFO"}, f"{ob.name}: {len(lux)} sensors, "
+                            f"{lux.min():.0f} / {lux.mean():.0f} / {lux.max():.0f} lx "
+                            f"min / mean / max")
         return {"FINISHED"}
 
+    @traced("sensor grid")
+    def sensors(self, context, ob, rif, options, i):
+        """Computes and saves the sensors of an object, returns their lux"""
+        s = context.scene.radiance
+        wm = context.window_manager
+        co, tris = face_triangles(ob, context.evaluated_depsgraph_get())
+        grid = sensor_illuminance(
+            co, tris, rif.octree, s.sensor_spacing, s.sensor_height, options,
+            progress=lambda f: wm.progress_update(i + f),
+        )
+        np.savez(f"{s.file_name}_{ob.name}_sensors.npz", **grid)
+        if len(co) == len(ob.data.vertices):
+            values = vertex_values(grid["lux"], grid, tris, len(co))
+            write_heat_map(ob.data, values, s.sensor_scale)
+        else:  # the vertex colours are those of the mesh before the modifiers
+            self.report({"WARNING"}, f"{ob.name}: its modifiers change the vertices, "
+                        "no heat map is drawn")
+        return grid["lux"]
+
 
 class MOD_OT_Add(bpy.types.Operator):
     """Add another material type to active_material.modifiers"""
@@ -0,0 +1,267 @@
+"""Builds the scenes of rif files from one graph of content keyed targets
+
+The meshes of lib/Makefile, and the octree, ambient file and pictures of
+every rif file, are nodes of a single dependency graph. A node is keyed by
+the content of what it is made from (files, command, options and the keys
+of the nodes it depends on), computed once those nodes are up to date, and
+it is only rebuilt when its key differs from the one of its last build.
+Nodes whose dependencies are done run in parallel, so touching a material
+redoes the meshes and scenes using it and nothing else; a mesh rebuilt
+with the same content leaves the octrees alone.
+
+    python planner.py -C radiance -m lib/Makefile scenes/*/scene.rif
+"""
+
+import argparse
+import json
+import os
+import shlex
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ambient import AmbientCache, ambient_options
+from cache import new_hash
+from hdr import expose
+from octree import OctreeCache, command_files, mentions
+from pool import errors, run
+from rif import Rif
+from tiles import parse_view, view_options
+
+STATE_FILE = ".planner.json"
+
+
+class Node:
+    """A build target: its outputs, dependencies, key and build function
+
+    key and build are called once the dependencies are up to date; build
+    returns the error messages.
+    """
+
+    def __init__(self, name, outputs, deps, key, build):
+        self.name = name
+        self.outputs = outputs
+        self.deps = deps
+        self.key = key
+        self.build = build
+
+
+def makefile_targets(filename):
+    """(target, recipe lines) of a Makefile, without the phony ones"""
+    targets, current = [], None
+    with open(filename) as f:
+        for line in f:
+            if line.startswith("\t"):
+                if current is not None and line.strip():
+                    current[1].append(line.strip())
+            elif ":" in line and not line.startswith((".", "#")):
+                name = line.split(":", 1)[0].strip()
+                current = (name, [])
+                targets.append(current)
+            else:
+                current = None
+    return [(t, recipe) for t, recipe in targets if recipe and t not in ("all", "clean")]
+
+
+class Planner:
+    """Dependency graph of the targets of rif files, paths relative to cwd"""
+
+    def __init__(self, cwd=".", state=STATE_FILE, workers=None):
+        self.cwd = cwd
+        self.octrees = OctreeCache(cwd=cwd)  # file hashes and scene keys
+        os.makedirs(self.octrees.path(self.octrees.directory), exist_ok=True)
+        self.workers = workers
+        self.nodes = {}
+        self.keys = {}  # node name -> key once up to date
+        self.state_file = os.path.join(cwd, state)
+        self.state = {}
+        if os.path.isfile(self.state_file):
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def add(self, node):
+        if node.name in self.nodes:
+            raise Exception(f"{node.name} is built by two targets")
+        self.nodes[node.name] = node
+        return node
+
+    def hash(self, *words, files=(), deps=()):
+        h = new_hash()
+        for w in (*words, *(self.octrees.file_hash(self.path(f)) for f in files),
+                  *(self.keys[d] for d in deps)):
+            h.update(str(w).encode())
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def add_makefile(self, filename):
+        """Nodes of the Makefile targets, run in the Makefile directory"""
+        directory = os.path.dirname(filename)
+        for target, recipe in makefile_targets(self.path(filename)):
+            words = [w for line in recipe for w in shlex.split(line)]
+            # the files a recipe reads exist, the last word of each line is its output
+            inputs = [
+                os.path.relpath(p, self.cwd)
+                for line in recipe for p in command_files(f"!{line}", [self.path(directory)])
+            ]
+            outputs = [os.path.join(directory, shlex.split(line)[-1]) for line in recipe]
+            inputs = [p for p in inputs if p not in outputs]
+
+            def build(recipe=recipe, directory=directory):
+                return errors([run(shlex.split(l), cwd=self.path(directory)) for l in recipe])
+
+            self.add(Node(
+                f"make {target}", outputs, [],
+                lambda words=words, inputs=inputs: self.hash(*words, files=inputs),
+                build,
+            ))
+
+    def add_rif(self, filename):
+        """Nodes of the octree, ambient file and pictures of a rif file"""
+        rif = Rif(self.path(filename), self.cwd)
+        files = rif.files("materials") + rif.files("scene")
+        meshes = [
+            name for name, node in self.nodes.items() if name.startswith("make ")
+            and any(mentions(self.path(f), node.outputs, self.cwd) for f in files)
+        ]
+        octree = self.octree_node(rif, files, meshes)
+        options = rif.render_options()
+        deps = [octree.name]
+        if rif.ambfile:
+            deps.append(self.ambient_node(rif, octree, options).name)
+            options = [*options, "-af", rif.ambfile]
+        for name, view in rif.views:
+            self.picture_node(rif, name, view, options, deps)
+
+    def octree_node(self, rif, files, meshes):
+        name = f"oconv {rif.octree}"
+        if name in self.nodes:  # shared by several rif files
+            return self.nodes[name]
+        oconv = [w for value in rif.vars.get("oconv", []) for w in shlex.split(value)]
+
+        def build():
+            return errors([run(["oconv", *oconv, *files], rif.octree, cwd=self.cwd)])
+
+        return self.add(Node(
+            name, [rif.octree], meshes,
+            lambda: self.hash(self.octrees.key(files, oconv), deps=meshes), build,
+        ))
+
+    def ambient_node(self, rif, octree, options):
+        amb = rif.ambfile
+        views = [view_options(parse_view(shlex.split(v), self.cwd)) for _, v in rif.views]
+
+        def build():
+            for p in (amb, f"{amb}.warm"):  # computed for another scene
+                if os.path.exists(self.path(p)):
+                    os.remove(self.path(p))
+            return AmbientCache(cwd=self.cwd).warm(
+                amb, rif.octree, views, rif.resolution, options, self.workers
+            )
+
+        return self.add(Node(
+            f"ambient {amb}", [amb], [octree.name],
+            lambda: self.hash(*ambient_options(options), deps=[octree.name]), build,
+        ))
+
+    def picture_node(self, rif, name, view, options, deps):
+        picture = rif.view_picture(name)
+        x, y = rif.resolution
+        exposure = float(rif.get("EXPOSURE", "1").split()[0])
+
+        def command():
+            words = view_options(parse_view(shlex.split(view), self.cwd))
+            return ["rpict", *options, *words, "-x", str(x), "-y", str(y), rif.octree]
+
+        def build():
+            os.makedirs(os.path.dirname(self.path(picture)) or ".", exist_ok=True)
+            result = run(command(), picture, cwd=self.cwd)
+            if result.returncode == 0:
+                expose(self.path(picture), exposure)
+            return errors([result])
+
+        return self.add(Node(
+            f"rpict {picture}", [picture], deps,
+            lambda: self.hash(*command(), exposure, deps=deps), build,
+        ))
+
+    def outdated(self, node):
+        key = self.keys[node.name] = node.key()
+        missing = any(not os.path.exists(self.path(p)) for p in node.outputs)
+        return missing or self.state.get(node.name) != key
+
+    def save_state(self):
+        with open(f"{self.state_file}.tmp", "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(f"{self.state_file}.tmp", self.state_file)
+
+    def run(self, dry_run=False):
+        """Brings every node up to date, returns the error messages"""
+        done, failed, stale, msgs = set(), set(), set(), []
+        pending = dict(self.nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers or os.cpu_count()) as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if any(d in failed for d in node.deps):
+                        failed.add(name)
+                        del pending[name]
+                        msgs.append(f"{name}: not built, a dependency failed")
+                    elif all(d in done for d in node.deps):
+                        del pending[name]
+                        if dry_run:
+                            # what the dependencies would rebuild is not known yet
+                            if any(d in stale for d in node.deps) or self.outdated(node):
+                                print(name)
+                                stale.add(name)
+                            done.add(name)
+                        elif not self.outdated(node):
+                            done.add(name)
+                        else:
+                            print(name, file=sys.stderr)
+                            running[executor.submit(node.build)] = node
+                if not running:
+                    if pending and not any(
+                        all(d in done or d in failed for d in n.deps) for n in pending.values()
+                    ):
+                        raise Exception(f"dependency cycle in {', '.join(pending)}")
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    node = running.pop(future)
+                    node_msgs = future.result()
+                    if node_msgs:
+                        failed.add(node.name)
+                        msgs += node_msgs
+                    else:
+                        done.add(node.name)
+                        self.state[node.name] = self.keys[node.name]
+                        self.save_state()
+        self.octrees.save_index()
+        return msgs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rifs", nargs="+")
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("-m", "--makefile", action="append", default=[],
+                        help="Makefile of the meshes, relative to cwd")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("-n", "--dry-run", action="store_true",
+                        help="lists the targets to rebuild")
+    args = parser.parse_args(argv)
+    planner = Planner(args.cwd, workers=args.workers)
+    for m in args.makefile:
+        planner.add_makefile(m)
+    for rif in args.rifs:
+        planner.add_rif(rif)
+    msgs = planner.run(args.dry_run)
+    for msg in msgs:
+        print(msg, file=sys.stderr)
+    return 1 if msgs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Runs Radiance commands in a bounded pool
+
+Every job is its own process, so the pool only needs threads to wait on
+them; the number of jobs running at once is bounded by the number of cores.
+"""
+
+import os
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import tracing
+
+
+def run(command, stdout=None, **kwargs):
+    """Runs a command (list of arguments) and captures its output, traced
+
+    With stdout (a path, relative to cwd) the output is written to that file
+    instead; it only appears once the command succeeds. subprocess.DEVNULL
+    discards it.
+    """
+    if stdout == subprocess.DEVNULL:
+        return tracing.run(
+            command, stdout=stdout, stderr=subprocess.PIPE, text=True, **kwargs
+        )
+    if stdout is not None and kwargs.get("cwd"):
+        stdout = os.path.join(kwargs["cwd"], stdout)
+    try:
+        if stdout is None:
+            return tracing.run(command, capture_output=True, text=True, **kwargs)
+        with open(f"{stdout}.tmp", "wb") as f:
+            result = tracing.run(
+                command, stdout=f, stderr=subprocess.PIPE, text=True, **kwargs
+            )
+        if result.returncode == 0:
+            os.replace(f"{stdout}.tmp", stdout)
+        else:
+            os.remove(f"{stdout}.tmp")
+        return result
+    except OSError as e:  # e.g. the program is not installed
+        if stdout is not None and os.path.exists(f"{stdout}.tmp"):
+            os.remove(f"{stdout}.tmp")
+        return subprocess.CompletedProcess(command, 127, "", str(e))
+
+
+def run_all(commands, workers=None, outputs=None, cwd=None):
+    """Runs the commands in parallel, the results keep the commands order
+
+    outputs optionally gives the file each command writes its output to.
+    """
+    commands = list(commands)
+    if not commands:
+        return []
+    outputs = outputs or [None] * len(commands)
+    workers = min(workers or os.cpu_count() or 1, len(commands))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(partial(run, cwd=cwd), commands, outputs))
+
+
+def errors(results):
+    """Error messages of the failed jobs, in the jobs order"""
+    return [
+        f"{' '.join(r.args)}: {r.stderr.strip() or f'exit status {r.returncode}'}"
+        for r in results
+        if r.returncode != 0
+    ]
+
+
+def check(results):
+    """Raises an exception listing every failed job"""
+    msgs = errors(results)
+    if msgs:
+        raise Exception("\n".join(msgs))
+    return results
@@ -0,0 +1,152 @@
+"""Radiance input files (.rif) read the way rad reads them"""
+
+import os
+import shlex
+import subprocess
+import tempfile
+
+# rad variables; like rad, a prefix of three or more letters is accepted
+VARIABLES = [
+    "AMBFILE", "DETAIL", "EXPOSURE", "EYESEP", "illum", "INDIRECT",
+    "materials", "mkillum", "objects", "OCTREE", "oconv", "OPTFILE",
+    "PENUMBRAS", "pfilt", "PICTURE", "QUALITY", "RAWFILE", "render", "REPORT",
+    "RESOLUTION", "rvu", "scene", "UP", "VARIABILITY", "view", "ZFILE", "ZONE",
+]
+LISTS = {"illum", "materials", "mkillum", "objects", "oconv", "pfilt", "render",
+         "rvu", "scene", "view"}
+
+# rpict options of a rad command that are not render settings, with their
+# number of values; -vt<type> has none
+NOT_RENDER = {
+    "-vp": 3, "-vd": 3, "-vu": 3, "-vh": 1, "-vv": 1, "-vo": 1, "-va": 1,
+    "-vs": 1, "-vl": 1, "-vf": 1, "-x": 1, "-y": 1, "-af": 1, "-e": 1,
+    "-o": 1, "-r": 1, "-ro": 1, "-z": 1,
+}
+
+
+def rpict_options(line, cwd):
+    """Render options of an rpict command line printed by rad
+
+    The @ option files are read in place; the view, picture size, ambient
+    file, octree and output are left out.
+    """
+    words = shlex.split(line.split(">", 1)[0])[1:-1]  # without the octree
+    options, i = [], 0
+    while i < len(words):
+        w = words[i]
+        if w.startswith("@"):
+            with open(os.path.join(cwd, w[1:])) as f:
+                words[i + 1 : i + 1] = shlex.split(f.read())
+            i += 1
+        elif w.startswith("-vt"):
+            i += 1
+        elif w in NOT_RENDER:
+            i += 1 + NOT_RENDER[w]
+        else:
+            options.append(w)
+            i += 1
+    return options
+
+
+def match_variable(name):
+    """Full name of a rad variable, or None"""
+    for var in VARIABLES:
+        if name == var or (len(name) >= 3 and var.startswith(name)):
+            return var
+    return None
+
+
+class Rif:
+    """Variables of a rad input file
+
+    Paths in the file are relative to the directory rad runs in (cwd).
+    """
+
+    def __init__(self, filename, cwd=None):
+        self.filename = filename
+        self.cwd = cwd if cwd is not None else os.getcwd()
+        self.vars = {}
+        self.options = None
+        with open(filename) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if "=" not in line:
+                    continue
+                name, value = (s.strip() for s in line.split("=", 1))
+                var = match_variable(name.rstrip("+"))
+                if var is None:
+                    raise Exception(f"{filename}: unknown variable {name}")
+                if var in LISTS:
+                    self.vars.setdefault(var, []).append(value)
+                else:
+                    self.vars[var] = value
+
+    def get(self, name, default=None):
+        return self.vars.get(name, default)
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def files(self, name):
+        """Files of a list variable (scene, materials, illum, objects)"""
+        return [f for value in self.vars.get(name, []) for f in value.split()]
+
+    @property
+    def root(self):
+        """File name without extension, relative to cwd like rad uses it"""
+        return os.path.splitext(os.path.relpath(self.filename, self.cwd))[0]
+
+    @property
+    def octree(self):
+        return self.get("OCTREE", self.root + ".oct")
+
+    @property
+    def ambfile(self):
+        return self.get("AMBFILE")
+
+    @property
+    def picture(self):
+        return self.get("PICTURE", self.root)
+
+    @property
+    def resolution(self):
+        res = self.get("RESOLUTION", "512").split()
+        return int(res[0]), int(res[1] if len(res) > 1 else res[0])
+
+    @property
+    def views(self):
+        """(name, view options) of each view, named by number if unnamed"""
+        views = []
+        for i, value in enumerate(self.vars.get("view", []), 1):
+            words = value.split(None, 1)
+            if words and not words[0].startswith("-"):
+                views.append((words[0], words[1] if len(words) > 1 else ""))
+            else:
+                views.append((str(i), value))
+        return views
+
+    def view_picture(self, view):
+        """Picture file rad writes for a view"""
+        return f"{self.picture}_{view}.hdr"
+
+    def render_options(self):
+        """rpict options rad chooses for the QUALITY, INDIRECT and render settings
+
+        They are read from the rpict command rad -n prints for a picture
+        that does not exist yet, so they are the ones rad renders with.
+        """
+        if self.options is None:
+            with tempfile.TemporaryDirectory() as directory:
+                probe = os.path.join(directory, "probe.rif")
+                with open(self.filename) as f, open(probe, "w") as out:
+                    out.write(f.read())
+                    out.write(f"\nPICTURE= {os.path.join(directory, 'probe')}\n")
+                result = subprocess.run(
+                    ["rad", "-n", probe], cwd=self.cwd, capture_output=True,
+                    text=True,
+                )
+            lines = [l for l in result.stdout.splitlines() if l.startswith("rpict ")]
+            if result.returncode != 0 or not lines:
+                raise Exception(f"rad -n {self.filename}: {result.stderr.strip()}")
+            self.options = rpict_options(lines[0], self.cwd)
+        return list(self.options)
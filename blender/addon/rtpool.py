@@ -0,0 +1,188 @@
+"""Long-lived rtrace processes with the octree loaded, fed binary rays
+
+Starting rtrace and loading the octree costs more than tracing a few rays,
+so a pool keeps one rtrace per core running. Rays are NumPy arrays (n, 6)
+of origins and directions written as binary floats (-ff), in chunks small
+enough to fit in the pipes, each followed by a ray of zero direction that
+makes rtrace flush its output; the results are read straight into the
+output array. Callers are held back once enough chunks are waiting, and a
+worker that dies is restarted and its chunk traced again.
+
+    with RtracePool("scene.oct", ["-ab", "1", "-I+"]) as pool:
+        irradiance = pool.trace(rays)
+"""
+
+import os
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+
+import numpy as np
+
+CHUNK = 2048  # rays per write, 48 KiB in and at most 48 KiB out
+RETRIES = 1  # restarts of a crashed worker per chunk
+
+# floats rtrace writes per ray for each -o letter
+OUTPUT_VALUES = {
+    "o": 3, "d": 3, "v": 3, "V": 3, "w": 1, "W": 3, "l": 1, "L": 1, "c": 2,
+    "p": 3, "n": 3, "N": 3, "s": 1,
+}
+
+
+def output_values(options):
+    """Floats per ray of the -o option in rtrace options (-ov by default)"""
+    spec = "v"
+    for w in options:
+        if w.startswith("-o") and len(w) > 2:
+            spec = w[2:]
+    for c in spec:
+        if c not in OUTPUT_VALUES:
+            raise Exception(f"rtrace output -o{c} is not made of floats")
+    return sum(OUTPUT_VALUES[c] for c in spec)
+
+
+class RtraceWorker:
+    """One rtrace process, traces a chunk of rays at a time"""
+
+    def __init__(self, octree, options=(), cwd=None, binary="rtrace"):
+        self.command = [binary, "-h", "-ff", *options, octree]
+        self.cwd = cwd
+        self.values = output_values(options)
+        self.flush = np.zeros((1, 6), dtype=np.float32)  # zero direction
+        self.scratch = bytearray(4 * self.values)
+        self.process = None
+        self.stderr = deque(maxlen=20)
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command, cwd=self.cwd, stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        reader = threading.Thread(target=self.read_errors, args=(self.process.stderr,))
+        reader.daemon = True
+        reader.start()
+
+    def read_errors(self, stream):
+        for line in stream:
+            self.stderr.append(line.decode(errors="replace").rstrip())
+
+    def restart(self):
+        self.close()
+        self.start()
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+            except BrokenPipeError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+    def error(self):
+        return f"{' '.join(self.command)}: {' '.join(self.stderr) or 'exit status %s' % self.process.poll()}"
+
+    def trace(self, rays, out):
+        """Traces rays (n, 6) float32 into out (n, values) float32, in place
+
+        Returns False if rtrace died on the way.
+        """
+        try:
+            self.process.stdin.write(memoryview(rays).cast("B"))
+            self.process.stdin.write(self.flush)
+            self.process.stdin.flush()
+            view = memoryview(out).cast("B")
+            pos = 0
+            while pos < len(view):
+                n = self.process.stdout.readinto(view[pos:])
+                if not n:
+                    return False
+                pos += n
+            # the zero ray gets an empty record
+            pos, flush = 0, memoryview(self.scratch)
+            while pos < len(flush):
+                n = self.process.stdout.readinto(flush[pos:])
+                if not n:
+                    return False
+                pos += n
+            return True
+        except (BrokenPipeError, ValueError):
+            return False
+
+
+class RtracePool:
+    """rtrace workers sharing the chunks of ray arrays
+
+    At most max_pending chunks wait for a worker; trace and submit block
+    until there is room, so a fast producer cannot queue unbounded rays.
+    """
+
+    def __init__(self, octree, options=(), workers=None, cwd=None, binary="rtrace",
+                 chunk=CHUNK, max_pending=None):
+        self.octree = octree
+        self.options = list(options)
+        self.chunk = chunk
+        self.values = output_values(self.options)
+        n = workers or os.cpu_count() or 1
+        self.idle = Queue()
+        self.workers = [RtraceWorker(octree, self.options, cwd, binary) for _ in range(n)]
+        for w in self.workers:
+            self.idle.put(w)
+        self.executor = ThreadPoolExecutor(max_workers=n)
+        self.pending = threading.BoundedSemaphore(max_pending or 2 * n)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown()
+        for w in self.workers:
+            w.close()
+
+    def trace_chunk(self, rays, out):
+        worker = self.idle.get()
+        try:
+            for _ in range(RETRIES + 1):
+                if worker.trace(rays, out):
+                    return out
+                error = worker.error()
+                worker.restart()
+            raise Exception(error)
+        finally:
+            self.idle.put(worker)
+            self.pending.release()
+
+    def submit(self, rays, out=None):
+        """Starts tracing a chunk of rays, returns a future of its results"""
+        rays = np.ascontiguousarray(rays, dtype=np.float32).reshape(-1, 6)
+        if out is None:
+            out = np.empty((len(rays), self.values), dtype=np.float32)
+        self.pending.acquire()  # backpressure
+        return self.executor.submit(self.trace_chunk, rays, out)
+
+    def trace(self, rays, out=None, progress=None):
+        """Results (n, values) of rays (n, 6), traced in chunks by every worker
+
+        progress, if given, is called with the fraction of chunks done.
+        """
+        rays = np.ascontiguousarray(rays, dtype=np.float32).reshape(-1, 6)
+        if out is None:
+            out = np.empty((len(rays), self.values), dtype=np.float32)
+        futures = [
+            self.submit(rays[start : start + self.chunk], out[start : start + self.chunk])
+            for start in range(0, len(rays), self.chunk)
+        ]
+        for i, f in enumerate(futures, 1):
+            f.result()
+            if progress is not None:
+                progress(i / len(futures))
+        return out
@@ -0,0 +1,384 @@
+"""Radiance scene descriptions loaded into a compact scene graph
+
+The primitives of the .rad and .mat files, and of the ! commands they
+run, are kept in flat typed arrays: every word once in a table of words,
+and per primitive the ids of its modifier, type and name with the offsets
+of its arguments. Primitive objects are only views into the arrays, so a
+large scene costs a few integers per primitive and queries such as the
+unused or duplicated modifiers run on NumPy views of the same memory.
+
+A plain !xform or !cat of a file is read as that file; other commands run
+once and their output is kept by command line and the hashes of the files
+they read, so a scene is loaded again without running any tool.
+
+The meshes carry their materials in the .rtm (obj2mesh -a), so a material
+counts as used by a mesh when its name is stored in the .rtm, or in the
+usemtl lines of the .obj next to it. When neither can be read, the
+materials of the .mat files are taken as used by the mesh.
+
+    python scenegraph.py -C radiance scenes/pedret1/scene.rad
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+from array import array
+
+import numpy as np
+
+from cache import hash_file, new_hash
+from octree import command_files, included_files, resolve
+
+CACHE_DIR = "scene_cache"
+
+SURFACE_TYPES = {
+    "polygon", "sphere", "bubble", "cone", "cup", "cylinder", "tube", "ring",
+    "source", "instance", "mesh",
+}
+# string arguments naming other modifiers, None for all of them
+MODIFIER_ARGS = {
+    "illum": 1, "mirror": 1, "alias": 1, "antimatter": None,
+    "mixfunc": 2, "mixdata": 2, "mixpict": 2, "mixtext": 2,
+}
+
+COMMENT = re.compile(r"(?:^|(?<=\s))#.*$", re.MULTILINE)
+WORD = re.compile(r"'([^']*)'|\"([^\"]*)\"|(\S+)")
+
+
+def words(text):
+    """Words of a description, without comments and quotes"""
+    return [a or b or c for a, b, c in WORD.findall(COMMENT.sub("", text))]
+
+
+def mesh_materials(path, names):
+    """Those of names a compiled mesh uses, None when it cannot be read
+
+    obj2mesh writes the names of the materials as null terminated strings.
+    """
+    if os.path.isfile(path):
+        with open(path, "rb") as f:
+            data = f.read()
+        return {n for n in names if n.encode() + b"\0" in data}
+    obj = os.path.splitext(path)[0] + ".obj"
+    if os.path.isfile(obj):
+        with open(obj, errors="replace") as f:
+            used = {line.split()[1] for line in f if line.split()[:1] == ["usemtl"]}
+        return used & set(names)
+    return None
+
+
+def format_real(v):
+    s = repr(v)
+    return s[:-2] if s.endswith(".0") else s
+
+
+class CommandCache:
+    """Outputs of ! commands by command line and the files they read
+
+    Paths are relative to the directory the commands run in (cwd).
+    """
+
+    def __init__(self, directory=CACHE_DIR, cwd=None):
+        self.directory = directory
+        self.cwd = cwd if cwd is not None else os.getcwd()
+        self.memo = {}
+
+    def path(self, p):
+        return os.path.join(self.cwd, p)
+
+    def key(self, line, dirs):
+        h = new_hash()
+        h.update(line.encode())
+        for f in command_files(line, dirs):
+            for p in included_files(f, self.cwd):
+                hash_file(p, h)
+        return h.hexdigest()
+
+    def output(self, line, dirs):
+        """Output of a command line, run only when it or its inputs changed"""
+        key = self.key(line, dirs)
+        if key in self.memo:
+            return self.memo[key]
+        cached = self.path(os.path.join(self.directory, f"{key}.rad"))
+        if os.path.isfile(cached):
+            with open(cached) as f:
+                out = f.read()
+        else:
+            result = subprocess.run(
+                line[1:], shell=True, cwd=self.cwd, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise Exception(f"{line}: {result.stderr.strip()}")
+            out = result.stdout
+            os.makedirs(os.path.dirname(cached), exist_ok=True)
+            with open(f"{cached}.tmp", "w") as f:
+                f.write(out)
+            os.replace(f"{cached}.tmp", cached)
+        self.memo[key] = out
+        return out
+
+
+class Primitive:
+    """View of one primitive of a scene graph"""
+
+    __slots__ = ("graph", "index")
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    def _word(self, field):
+        return self.graph.words[getattr(self.graph, field)[self.index]]
+
+    @property
+    def modifier(self):
+        return self._word("modifiers")
+
+    @property
+    def type(self):
+        return self._word("types")
+
+    @property
+    def name(self):
+        return self._word("names")
+
+    @property
+    def source(self):
+        return self.graph.sources[self.graph.source[self.index]]
+
+    @property
+    def strings(self):
+        g, i = self.graph, self.index
+        start = g.arg_start[i]
+        return [g.words[w] for w in g.args[start : start + g.nstrings[i]]]
+
+    @property
+    def integers(self):
+        g, i = self.graph, self.index
+        start = g.arg_start[i] + g.nstrings[i]
+        return [g.words[w] for w in g.args[start : start + g.nintegers[i]]]
+
+    @property
+    def reals(self):
+        g, i = self.graph, self.index
+        start = g.real_start[i]
+        return list(g.reals[start : start + g.nreals[i]])
+
+    def text(self):
+        """The primitive in Radiance syntax"""
+        reals = [format_real(v) for v in self.reals]
+        return "\n".join([
+            f"{self.modifier} {self.type} {self.name}",
+            " ".join([str(len(self.strings)), *self.strings]),
+            " ".join([str(len(self.integers)), *self.integers]),
+            " ".join([str(len(reals)), *reals]),
+        ]) + "\n"
+
+    def __repr__(self):
+        return f"<Primitive {self.modifier} {self.type} {self.name}>"
+
+
+class SceneGraph:
+    """Primitives of Radiance descriptions in flat arrays"""
+
+    __slots__ = (
+        "words", "ids", "modifiers", "types", "names", "source", "arg_start",
+        "nstrings", "nintegers", "real_start", "nreals", "args", "reals",
+        "sources", "commands", "cwd",
+    )
+
+    def __init__(self, cwd=None, commands=None):
+        self.cwd = cwd if cwd is not None else os.getcwd()
+        self.commands = commands if commands is not None else CommandCache(cwd=self.cwd)
+        self.words = []  # every word once
+        self.ids = {}
+        for field in ("modifiers", "types", "names", "source", "arg_start",
+                      "nstrings", "nintegers", "real_start", "nreals", "args"):
+            setattr(self, field, array("i"))
+        self.reals = array("d")
+        self.sources = []  # files and command lines the primitives come from
+
+    def intern(self, word):
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+        return i
+
+    def add(self, modifier, type, name, strings=(), integers=(), reals=(), source=0):
+        self.modifiers.append(self.intern(modifier))
+        self.types.append(self.intern(type))
+        self.names.append(self.intern(name))
+        self.source.append(source)
+        self.arg_start.append(len(self.args))
+        self.nstrings.append(len(strings))
+        self.nintegers.append(len(integers))
+        self.args.extend(self.intern(w) for w in (*strings, *integers))
+        self.real_start.append(len(self.reals))
+        self.nreals.append(len(reals))
+        self.reals.extend(float(v) for v in reals)
+
+    def parse(self, text, source, dirs=()):
+        """Adds the primitives of a description, running its ! commands"""
+        block = []
+        for line in text.splitlines():
+            if line.startswith("!"):
+                self.parse_words(words("\n".join(block)), source)
+                block = []
+                self.expand(line, dirs)
+            else:
+                block.append(line)
+        self.parse_words(words("\n".join(block)), source)
+
+    def parse_words(self, w, source):
+        i = 0
+        while i < len(w):
+            modifier, type, name = w[i : i + 3]
+            i += 3
+            if type == "alias" and not w[i].isdigit():  # void alias new old
+                self.add(modifier, type, name, [w[i]], source=source)
+                i += 1
+                continue
+            args = []
+            for _ in range(3):
+                n = int(w[i])
+                args.append(w[i + 1 : i + 1 + n])
+                i += 1 + n
+            self.add(modifier, type, name, *args, source=source)
+
+    def expand(self, line, dirs):
+        """Adds the primitives a ! command line writes"""
+        command = line[1:].split()
+        files = command_files(line, dirs)
+        if command[0] in ("xform", "cat") and len(command) == 2 and files:
+            self.load(os.path.relpath(files[0], self.cwd))
+            return
+        self.sources.append(line)
+        self.parse(self.commands.output(line, dirs), len(self.sources) - 1, dirs)
+
+    def load(self, filename):
+        """Adds the primitives of a file, relative to cwd"""
+        path = os.path.join(self.cwd, filename)
+        with open(path, errors="replace") as f:
+            text = f.read()
+        self.sources.append(filename)
+        self.parse(text, len(self.sources) - 1, [self.cwd, os.path.dirname(path)])
+        return self
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        return Primitive(self, i % len(self))
+
+    def __iter__(self):
+        return (Primitive(self, i) for i in range(len(self)))
+
+    def array(self, field):
+        """A field as a NumPy view of its array"""
+        a = getattr(self, field)
+        return np.frombuffer(a, dtype=np.int32 if a.typecode == "i" else np.float64)
+
+    def is_modifier(self):
+        """Mask of the primitives that are materials, patterns or textures"""
+        surfaces = [self.ids[t] for t in SURFACE_TYPES if t in self.ids]
+        return ~np.isin(self.array("types"), surfaces)
+
+    def mesh_modifiers(self):
+        """Ids of the modifiers the .rtm of the meshes use, None if one is unknown"""
+        if "mesh" not in self.ids:
+            return set()
+        names = [self.words[w] for w in np.unique(self.array("names")[self.is_modifier()])]
+        used, files = set(), {}
+        for i in np.flatnonzero(self.array("types") == self.ids["mesh"]):
+            p = Primitive(self, i)
+            if not p.strings:
+                continue
+            dirs = [self.cwd, os.path.dirname(os.path.join(self.cwd, p.source))]
+            path = resolve(p.strings[0], dirs) or os.path.join(self.cwd, p.strings[0])
+            if path not in files:
+                files[path] = mesh_materials(path, names)
+            if files[path] is None:
+                return None
+            used.update(self.ids[n] for n in files[path])
+        return used
+
+    def referenced(self):
+        """Ids of the words used as modifiers, directly, as arguments or by meshes
+
+        When the materials of a mesh cannot be read, those of the .mat
+        files are all counted, as obj2mesh may have taken them.
+        """
+        used = set(np.unique(self.array("modifiers")).tolist())
+        for type, n in MODIFIER_ARGS.items():
+            if type not in self.ids:
+                continue
+            for i in np.flatnonzero(self.array("types") == self.ids[type]):
+                start = self.arg_start[i]
+                count = self.nstrings[i] if n is None else min(n, self.nstrings[i])
+                used.update(self.args[start : start + count])
+        meshes = self.mesh_modifiers()
+        if meshes is None:
+            mat = [j for j, s in enumerate(self.sources) if s.endswith(".mat")]
+            names = self.array("names")[np.isin(self.array("source"), mat)]
+            meshes = set(names.tolist())
+        used.update(meshes)
+        return np.array(sorted(used), dtype=np.int32)
+
+    def unused(self):
+        """Modifiers no primitive refers to"""
+        mask = self.is_modifier() & ~np.isin(self.array("names"), self.referenced())
+        return [Primitive(self, i) for i in np.flatnonzero(mask)]
+
+    def duplicates(self):
+        """Groups of modifiers with the same definition under other names"""
+        groups = {}
+        for i in np.flatnonzero(self.is_modifier()):
+            p = Primitive(self, i)
+            key = (p.modifier, p.type, *p.strings, "|", *p.integers, "|", *p.reals)
+            groups.setdefault(key, []).append(p)
+        return [g for g in groups.values() if len({p.name for p in g}) > 1]
+
+    def redefined(self):
+        """Modifier names defined more than once, with their definitions"""
+        names = self.array("names")[self.is_modifier()]
+        ids, counts = np.unique(names, return_counts=True)
+        return {
+            self.words[w]: [p for p in self if p.name == self.words[w] and p.type not in SURFACE_TYPES]
+            for w in ids[counts > 1]
+        }
+
+    def text(self):
+        """The whole graph in Radiance syntax, commands expanded"""
+        return "\n".join(p.text() for p in self)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("-C", "--cwd", default=".", help="directory oconv runs in")
+    parser.add_argument("-o", "--output", help="writes the expanded description")
+    args = parser.parse_args(argv)
+    graph = SceneGraph(args.cwd)
+    for f in args.files:
+        graph.load(f)
+    print(f"{len(graph)} primitives, {len(graph.words)} words, "
+          f"{len(graph.sources)} sources")
+    for p in graph.unused():
+        print(f"unused: {p.type} {p.name} ({p.source})")
+    for group in graph.duplicates():
+        print(f"duplicates: {' '.join(f'{p.name} ({p.source})' for p in group)}")
+    for name, defs in graph.redefined().items():
+        print(f"redefined: {name} in {' '.join(p.source for p in defs)}")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(graph.text())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
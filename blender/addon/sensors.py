@@ -0,0 +1,128 @@
+"""Sensor grids on faces and their illuminance, computed with rtrace -I
+
+Each triangle is split into k * k equal sub-triangles, k being its longest
+edge over the grid spacing, and a sensor is placed at the centre of each,
+raised along the face normal. The sensors are streamed to a pool of rtrace
+processes as binary floats a chunk at a time and the irradiance read back
+straight into a NumPy array, so a grid of a million points never exists
+as text.
+"""
+
+import numpy as np
+
+from falsecolor import colormap, illuminance, normalize
+from rtpool import RtracePool
+
+# rpict options rtrace does not take, with their number of values
+RPICT_ONLY = {"-ps": 1, "-pt": 1, "-pj": 1, "-pm": 1, "-pd": 1, "-t": 1, "-i": 0}
+
+
+def rtrace_options(options):
+    """rpict render options without the ones only rpict takes"""
+    out, i = [], 0
+    while i < len(options):
+        n = RPICT_ONLY.get(options[i])
+        if n is None:
+            out.append(options[i])
+            i += 1
+        else:
+            i += 1 + n
+    return out
+
+
+def subdivision(k):
+    """Barycentric weights (k * k, 3) of the centres of the sub-triangles"""
+    i, j = np.meshgrid(np.arange(k), np.arange(k), indexing="ij")
+    up = i + j <= k - 1
+    down = i + j <= k - 2
+    u = np.concatenate([i[up] + 1 / 3, i[down] + 2 / 3]) / k
+    v = np.concatenate([j[up] + 1 / 3, j[down] + 2 / 3]) / k
+    return np.stack([1 - u - v, u, v], axis=-1)
+
+
+def triangle_grid(co, tris, spacing, height=0.0):
+    """Sensors over triangles (n, 3) of vertices co, about spacing apart
+
+    Returns a dict of the points and normals (m, 3), the triangle of each
+    sensor, its barycentric weights and the face area it stands for.
+    """
+    corners = co[tris]  # (n, 3 corners, 3)
+    a, b, c = corners[:, 0], corners[:, 1], corners[:, 2]
+    cross = np.cross(b - a, c - a)
+    area = np.linalg.norm(cross, axis=1) / 2
+    edges = np.stack([b - a, c - b, a - c], axis=1)
+    k = np.maximum(1, np.ceil(np.linalg.norm(edges, axis=2).max(axis=1) / spacing))
+    k = k.astype(np.int64)
+    k[area == 0] = 0  # degenerate, no sensors
+    normal = np.divide(cross, 2 * area[:, None], out=np.zeros_like(cross),
+                       where=area[:, None] > 0)
+
+    parts = {"point": [], "normal": [], "triangle": [], "weights": [], "area": []}
+    for n in np.unique(k[k > 0]):
+        sel = np.flatnonzero(k == n)
+        w = subdivision(n)
+        points = np.einsum("mk,tkd->tmd", w, corners[sel])
+        points += height * normal[sel][:, None]
+        parts["point"].append(points.reshape(-1, 3))
+        parts["normal"].append(np.repeat(normal[sel], len(w), axis=0))
+        parts["triangle"].append(np.repeat(sel, len(w)))
+        parts["weights"].append(np.tile(w, (len(sel), 1)))
+        parts["area"].append(np.repeat(area[sel] / (n * n), len(w)))
+    empty = {"point": (0, 3), "normal": (0, 3), "triangle": (0,), "weights": (0, 3),
+             "area": (0,)}
+    return {
+        name: np.concatenate(p) if p else np.empty(empty[name]) for name, p in parts.items()
+    }
+
+
+def irradiance(points, normals, octree, options=(), cwd=None, workers=None,
+               progress=None):
+    """Irradiance (m, 3) at the points facing the normals, from rtrace -I
+
+    progress, if given, is called with the fraction done as results arrive.
+    """
+    n = len(points)
+    out = np.empty((n, 3), dtype=np.float32)
+    options = ["-I+", *rtrace_options(list(options))]
+    with RtracePool(octree, options, workers, cwd) as pool:
+        futures = []
+        for start in range(0, n, pool.chunk):
+            rays = np.empty((min(pool.chunk, n - start), 6), dtype=np.float32)
+            rays[:, :3] = points[start : start + pool.chunk]
+            rays[:, 3:] = normals[start : start + pool.chunk]
+            futures.append(pool.submit(rays, out[start : start + pool.chunk]))
+        for i, f in enumerate(futures, 1):
+            f.result()
+            if progress is not None:
+                progress(i / len(futures))
+    return out
+
+
+def vertex_values(values, grid, tris, nverts):
+    """Sensor values spread to the vertices by their barycentric weights
+
+    Vertices without sensors around them get NaN.
+    """
+    verts = tris[grid["triangle"]].ravel()
+    w = grid["weights"].ravel()
+    total = np.bincount(verts, w * np.repeat(values, 3), minlength=nverts)
+    weight = np.bincount(verts, w, minlength=nverts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / weight
+
+
+def heat_colors(values, scale=None, palette="def"):
+    """RGBA heat map colours of values, up to scale (their maximum by default)"""
+    if scale is None or scale <= 0:
+        scale = np.nanmax(values) if np.any(values > 0) else 1.0
+    rgb = colormap(normalize(np.nan_to_num(values), scale), palette)
+    return np.concatenate([rgb, np.ones((len(rgb), 1))], axis=1).astype(np.float32)
+
+
+def sensor_illuminance(co, tris, octree, spacing, height=0.0, options=(), cwd=None,
+                       progress=None):
+    """Grid of sensors over the triangles with the illuminance (lux) of each"""
+    grid = triangle_grid(co, tris, spacing, height)
+    rgb = irradiance(grid["point"], grid["normal"], octree, options, cwd, progress=progress)
+    grid["lux"] = illuminance(rgb)
+    return grid
@@ -185,7 +185,50 @@ class SceneSettingsRadiance(PropertyGroup):
     amb_file: StringProperty(
         name="Ambient file",
         subtype="FILE_PATH",
-        description="Ambient file that acts as a cache",
+        description="Ambient file that acts as a cache, empty for one shared by the renders of the same scene and settings",
+    )
+    tiles: IntProperty(
+        name="Tiles",
+        min=1,
+        soft_max=64,
+        default=1,
+        description="Number of tiles rendered in parallel, 1 renders the view with rad",
+    )
+    lod_triangles: IntProperty(
+        name="Preview triangles",
+        min=0,
+        soft_max=1000000,
+        default=100000,
+        description="Triangles of the decimated meshes used by the previews and the Low quality, 0 for the full meshes",
+    )
+    chunk_triangles: IntProperty(
+        name="Chunk triangles",
+        min=0,
+        soft_max=10000000,
+        default=0,
+        description="Triangles of the chunks larger meshes are split into and converted in parallel, 0 to convert every mesh whole",
+    )
+    sensor_spacing: FloatProperty(
+        name="Sensor spacing",
+        min=0.001,
+        soft_max=10,
+        default=0.5,
+        subtype="DISTANCE",
+        description="Distance between the sensors of the illuminance grid",
+    )
+    sensor_height: FloatProperty(
+        name="Sensor height",
+        soft_min=0,
+        soft_max=2,
+        default=0.01,
+        subtype="DISTANCE",
+        description="Height of the sensors above the faces",
+    )
+    sensor_scale: FloatProperty(
+        name="Heat map scale",
+        min=0,
+        default=0,
+        description="Illuminance (lux) at the top of the heat map colours, 0 for the maximum",
     )
     is_false_color: BoolProperty(
         name="False color",
@@ -0,0 +1,346 @@
+"""CIE skies computed in-process, the way gensky does
+
+The solar position (Radiance sun.c) and the sky parameters (gensky) are
+computed with NumPy over arrays of dates, times and sites, so the skies of
+a whole year come out of one pass. The descriptions are static text like
+the output of gensky, with no command left for oconv to run.
+
+    python sky.py 1 8 11:00CEST -y 1990 -a 42.1073 -o 1.8835 +s
+"""
+
+import re
+import sys
+from functools import lru_cache
+
+import numpy as np
+
+SKY_EFFICACY = 179.0  # lm/W
+SUN_EFFICACY = 208.0  # lm/W, illuminant B
+TURBIDITY = 2.75
+GROUND_REFLECTANCE = 0.2
+# gensky's site when -a, -o and -m are not given (degrees, west positive)
+LATITUDE = np.degrees(0.66)
+LONGITUDE = np.degrees(2.13)
+MERIDIAN = 120.0
+
+# gensky sky types: (CIE distribution number, with sun)
+SKY_TYPES = {
+    "+s": (1, True), "-s": (1, False),
+    "-c": (2, False), "-u": (3, False),
+    "+i": (4, True), "-i": (4, False),
+}
+CLEAR, OVERCAST, UNIFORM, INTERMEDIATE = 1, 2, 3, 4
+
+# standard meridians (degrees west) of the time zones offered in the settings
+TIME_ZONES = {
+    "YST": 135, "PST": 120, "MST": 105, "CST": 90, "EST": 75, "GMT": 0,
+    "CET": -15, "EET": -30, "AST": -45, "GST": -60, "IST": -82.5, "JST": -135,
+    "NZST": -180,
+    "YDT": 120, "PDT": 105, "MDT": 90, "CDT": 75, "EDT": 60, "BST": -15,
+    "CEST": -30, "EEST": -45, "ADT": -60, "GDT": -75, "IDT": -97.5, "JDT": -150,
+    "NZDT": -195,
+}
+TIME = re.compile(r"^(\+?)(\d+(?:\.\d*)?)(?::(\d+))?([A-Za-z]*)$")
+
+MONTH_DAYS = np.array([0, 31, 59, 90, 120, 151, 181, 212, 243, 273, 304, 334])
+NORMSC = {  # polynomials of the normalization factor (E0*F2/L0)
+    CLEAR: [2.766521, 0.547665, -0.369832, 0.009237, 0.059229],
+    INTERMEDIATE: [3.5556, -2.7152, -1.3081, 1.0660, 0.60227],
+}
+
+
+def jdate(month, day):
+    """Day of the year"""
+    return MONTH_DAYS[np.asarray(month) - 1] + day
+
+
+def stadj(jd, meridian, longitude):
+    """Solar time adjustment (hours), meridian and longitude in radians west"""
+    return (
+        0.170 * np.sin((4 * np.pi / 373) * (jd - 80))
+        - 0.129 * np.sin((2 * np.pi / 355) * (jd - 8))
+        + 12 * (meridian - longitude) / np.pi
+    )
+
+
+def sdec(jd):
+    """Solar declination (radians)"""
+    return 0.4093 * np.sin((2 * np.pi / 368) * (jd - 81))
+
+
+def julian_days(year, month, day, hour):
+    """Days since J2000.0 (noon of 1 January 2000) of a date and an hour in UT"""
+    year, month, day = (np.asarray(v, dtype=int) for v in (year, month, day))
+    a = (14 - month) // 12
+    y = year + 4800 - a
+    m = month + 12 * a - 3
+    jdn = day + (153 * m + 2) // 5 + 365 * y + y // 4 - y // 100 + y // 400 - 32045
+    return jdn - 2451545 + (hour - 12) / 24
+
+
+def almanac_sun(days):
+    """(solar declination (radians), equation of time (hours)) at J2000.0 days
+
+    The low precision solar coordinates of the Astronomical Almanac, good to
+    about 0.01 degrees from 1950 to 2050.
+    """
+    mean_longitude = 280.460 + 0.9856474 * days
+    g = np.radians(357.528 + 0.9856003 * days)
+    ecliptic = np.radians(mean_longitude + 1.915 * np.sin(g) + 0.020 * np.sin(2 * g))
+    obliquity = np.radians(23.439 - 4e-7 * days)
+    ra = np.degrees(np.arctan2(np.cos(obliquity) * np.sin(ecliptic), np.cos(ecliptic)))
+    eot = ((mean_longitude - ra + 180) % 360 - 180) / 15
+    return np.arcsin(np.sin(obliquity) * np.sin(ecliptic)), eot
+
+
+def salt(latitude, sd, st):
+    """Solar altitude (radians) from the declination and the solar time"""
+    return np.arcsin(
+        np.sin(latitude) * np.sin(sd)
+        - np.cos(latitude) * np.cos(sd) * np.cos(st * (np.pi / 12))
+    )
+
+
+def sazi(latitude, sd, st):
+    """Solar azimuth (radians from south, positive west)"""
+    return -np.arctan2(
+        np.cos(sd) * np.sin(st * (np.pi / 12)),
+        -np.cos(latitude) * np.sin(sd)
+        - np.sin(latitude) * np.cos(sd) * np.cos(st * (np.pi / 12)),
+    )
+
+
+def sun_position(month, day, hour, latitude, longitude, meridian, solar=False,
+                 year=None):
+    """(solar time, altitude, azimuth) with the angles in degrees
+
+    Longitudes and meridians are in degrees west, like gensky takes them;
+    with solar the hour is already a solar time. With a year the declination
+    and the equation of time of the Astronomical Almanac are used, as gensky
+    -y does, else the yearly approximations of gensky.
+    """
+    hour = np.asarray(hour, dtype=float)
+    if year is None:
+        jd = jdate(month, day)
+        sd = sdec(jd)
+        st = np.where(
+            solar, hour, hour + stadj(jd, np.radians(meridian), np.radians(longitude))
+        )
+    else:
+        # a solar time is taken as the mean solar time to find the UT
+        ut = hour + np.where(solar, longitude, meridian) / 15
+        sd, eot = almanac_sun(julian_days(year, month, day, ut))
+        st = np.where(solar, hour, ut - longitude / 15 + eot)
+    lat = np.radians(latitude)
+    return st, np.degrees(salt(lat, sd, st)), np.degrees(sazi(lat, sd, st))
+
+
+def normsc(sky, altitude):
+    x = (altitude - np.pi / 4) / (np.pi / 4)
+    return np.polynomial.polynomial.polyval(x, NORMSC[sky])
+
+
+def sky_values(sky_type, altitude, azimuth, turbidity=TURBIDITY,
+               ground_reflectance=GROUND_REFLECTANCE):
+    """gensky values for solar angles in degrees, as a dict of arrays
+
+    sundir, zenith (zenith brightness), ground (ground brightness), F2,
+    solar (sun radiance, 0 when there is no sun) and the clamped altitude.
+    """
+    sky, sun = SKY_TYPES[sky_type]
+    cloudy = sky in (OVERCAST, UNIFORM)
+    altitude = np.radians(np.asarray(altitude, dtype=float))
+    if not cloudy:  # as gensky, the sun is kept 3 degrees off the zenith
+        altitude = np.minimum(altitude, np.radians(87.0))
+    azimuth = np.radians(np.asarray(azimuth, dtype=float))
+    sundir = np.stack(
+        [
+            -np.sin(azimuth) * np.cos(altitude),
+            -np.cos(azimuth) * np.cos(altitude),
+            np.sin(altitude),
+        ],
+        axis=-1,
+    )
+    z = sundir[..., 2]
+
+    F2 = np.zeros_like(altitude)
+    if sky == UNIFORM:
+        normfactor = np.ones_like(altitude)
+    elif sky == OVERCAST:
+        normfactor = np.full_like(altitude, 0.777778)
+    elif sky == CLEAR:
+        F2 = 0.274 * (0.91 + 10.0 * np.exp(-3.0 * (np.pi / 2 - altitude)) + 0.45 * z * z)
+        normfactor = normsc(sky, altitude) / F2 / np.pi
+    else:
+        F2 = (2.739 + 0.9891 * np.sin(0.3119 + 2.6 * altitude)) * np.exp(
+            -(np.pi / 2 - altitude) * (0.4441 + 1.48 * altitude)
+        )
+        normfactor = normsc(sky, altitude) / F2 / np.pi
+
+    if cloudy:
+        zenith = 8.6 * z + 0.123
+    else:
+        with np.errstate(over="ignore", invalid="ignore"):
+            zenith = (1.376 * turbidity - 1.81) * np.tan(altitude) + 0.38
+        if sky == INTERMEDIATE:
+            zenith = (zenith + 8.6 * z + 0.123) / 2.0
+    zenith = np.maximum(zenith, 0.0) * 1000.0 / SKY_EFFICACY
+
+    ground = zenith * normfactor
+    solar = np.zeros_like(altitude)
+    if sun:
+        up = z > 0.0
+        solar = np.where(
+            up, 1.5e9 / SUN_EFFICACY * (1.147 - 0.147 / np.maximum(z, 0.16)), 0.0
+        )
+        if sky == INTERMEDIATE:
+            solar *= 0.15  # gensky's fudge factor
+        ground = ground + 6e-5 / np.pi * solar * np.maximum(z, 0.0)
+    ground = ground * ground_reflectance
+    return {
+        "sky": sky, "sundir": sundir, "zenith": zenith, "ground": ground, "F2": F2,
+        "solar": solar, "altitude": np.degrees(altitude),
+    }
+
+
+def describe(values, i=(), comments=()):
+    """Sky description text of one element of sky_values"""
+    sundir = values["sundir"][i]
+    lines = [f"# {c}" for c in comments]
+    lines.append(f"# Ground ambient level: {values['ground'][i]:.1f}")
+    solar = values["solar"][i]
+    if solar > 0:
+        lines += [
+            "", "void light solar", "0", "0", f"3 {solar:.2e} {solar:.2e} {solar:.2e}",
+            "", "solar source sun", "0", "0",
+            f"4 {sundir[0]:f} {sundir[1]:f} {sundir[2]:f} 0.5",
+        ]
+    lines += ["", "void brightfunc skyfunc", "2 skybr skybright.cal", "0"]
+    if values["sky"] in (OVERCAST, UNIFORM):
+        lines.append(f"3 {values['sky']} {values['zenith'][i]:.2e} {values['ground'][i]:.2e}")
+    else:
+        lines.append(
+            f"7 {values['sky']} {values['zenith'][i]:.2e} {values['ground'][i]:.2e} "
+            f"{values['F2'][i]:.2e} {sundir[0]:f} {sundir[1]:f} {sundir[2]:f}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def parse_time(text):
+    """(hour, solar, meridian or None) of a gensky time like 11:30CEST or +12"""
+    m = TIME.match(text)
+    if m is None:
+        raise Exception(f"bad time {text}")
+    solar, hour, minutes, zone = m.groups()
+    hour = float(hour) + (float(minutes) / 60 if minutes else 0.0)
+    if zone and zone.upper() not in TIME_ZONES:
+        raise Exception(f"unknown time zone {zone}")
+    return hour, solar == "+", TIME_ZONES[zone.upper()] if zone else None
+
+
+@lru_cache(maxsize=1024)
+def gensky(month, day, time, latitude, longitude, sky_type="+s", year=None,
+           meridian=None):
+    """Sky description for a date and a gensky time string, like gensky
+
+    Longitudes and meridians are in degrees west. With a year the more
+    accurate solar position of gensky -y is computed.
+    """
+    hour, solar, zone = parse_time(time)
+    if meridian is None:
+        meridian = zone if zone is not None else 15 * round(longitude / 15)
+    st, altitude, azimuth = sun_position(
+        month, day, hour, latitude, longitude, meridian, solar, int(year) if year else None
+    )
+    values = sky_values(sky_type, altitude, azimuth)
+    args = f"{month} {day} {time}" + (f" -y {year}" if year else "")
+    args += f" -a {latitude} -o {longitude} {sky_type}"
+    return describe(values, (), [
+        f"gensky {args}",
+        f"Local solar time: {float(st):.2f}",
+        f"Solar altitude and azimuth: {float(altitude):.1f} {float(azimuth):.1f}",
+    ])
+
+
+def skies(times, latitude, longitude, meridian, sky_type="+s"):
+    """Sky descriptions at many datetimes (local standard time of meridian)"""
+    month = np.array([t.month for t in times])
+    day = np.array([t.day for t in times])
+    hour = np.array([t.hour + t.minute / 60 for t in times])
+    st, altitude, azimuth = sun_position(month, day, hour, latitude, longitude, meridian)
+    values = sky_values(sky_type, altitude, azimuth)
+    return [describe(values, i) for i in range(len(times))]
+
+
+def parse_gensky(words):
+    """gensky arguments as a dict of gensky() arguments
+
+    The site defaults to the one of gensky, and so does the meridian of a
+    time without a time zone.
+    """
+    args = {
+        "month": int(words[0]), "day": int(words[1]), "time": words[2],
+        "latitude": LATITUDE, "longitude": LONGITUDE, "sky_type": "+s", "year": None,
+        "meridian": None,
+    }
+    options = {"-a": "latitude", "-o": "longitude", "-m": "meridian", "-y": "year"}
+    i = 3
+    while i < len(words):
+        if words[i] in SKY_TYPES:
+            args["sky_type"] = words[i]
+            i += 1
+        elif words[i] in options:
+            name = options[words[i]]
+            args[name] = words[i + 1] if name == "year" else float(words[i + 1])
+            i += 2
+        else:
+            raise Exception(f"unsupported gensky option {words[i]}")
+    if args["meridian"] is None and parse_time(args["time"])[2] is None:
+        args["meridian"] = MERIDIAN
+    return args
+
+
+def gensky_command(words):
+    """Sky description of the arguments of a gensky command line"""
+    return gensky(**parse_gensky(words))
+
+
+def skybright(values, dirs):
+    """Sky radiance in directions (n, 3) for each sky of sky_values (k, n)
+
+    The brightness function of skybright.cal, with the ground brightness
+    blended in below the horizon.
+    """
+    dz = dirs[:, 2]
+    sundir = np.atleast_2d(values["sundir"])
+    a2 = np.atleast_1d(values["zenith"])[:, None]
+    a3 = np.atleast_1d(values["ground"])[:, None]
+    a4 = np.atleast_1d(values["F2"])[:, None]
+    cosgamma = np.clip(sundir @ dirs.T, -1.0, 1.0)
+    gamma = np.arccos(cosgamma)
+    zt = np.arccos(np.clip(sundir[:, 2:3], -1.0, 1.0))
+    eta = np.arccos(np.clip(np.maximum(dz, 0.01), -1.0, 1.0))
+    sky = values["sky"]
+    if sky == CLEAR:
+        with np.errstate(divide="ignore", over="ignore"):
+            horizon = np.where(dz > 0.01, 1.0 - np.exp(-0.32 / np.maximum(dz, 0.01)), 1.0)
+        br = a2 * (0.91 + 10 * np.exp(-3 * gamma) + 0.45 * cosgamma**2) * horizon / a4
+    elif sky == OVERCAST:
+        br = a2 * (1 + 2 * dz) / 3
+    elif sky == UNIFORM:
+        br = np.broadcast_to(a2, gamma.shape)
+    else:
+        br = (
+            a2
+            * ((1.35 * np.sin(5.631 - 3.59 * eta) + 3.12) * np.sin(4.396 - 2.6 * zt)
+               + 6.37 - eta)
+            / 2.326
+            * np.exp(gamma * -0.563 * ((2.629 - eta) * (1.562 - zt) + 0.812))
+            / a4
+        )
+    up, down = (dz + 1.01) ** 10, (dz + 1.01) ** -10
+    return (up * br + down * a3) / (up + down)
+
+
+if __name__ == "__main__":
+    sys.stdout.write(gensky_command(sys.argv[1:]))
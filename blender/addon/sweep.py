@@ -0,0 +1,273 @@
+"""Renders the views of a rad input file over a range of dates and times
+
+The scene is split into the static geometry, compiled once into a frozen
+octree, and the sky dependent part (the gensky sky and anything modified
+by skyfunc, like the window illums). Every time step only writes a new sky,
+adds it with oconv -i and queues its rpict jobs to the worker pool.
+Finished pictures are recorded in a checkpoint with their date and time,
+view and a hash of the scene and settings, so an interrupted sweep
+resumes where it stopped and a picture of another date or scene is
+rendered again. The ambient files are the shared ones of ambient.py,
+named by the content of each octree and the ambient settings.
+
+    python sweep.py scenes/gwindow1/scene.rif --start 1990-08-01T11:00 \\
+        --end 1990-08-01T15:00 --step 60
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from ambient import AmbientCache
+from cache import new_hash
+from octree import OctreeCache, command_files, mentions
+from pool import errors, run, run_all
+from rif import Rif
+from sky import gensky_command
+
+SKY_WORDS = ("gensky", "gendaylit", "skyfunc")
+TIME = re.compile(r"^(\+?)(\d{1,2}(?::\d{2})?)([A-Z]*)$")
+
+
+def split_scene(rif):
+    """Splits the scene into (geometry lines, sky template, sky dependent lines)
+
+    The sky template holds the lines of the description with the gensky
+    command, to be rewritten for each time step.
+    """
+    geometry, sky, dependent = [], None, []
+    for name in rif.files("materials") + rif.files("scene"):
+        path = rif.path(name)
+        block = []
+        with open(path) as f:
+            lines = f.read().splitlines()
+        for line in lines:
+            if not line.startswith("!"):
+                block.append(line)
+                continue
+            files = command_files(line, [rif.cwd, os.path.dirname(path)])
+            words = line.split()
+            if "gensky" in line or any(mentions(p, ("gensky",), rif.cwd) for p in files):
+                if words[0] in ("!gensky", "!gendaylit"):
+                    sky = [line]
+                elif words[0] in ("!xform", "!cat") and len(words) == 2 and files:
+                    with open(files[0]) as f:
+                        sky = f.read().splitlines()
+                else:
+                    raise Exception(f"{path}: cannot sweep the sky of {line}")
+            elif any(mentions(p, SKY_WORDS, rif.cwd) for p in files):
+                dependent.append(line)
+            else:
+                geometry.append(line)
+        text = "\n".join(block)
+        if any(w in text for w in SKY_WORDS):
+            dependent.append(text)
+        else:
+            geometry.append(text)
+    if sky is None:
+        raise Exception(f"{rif.filename} has no gensky sky")
+    return geometry, sky, dependent
+
+
+def gensky_at(args, when):
+    """gensky arguments moved to another date and time"""
+    words = list(args)
+    m = TIME.match(words[2])
+    if m is None:
+        raise Exception(f"cannot change the date of gensky {' '.join(args)}")
+    solar, _, zone = m.groups()
+    words[0:3] = [str(when.month), str(when.day), f"{solar}{when:%H:%M}{zone}"]
+    if "-y" in words:
+        words[words.index("-y") + 1] = str(when.year)
+    return words
+
+
+def sky_at(template, when):
+    """Static sky description lines for a date and time
+
+    The sky of the template is either a gensky command or the output of
+    one, starting with its "# gensky ..." comment.
+    """
+    lines, skip = [], 0
+    for i, l in enumerate(template):
+        if i < skip:
+            continue
+        words = l.split()
+        if words[:1] == ["!gensky"]:
+            lines += gensky_command(gensky_at(words[1:], when)).splitlines()
+        elif words[:2] == ["#", "gensky"]:
+            lines += gensky_command(gensky_at(words[2:], when)).splitlines()
+            # the old output ends with the arguments of skyfunc
+            skip = template.index("void brightfunc skyfunc", i) + 4
+        else:
+            lines.append(l)
+    return lines
+
+
+def picture_at(picture, stamp, view):
+    """Picture of a view at a time stamp, replacing the time in its name"""
+    head, tail = os.path.split(picture)
+    tail = re.sub(r"\d{1,2}:\d{2}\w*$", "", tail)
+    return os.path.join(head, f"{tail}{stamp}_{view}.hdr")
+
+
+def time_steps(start, end, step):
+    """Datetimes from start to end (inclusive) every step minutes"""
+    steps = []
+    when = start
+    while when <= end:
+        steps.append(when)
+        when += timedelta(minutes=step)
+    return steps
+
+
+class Sweep:
+    """Time sweep of the views of a rif file"""
+
+    def __init__(self, rif, start, end, step=60, directory="sweep", workers=None):
+        self.rif = rif
+        self.steps = time_steps(start, end, step)
+        self.directory = directory
+        self.workers = workers
+        self.checkpoint = os.path.join(directory, "checkpoint.json")
+        self.octrees = OctreeCache(cwd=rif.cwd)
+        self.ambient = AmbientCache(cwd=rif.cwd)
+        self.key = None
+        self.done = {}  # picture -> record
+        if os.path.isfile(self.rif.path(self.checkpoint)):
+            with open(self.rif.path(self.checkpoint)) as f:
+                done = json.load(f)["done"]
+            if isinstance(done, dict):  # older checkpoints only list pictures
+                self.done = done
+
+    def stamp(self, when):
+        one_day = self.steps[0].date() == self.steps[-1].date()
+        return f"{when:%H:%M}" if one_day else f"{when:%m-%d_%H:%M}"
+
+    def picture(self, when, view):
+        return picture_at(self.rif.picture, self.stamp(when), view)
+
+    def scene_key(self):
+        """Hash of the scene content and of the render settings"""
+        if self.key is None:
+            h = new_hash()
+            files = self.rif.files("materials") + self.rif.files("scene")
+            h.update(self.octrees.key(files).encode())
+            self.octrees.save_index()
+            x, y = self.rif.resolution
+            h.update(" ".join([*self.rif.render_options(), str(x), str(y)]).encode())
+            self.key = h.hexdigest()
+        return self.key
+
+    def record(self, when, view):
+        """What a picture is rendered from"""
+        return {
+            "time": when.isoformat(), "view": view, "options": dict(self.rif.views)[view],
+            "scene": self.scene_key(),
+        }
+
+    def save_checkpoint(self):
+        path = self.rif.path(self.checkpoint)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"done": self.done}, f, indent=1, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+    def write(self, name, lines):
+        with open(self.rif.path(os.path.join(self.directory, name)), "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return os.path.join(self.directory, name)
+
+    def jobs(self):
+        """(time, view, picture) of the pictures still to render
+
+        A picture is done when it exists and its record matches.
+        """
+        return [
+            (when, view, self.picture(when, view))
+            for when in self.steps
+            for view, _ in self.rif.views
+            if self.done.get(self.picture(when, view)) != self.record(when, view)
+            or not os.path.isfile(self.rif.path(self.picture(when, view)))
+        ]
+
+    def render(self, command, picture, amb):
+        with self.ambient.lock(amb):  # not evicted while in use
+            return run(command, picture, cwd=self.rif.cwd)
+
+    def run(self):
+        """Renders the pending pictures, returns the error messages"""
+        os.makedirs(self.rif.path(self.directory), exist_ok=True)
+        pending = self.jobs()
+        if not pending:
+            return []
+        geometry, sky, dependent = split_scene(self.rif)
+
+        # static geometry, compiled once
+        geometry_oct = os.path.join(self.directory, "geometry.oct")
+        rad = self.write("geometry.rad", geometry)
+        result = run(["oconv", "-f", rad], geometry_oct, cwd=self.rif.cwd)
+        if result.returncode != 0:
+            return errors([result])
+
+        # one sky (plus sky dependent objects) per time step
+        times = sorted({when for when, _, _ in pending})
+        options = self.rif.render_options()
+        octs, ambs, commands = {}, {}, []
+        for when in times:
+            name = self.stamp(when).replace(":", "")
+            rad = self.write(f"sky{name}.rad", sky_at(sky, when) + dependent)
+            octs[when] = os.path.join(self.directory, f"scene{name}.oct")
+            commands.append(["oconv", "-i", geometry_oct, rad])
+            # the ambient values only hold for the content of this octree
+            key = self.octrees.key([os.path.join(self.directory, "geometry.rad"), rad])
+            ambs[when] = self.ambient.file(key, options)
+        self.octrees.save_index()
+        results = run_all(commands, self.workers, list(octs.values()), self.rif.cwd)
+        msgs = errors(results)
+        failed = {when for when, r in zip(times, results) if r.returncode != 0}
+
+        views = dict(self.rif.views)
+        x, y = self.rif.resolution
+        with ThreadPoolExecutor(max_workers=self.workers or os.cpu_count()) as executor:
+            futures = {}
+            for when, view, picture in pending:
+                if when in failed:
+                    continue
+                command = ["rpict"] + options + ["-af", ambs[when], "-x", str(x), "-y", str(y)]
+                command += views[view].split() + [octs[when]]
+                future = executor.submit(self.render, command, picture, ambs[when])
+                futures[future] = (when, view, picture)
+            for future in as_completed(futures):
+                result = future.result()
+                if result.returncode == 0:
+                    when, view, picture = futures[future]
+                    self.done[picture] = self.record(when, view)
+                    self.save_checkpoint()
+                else:
+                    msgs += errors([result])
+        return msgs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rif")
+    parser.add_argument("--start", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--end", required=True, type=datetime.fromisoformat)
+    parser.add_argument("--step", type=int, default=60, help="minutes")
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("-d", "--directory", default="sweep")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    rif = Rif(os.path.join(args.cwd, args.rif), args.cwd)
+    msgs = Sweep(rif, args.start, args.end, args.step, args.directory, args.workers).run()
+    for msg in msgs:
+        print(msg, file=sys.stderr)
+    return 1 if msgs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
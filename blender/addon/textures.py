@@ -0,0 +1,34 @@
+"""Blender images converted to Radiance HDR textures, cached by content"""
+
+import os
+
+import numpy as np
+
+from cache import hash_image
+from hdr import write_hdr
+
+TEXTURE_DIR = "textures"
+
+
+def image_pixels(image):
+    """Linear float RGB pixels of a Blender image, top row first"""
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    image.pixels.foreach_get(pixels)
+    rgb = pixels.reshape(height, width, image.channels)[::-1]
+    rgb = rgb[..., :3] if image.channels >= 3 else np.repeat(rgb[..., :1], 3, axis=2)
+    if not image.is_float and image.colorspace_settings.name == "sRGB":
+        rgb = np.where(
+            rgb <= 0.04045, rgb / 12.92, ((rgb + 0.055) / 1.055) ** 2.4
+        ).astype(np.float32)
+    return rgb
+
+
+def text2hdr(image, directory=TEXTURE_DIR):
+    """Returns the cached HDR of image (without the .hdr extension)"""
+    path = os.path.join(directory, hash_image(image).hexdigest())
+    if not os.path.isfile(f"{path}.hdr"):
+        os.makedirs(directory, exist_ok=True)
+        write_hdr(f"{path}.tmp", image_pixels(image))
+        os.replace(f"{path}.tmp", f"{path}.hdr")
+    return path
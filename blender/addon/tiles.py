@@ -0,0 +1,229 @@
+"""Renders the views of a rad input file in tiles, one rpict per core
+
+Each tile is a shifted sub-view (-vs/-vl) of the full view with the same
+view point, rendered at a fraction of the resolution. All the tiles share
+the ambient file of the scene, warmed first with a low resolution pass, so
+the indirect calculation is not repeated per tile. The tiles are stitched
+into one picture at the resolution rpict picks for the rif RESOLUTION,
+with the VIEW of the full view and the rif EXPOSURE. It is not the
+picture rad writes: rad may render a larger picture and reduce it with
+pfilt, where the tiles are rendered at the final resolution.
+
+    python tiles.py scenes/pedret1/scene.rif -n 16
+"""
+
+import argparse
+import math
+import os
+import shlex
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import numpy as np
+
+from ambient import AmbientCache, warm_rif
+from hdr import Header, read_hdr, write_hdr
+from pool import errors, run
+from rif import Rif
+
+VIEW_VALUES = {
+    "-vp": 3, "-vd": 3, "-vu": 3, "-vh": 1, "-vv": 1, "-vo": 1, "-va": 1,
+    "-vs": 1, "-vl": 1,
+}
+VIEW_DEFAULTS = {
+    "-vt": "v", "-vp": [0.0, 0.0, 0.0], "-vd": [0.0, 1.0, 0.0], "-vu": [0.0, 0.0, 1.0],
+    "-vh": 45.0, "-vv": 45.0, "-vo": 0.0, "-va": 0.0, "-vs": 0.0, "-vl": 0.0,
+}
+
+
+def parse_view(words, cwd="."):
+    """View options as a dict, -vf files are read in place"""
+    view = dict(VIEW_DEFAULTS)
+    i = 0
+    while i < len(words):
+        w = words[i]
+        if w == "-vf":
+            with open(os.path.join(cwd, words[i + 1])) as f:
+                view.update(parse_view(f.read().split()[1:], cwd))
+            i += 2
+        elif w.startswith("-vt"):
+            view["-vt"] = w[3]
+            i += 1
+        elif w in VIEW_VALUES:
+            n = VIEW_VALUES[w]
+            values = [float(v) for v in words[i + 1 : i + 1 + n]]
+            view[w] = values if n > 1 else values[0]
+            i += 1 + n
+        else:
+            i += 1
+    return view
+
+
+def view_options(view):
+    """The view as rpict options"""
+    words = [f"-vt{view['-vt']}"]
+    for opt in VIEW_VALUES:
+        value = view[opt]
+        words.append(opt)
+        words += [f"{v:g}" for v in value] if isinstance(value, list) else [f"{value:g}"]
+    return words
+
+
+def image_size(view, angle):
+    """Size on the image plane of a view angle (degrees)"""
+    if view["-vt"] == "v":
+        return 2 * math.tan(math.radians(angle) / 2)
+    if view["-vt"] == "l":
+        return angle
+    raise Exception(f"cannot split -vt{view['-vt']} views in tiles")
+
+
+def sub_angle(view, angle, fraction):
+    """View angle of a fraction of the image plane"""
+    if view["-vt"] == "v":
+        return math.degrees(2 * math.atan(math.tan(math.radians(angle) / 2) * fraction))
+    return angle * fraction
+
+
+def resolution(view, x, y):
+    """Picture size rpict chooses for square pixels, like its normaspect"""
+    aspect = image_size(view, view["-vv"]) / image_size(view, view["-vh"])
+    if x * aspect > y:
+        x = int(y / aspect + 0.5)
+    else:
+        y = int(x * aspect + 0.5)
+    return x, y
+
+
+def grid(n):
+    """(columns, rows) of about n tiles, as square as possible"""
+    rows = int(math.sqrt(n))
+    while n % rows:
+        rows -= 1
+    return n // rows, rows
+
+
+def splits(n, parts):
+    """Sizes of parts of n pixels, the leftover pixels going to the first ones"""
+    return [n // parts + (k < n % parts) for k in range(parts)]
+
+
+def tile_view(view, x, y, left, bottom, width, height):
+    """Sub-view of a width by height tile of an x by y picture
+
+    left and bottom are the pixels before the tile, from the lower left
+    corner. The shifts are in sizes of the tile's own image plane.
+    """
+    fx, fy = width / x, height / y
+    tile = dict(view)
+    tile["-vh"] = sub_angle(view, view["-vh"], fx)
+    tile["-vv"] = sub_angle(view, view["-vv"], fy)
+    tile["-vs"] = (view["-vs"] + (left + width / 2) / x - 0.5) / fx
+    tile["-vl"] = (view["-vl"] + (bottom + height / 2) / y - 0.5) / fy
+    return tile
+
+
+def stitch(pictures):
+    """Joins the tile pictures, lists of rows from the bottom, into one array"""
+    bands = [np.concatenate([read_hdr(p)[0] for p in row], axis=1) for row in pictures]
+    return np.concatenate(bands[::-1], axis=0)
+
+
+class TiledRender:
+    """Tiled rendering of the views of a rif file"""
+
+    def __init__(self, rif, tiles, directory="tiles", workers=None):
+        self.rif = rif
+        self.columns, self.rows = grid(tiles)
+        self.directory = directory
+        self.workers = workers
+
+    def run_tiles(self, name, commands, outputs):
+        """Runs the tile commands, reporting the progress like rpict -t"""
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.workers or os.cpu_count()) as executor:
+            futures = [
+                executor.submit(run, c, o, cwd=self.rif.cwd) for c, o in zip(commands, outputs)
+            ]
+            for n, _ in enumerate(as_completed(futures), 1):
+                hours = (time.time() - start) / 3600
+                print(
+                    f"{name}: {100 * n / len(futures):.2f}% after {hours:.3f}r hours",
+                    file=sys.stderr,
+                    flush=True,
+                )
+        return [f.result() for f in futures]
+
+    def render_view(self, name, options, amb):
+        """Renders and stitches one view, returns the error messages"""
+        view = parse_view(shlex.split(options), self.rif.cwd)
+        x, y = resolution(view, *self.rif.resolution)
+        columns, rows = min(self.columns, x), min(self.rows, y)
+        widths, heights = splits(x, columns), splits(y, rows)
+        render = self.rif.render_options()
+        if amb:
+            render += ["-af", amb]
+        commands, outputs = [], []
+        for j, height in enumerate(heights):
+            for i, width in enumerate(widths):
+                tile = tile_view(view, x, y, sum(widths[:i]), sum(heights[:j]), width, height)
+                outputs.append(os.path.join(self.directory, f"{name}_{i}_{j}.hdr"))
+                # -pa 0: rpict keeps the tile size, the pixels are already square
+                commands.append(
+                    ["rpict", *render, *view_options(tile), "-x", str(width),
+                     "-y", str(height), "-pa", "0", self.rif.octree]
+                )
+        msgs = errors(self.run_tiles(name, commands, outputs))
+        if msgs:
+            return msgs
+
+        paths = [self.rif.path(p) for p in outputs]
+        rgb = stitch([paths[j * columns : (j + 1) * columns] for j in range(rows)])
+        _, first = read_hdr(paths[0])
+        lines = [l for l in first.lines if not l.startswith("VIEW=")]
+        lines.append(f"VIEW= {' '.join(view_options(view))}")
+        exposure = float(self.rif.get("EXPOSURE", "1").split()[0])
+        if exposure != 1:  # as pfilt does for rad
+            rgb *= exposure
+            lines.append(f"EXPOSURE={exposure:g}")
+        write_hdr(self.rif.path(self.rif.view_picture(name)), rgb, Header(lines))
+        for p in paths:
+            os.remove(p)
+        return []
+
+    def run(self):
+        """Renders every view, returns the error messages"""
+        os.makedirs(self.rif.path(self.directory), exist_ok=True)
+        amb = self.rif.ambfile
+        if amb:
+            msgs = warm_rif(self.rif, self.workers)
+        else:  # rad only builds the octree
+            rad = ["rad", "-v", "0", os.path.abspath(self.rif.filename)]
+            msgs = errors([run(rad, cwd=self.rif.cwd)])
+        if msgs:
+            return msgs
+        with AmbientCache(cwd=self.rif.cwd).lock(amb) if amb else nullcontext():
+            for name, options in self.rif.views:
+                msgs += self.render_view(name, options, amb)
+        return msgs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rif")
+    parser.add_argument("-n", "--tiles", type=int, default=os.cpu_count())
+    parser.add_argument("-C", "--cwd", default=".", help="directory rad runs in")
+    parser.add_argument("-d", "--directory", default="tiles")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+    rif = Rif(os.path.join(args.cwd, args.rif), args.cwd)
+    msgs = TiledRender(rif, args.tiles, args.directory, args.workers).run()
+    for msg in msgs:
+        print(msg, file=sys.stderr)
+    return 1 if msgs else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""Timings of the export and render stages, written as a Chrome trace
+
+With RADIANCE_TRACE set to a .json file, the stages of the operators and
+of script.py, and the commands they run, are recorded: the arguments of
+each command, the size of the files among them, its exit status and the
+peak memory (RSS) of the process, read with os.wait4. The events are
+written in the Chrome trace format, shown on a timeline by
+chrome://tracing and ui.perfetto.dev, with a table of the time and memory
+per stage next to it (.txt). The helper scripts started with the variable
+set add their events to the same file; remove it to start a new trace.
+
+    RADIANCE_TRACE=trace.json blender -b scene.blend -P script.py
+
+Outside Blender, enable("trace.json") turns it on.
+"""
+
+import atexit
+import fcntl
+import functools
+import json
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ENV = "RADIANCE_TRACE"
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024  # bytes of ru_maxrss
+
+
+def now():
+    """Microseconds, on the same clock in every process"""
+    return time.time_ns() // 1000
+
+
+def command_words(command):
+    if not isinstance(command, str):
+        return [str(w) for w in command]
+    try:
+        return shlex.split(command)
+    except ValueError:
+        return command.split()
+
+
+def input_sizes(words, cwd=None):
+    """Sizes of the existing files among the words of a command"""
+    sizes = {}
+    for w in words[1:]:
+        path = os.path.join(cwd or "", w)
+        if not w.startswith("-") and os.path.isfile(path):
+            sizes[w] = os.path.getsize(path)
+    return sizes
+
+
+def summary(events):
+    """Table of the count, total and longest time and peak RSS of each stage"""
+    rows = {}
+    for e in events:
+        row = rows.setdefault((e["cat"], e["name"]), [0, 0, 0, 0, 0])
+        row[0] += 1
+        row[1] += e["dur"]
+        row[2] = max(row[2], e["dur"])
+        row[3] = max(row[3], e["args"].get("peak_rss", 0))
+        row[4] += e["args"].get("exit", 0) != 0 or "error" in e["args"]
+    lines = [f"{'':8} {'name':24} {'count':>6} {'total s':>9} {'max s':>8} "
+             f"{'RSS MiB':>8} {'failed':>6}"]
+    for (cat, name), (count, total, longest, rss, failed) in sorted(
+        rows.items(), key=lambda item: -item[1][1]
+    ):
+        lines.append(f"{cat:8} {name[:24]:24} {count:6d} {total / 1e6:9.3f} "
+                     f"{longest / 1e6:8.3f} {rss / (1 << 20):8.1f} {failed:6d}")
+    return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Events of the stages and processes of this process, None disables it"""
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.events = []
+        self.lock = threading.Lock()
+        self.threads = {}
+
+    @property
+    def enabled(self):
+        return self.filename is not None
+
+    def add(self, name, category, start, **args):
+        end = now()
+        with self.lock:
+            tid = self.threads.setdefault(threading.get_ident(), len(self.threads))
+            self.events.append({
+                "name": name, "cat": category, "ph": "X", "ts": start,
+                "dur": end - start, "pid": os.getpid(), "tid": tid, "args": args,
+            })
+
+    @contextmanager
+    def stage(self, name, **args):
+        """Records the time spent in a with block"""
+        if not self.enabled:
+            yield
+            return
+        start = now()
+        try:
+            yield
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            self.add(name, "stage", start, **args)
+
+    def begin(self, command, cwd=None):
+        """What end records of a command, taken before it starts"""
+        words = command_words(command)
+        return {
+            "name": os.path.basename(words[0]) if words else "",
+            "command": " ".join(words),
+            "cwd": cwd,
+            "inputs": input_sizes(words, cwd) if self.enabled else {},
+            "start": now(),
+        }
+
+    def end(self, begun, status, usage):
+        """Records a command reaped by os.wait4, returns its exit code"""
+        returncode = os.waitstatus_to_exitcode(status)
+        if self.enabled:
+            self.add(
+                begun["name"], "process", begun["start"], command=begun["command"],
+                cwd=begun["cwd"], inputs=begun["inputs"],
+                input_bytes=sum(begun["inputs"].values()), exit=returncode,
+                peak_rss=usage.ru_maxrss * RSS_UNIT,
+            )
+        return returncode
+
+    def run(self, command, capture_output=False, **kwargs):
+        """subprocess.run, recording the command when enabled
+
+        Only the arguments of pool.run are handled: no input, no timeout.
+        """
+        if not self.enabled:
+            return subprocess.run(command, capture_output=capture_output, **kwargs)
+        if capture_output:
+            kwargs["stdout"] = kwargs["stderr"] = subprocess.PIPE
+        begun = self.begin(command, kwargs.get("cwd"))
+        process = subprocess.Popen(command, **kwargs)
+        outputs = [None, None]
+
+        def read(i, stream):
+            outputs[i] = stream.read()
+            stream.close()
+
+        readers = [
+            threading.Thread(target=read, args=(i, stream))
+            for i, stream in enumerate((process.stdout, process.stderr)) if stream is not None
+        ]
+        for r in readers:
+            r.start()
+        for r in readers:
+            r.join()
+        # Popen would reap it without its resource usage
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = self.end(begun, status, usage)
+        return subprocess.CompletedProcess(command, process.returncode, *outputs)
+
+    def system(self, command):
+        """os.system, recording the command when enabled"""
+        if not self.enabled:
+            return os.system(command)
+        return self.run(command, shell=True).returncode
+
+    def poll(self, process, begun):
+        """process.poll, recording the command once it exits when enabled"""
+        if not self.enabled or process.returncode is not None:
+            return process.poll()
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid == 0:
+            return None
+        process.returncode = self.end(begun, status, usage)
+        return process.returncode
+
+    def save(self):
+        """Merges the events into the trace file and writes its summary"""
+        if not self.enabled:
+            return
+        with self.lock:
+            events = list(self.events)
+        with open(f"{self.filename}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            merged = []
+            try:
+                with open(self.filename) as f:
+                    merged = json.load(f)["traceEvents"]
+            except (OSError, ValueError, KeyError):
+                pass
+            # the events of an earlier save of this process are replaced
+            merged = [e for e in merged if e.get("pid") != os.getpid()] + events
+            with open(f"{self.filename}.tmp", "w") as f:
+                json.dump({"traceEvents": merged, "displayTimeUnit": "ms"}, f)
+            os.replace(f"{self.filename}.tmp", self.filename)
+            with open(f"{os.path.splitext(self.filename)[0]}.txt", "w") as f:
+                f.write(summary(merged))
+
+
+TRACER = Tracer()
+
+
+def enable(filename):
+    """Starts recording into filename, as RADIANCE_TRACE does
+
+    The processes started afterwards record into the same file.
+    """
+    if not TRACER.enabled:
+        atexit.register(TRACER.save)
+    TRACER.filename = os.environ[ENV] = os.path.abspath(filename)
+
+
+if os.environ.get(ENV):
+    enable(os.environ[ENV])
+
+
+def traced(name):
+    """Decorator recording each call as a stage"""
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with TRACER.stage(name):
+                return f(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+stage = TRACER.stage
+run = TRACER.run
+system = TRACER.system
+save = TRACER.save
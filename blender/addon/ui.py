@@ -92,6 +92,8 @@ class RAD_PT_Render(bpy.types.Panel):
         row.prop(radiance, "indirect")
         row = layout.row()
         row.prop(radiance, "resolution")
+        row = layout.row()
+        row.prop(radiance, "tiles")
 
         row = layout.row()
         row.prop(radiance, "quality")
@@ -103,12 +105,22 @@ class RAD_PT_Render(bpy.types.Panel):
         row.prop(radiance, "is_false_color")
         row.prop(radiance, "exposure")
         row = layout.row()
+        row.prop(radiance, "lod_triangles")
+        row.prop(radiance, "chunk_triangles")
+        row = layout.row()
 
         row.operator("radiance.export", text="Export")
         row = layout.row()
         row.operator("radiance.preview", text="Preview")
         row.operator("radiance.render", text="Render")
 
+        row = layout.row()
+        row.prop(radiance, "sensor_spacing")
+        row.prop(radiance, "sensor_height")
+        row = layout.row()
+        row.prop(radiance, "sensor_scale")
+        row.operator("radiance.sensors", text="Sensors")
+
 
 class RAD_PT_Material(bpy.types.Panel):
     """Creates a Panel to specify in pysical units
@@ -0,0 +1,139 @@
+"""Radiance xform transforms computed in Python
+
+The -t/-rx/-ry/-rz/-s/-mx/-my/-mz arguments of xform are composed into a
+single 4x4 matrix (column vectors, applied left to right as xform does) and
+written back as the shortest equivalent argument list.  Everything here is a
+pure function, so it can be called from several threads at once.
+"""
+
+import math
+from functools import lru_cache
+
+IDENTITY = ((1, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1))
+EPSILON = 1e-9
+
+
+def multiply(a, b):
+    """Returns the matrix product a @ b"""
+    return tuple(
+        tuple(sum(a[i][k] * b[k][j] for k in range(4)) for j in range(4))
+        for i in range(4)
+    )
+
+
+def translate(x, y, z):
+    return ((1, 0, 0, x), (0, 1, 0, y), (0, 0, 1, z), (0, 0, 0, 1))
+
+
+def scale(s):
+    return ((s, 0, 0, 0), (0, s, 0, 0), (0, 0, s, 0), (0, 0, 0, 1))
+
+
+def mirror(axis):
+    m = [list(r) for r in IDENTITY]
+    m[axis][axis] = -1
+    return tuple(tuple(r) for r in m)
+
+
+def rotate(axis, degrees):
+    c = math.cos(math.radians(degrees))
+    s = math.sin(math.radians(degrees))
+    if axis == 0:
+        return ((1, 0, 0, 0), (0, c, -s, 0), (0, s, c, 0), (0, 0, 0, 1))
+    if axis == 1:
+        return ((c, 0, s, 0), (0, 1, 0, 0), (-s, 0, c, 0), (0, 0, 0, 1))
+    return ((c, -s, 0, 0), (s, c, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1))
+
+
+@lru_cache(maxsize=4096)
+def parse_xform(args):
+    """Composes an xform argument string into one matrix"""
+    tokens = args.split()
+    m = IDENTITY
+    i = 0
+    while i < len(tokens):
+        opt = tokens[i]
+        if opt == "-t":
+            step = translate(*map(float, tokens[i + 1 : i + 4]))
+            i += 4
+        elif opt in ("-rx", "-ry", "-rz"):
+            step = rotate("xyz".index(opt[2]), float(tokens[i + 1]))
+            i += 2
+        elif opt == "-s":
+            step = scale(float(tokens[i + 1]))
+            i += 2
+        elif opt in ("-mx", "-my", "-mz"):
+            step = mirror("xyz".index(opt[2]))
+            i += 1
+        else:
+            raise Exception(f"xform option {opt} is not a transform")
+        m = multiply(step, m)
+    return m
+
+
+def is_similarity(m, tolerance=1e-6):
+    """Checks that a matrix is a rotation, a uniform scale and a translation
+
+    The columns of its 3x3 part must be orthogonal and of the same length,
+    which is all xform can express.
+    """
+    cols = [[m[i][j] for i in range(3)] for j in range(3)]
+    norms = [math.sqrt(sum(v * v for v in c)) for c in cols]
+    if max(norms) - min(norms) > tolerance * max(norms):
+        return False
+    for a, b in ((0, 1), (0, 2), (1, 2)):
+        dot = sum(x * y for x, y in zip(cols[a], cols[b]))
+        if abs(dot) > tolerance * norms[a] * norms[b]:
+            return False
+    return True
+
+
+def xform_args(m):
+    """Decomposes a similarity matrix into xform arguments"""
+    if not is_similarity(m):
+        raise Exception("xform matrix has a non-uniform scale or a shear")
+    det = (
+        m[0][0] * (m[1][1] * m[2][2] - m[1][2] * m[2][1])
+        - m[0][1] * (m[1][0] * m[2][2] - m[1][2] * m[2][0])
+        + m[0][2] * (m[1][0] * m[2][1] - m[1][1] * m[2][0])
+    )
+    if abs(det) < EPSILON:
+        raise Exception("xform matrix is singular")
+    s = abs(det) ** (1 / 3)
+    r = [[m[i][j] / s for j in range(3)] for i in range(3)]
+    args = []
+    if det < 0:  # mirror x first, then rotate
+        args.append("-mx")
+        for i in range(3):
+            r[i][0] = -r[i][0]
+
+    # r = Rz(c) @ Ry(b) @ Rx(a)
+    sb = max(-1.0, min(1.0, -r[2][0]))
+    b = math.asin(sb)
+    if abs(math.cos(b)) > EPSILON:
+        a = math.atan2(r[2][1], r[2][2])
+        c = math.atan2(r[1][0], r[0][0])
+    else:
+        a = 0.0
+        c = math.atan2(-r[0][1], r[1][1])
+    for opt, angle in (("-rx", a), ("-ry", b), ("-rz", c)):
+        if abs(angle) > EPSILON:
+            args.append(f"{opt} {math.degrees(angle):.9g}")
+    if abs(s - 1) > EPSILON:
+        args.append(f"-s {s:.9g}")
+    t = (m[0][3], m[1][3], m[2][3])
+    if any(abs(v) > EPSILON for v in t):
+        args.append(f"-t {t[0]:.9g} {t[1]:.9g} {t[2]:.9g}")
+    return " ".join(args)
+
+
+@lru_cache(maxsize=4096)
+def normalize_xform(args):
+    """Rewrites an xform argument string in its shortest equivalent form"""
+    return xform_args(parse_xform(args)) if args.strip() else ""
+
+
+def mesh_primitive(mod, id, file_rtm, xform=""):
+    """Radiance mesh primitive of file_rtm transformed by the xform arguments"""
+    strings = f"{file_rtm} {normalize_xform(xform)}".split()
+    return f"{mod} mesh {id}\n{len(strings)} {' '.join(strings)}\n0\n0\n"
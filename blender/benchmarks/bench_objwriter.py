@@ -0,0 +1,128 @@
+"""Triangles per second of the OBJ export, objwriter against the operator
+
+write_obj is timed on the arrays of a synthetic grid (UVs, 3 materials),
+which needs NumPy only. Inside Blender the same grid is also built as an
+object and exported with ob2obj and with the OBJ export operator the
+addon used before, selecting the object alone:
+
+    python benchmarks/bench_objwriter.py --sizes 20000 80000 320000
+    blender -b -P benchmarks/bench_objwriter.py -- --sizes 20000 80000 320000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, "..", "addon"))
+
+from objwriter import ob2obj, write_obj  # noqa: E402
+
+try:
+    import bpy
+except ImportError:
+    bpy = None
+
+MATERIALS = ["red", "green", "blue"]
+
+
+def grid(triangles):
+    """Vertices and quads of a square grid of about that many triangles"""
+    k = max(1, int((triangles / 2) ** 0.5))
+    x, y = np.meshgrid(np.arange(k + 1), np.arange(k + 1), indexing="ij")
+    co = np.stack([x.ravel(), y.ravel(), np.zeros(x.size)], axis=1).astype(np.float32)
+    i = (np.arange(k)[:, None] * (k + 1) + np.arange(k)).ravel()
+    quads = np.stack([i, i + k + 1, i + k + 2, i + 1], axis=1)
+    return co, quads
+
+
+def grid_arrays(triangles):
+    """Mesh arrays of the grid, as mesh_arrays reads them"""
+    co, quads = grid(triangles)
+    tri_verts = quads[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3).astype(np.int32)
+    n = len(tri_verts)
+    tri_loops = np.arange(n * 3, dtype=np.int32).reshape(-1, 3)
+    return {
+        "co": co,
+        "normal": np.tile(np.float32([0, 0, 1]), (n * 3, 1)),
+        "uv": co[tri_verts.ravel(), :2] / co.max(),
+        "tri_verts": tri_verts,
+        "tri_loops": tri_loops,
+        "tri_mat": (np.arange(n) // 2 % len(MATERIALS)).astype(np.int32),
+    }
+
+
+def grid_object(triangles):
+    """Blender object of the grid, with a UV layer and 3 material slots"""
+    co, quads = grid(triangles)
+    mesh = bpy.data.meshes.new("grid")
+    mesh.from_pydata(co.tolist(), [], quads.tolist())
+    mesh.uv_layers.new()
+    for name in MATERIALS:
+        mesh.materials.append(bpy.data.materials.get(name) or bpy.data.materials.new(name))
+    mesh.polygons.foreach_set(
+        "material_index", np.arange(len(quads)) % len(MATERIALS)
+    )
+    ob = bpy.data.objects.new("grid", mesh)
+    bpy.context.scene.collection.objects.link(ob)
+    return ob
+
+
+def export_operator(ob, filename):
+    """The export of obj2rad before objwriter"""
+    bpy.ops.object.select_all(action="DESELECT")
+    ob.select_set(True)
+    if hasattr(bpy.ops.export_scene, "obj"):  # removed in Blender 4
+        bpy.ops.export_scene.obj(
+            filepath=filename, use_selection=True, axis_forward="Y", axis_up="Z"
+        )
+    else:
+        bpy.ops.wm.obj_export(
+            filepath=filename, export_selected_objects=True, forward_axis="Y", up_axis="Z"
+        )
+    ob.select_set(False)
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    f(*args)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[20000, 80000, 320000])
+    # blender passes its own arguments before "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if argv is None and "--" in sys.argv else argv
+    args = parser.parse_args(argv)
+
+    print(f"{'export':12} {'triangles':>10} {'s':>8} {'triangles/s':>12} {'file MiB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "grid.obj")
+
+        def report(name, triangles, seconds):
+            print(f"{name:12} {triangles:10d} {seconds:8.3f} {triangles / seconds:12.0f} "
+                  f"{os.path.getsize(filename) / (1 << 20):9.2f}")
+
+        for n in args.sizes:
+            arrays = grid_arrays(n)
+            triangles = len(arrays["tri_verts"])
+            report("write_obj", triangles, timed(write_obj, filename, arrays, MATERIALS))
+            if bpy is None:
+                continue
+            ob = grid_object(n)
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+            report("ob2obj", triangles, timed(ob2obj, ob, depsgraph, filename))
+            report("operator", triangles, timed(export_operator, ob, filename))
+            mesh = ob.data
+            bpy.data.objects.remove(ob)
+            bpy.data.meshes.remove(mesh)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,83 @@
+"""Time and peak memory of the Scene and Material writers by scene size
+
+Scene (script.py) and Material (operators.py) stream their primitives to a
+buffered file, so the time should grow linearly with the number of
+primitives and the peak memory (traced by tracemalloc) stay at about the
+size of the buffer. Both modules import bpy, so it runs inside Blender:
+
+    blender -b -P benchmarks/bench_writers.py -- --sizes 10000 40000 160000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, ".."))
+sys.path.append(os.path.join(HERE, "..", "addon"))
+
+from operators import Material  # noqa: E402
+from script import Scene  # noqa: E402
+
+
+def scene_plastic(filename, n):
+    with Scene(filename) as s:
+        for i in range(n):
+            s.addMaterialPlastic(f"mat{i}", 0.5, 0.4, 0.3, 0.02, 0.05)
+
+
+def scene_mesh(filename, n):
+    with Scene(filename) as s:
+        for i in range(n):
+            s.addMeshRtm(f"mesh{i}", f"mat{i}", f"mesh{i}.rtm", f"-t {i} 0 0")
+
+
+def material_plastic(filename, n):
+    input = SimpleNamespace(color=(0.5, 0.4, 0.3), spec=0.02, rough=0.05)
+    with Material(filename) as m:
+        for i in range(n):
+            m.addMaterialPlastic(f"mat{i}", input)
+
+
+CASES = {
+    "Scene.addMaterialPlastic": scene_plastic,
+    "Scene.addMeshRtm": scene_mesh,
+    "Material.addMaterialPlastic": material_plastic,
+}
+
+
+def measure(write, filename, n):
+    """(seconds, peak traced bytes) of writing n primitives"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    write(filename, n)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 40000, 160000])
+    # blender passes its own arguments before "--"
+    argv = sys.argv[sys.argv.index("--") + 1:] if argv is None and "--" in sys.argv else argv
+    args = parser.parse_args(argv)
+
+    print(f"{'writer':28} {'primitives':>10} {'s':>8} {'us/prim':>8} {'peak MiB':>9} {'file MiB':>9}")
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "scene.rad")
+        for name, write in CASES.items():
+            for n in args.sizes:
+                seconds, peak = measure(write, filename, n)
+                print(f"{name:28} {n:10d} {seconds:8.3f} {seconds / n * 1e6:8.2f} "
+                      f"{peak / (1 << 20):9.2f} {os.path.getsize(filename) / (1 << 20):9.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
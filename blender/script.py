@@ -1,90 +1,102 @@
 import bpy
 import os
+import sys
 from mathutils import Vector
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "addon"))
+from objwriter import ob2obj
+from octree import OctreeCache
+from pool import check, run_all
+from sky import gensky
+from tracing import stage, system, traced
+from xform import mesh_primitive
+
+
+BUFFER_SIZE = 1 << 20
+
 
 class Scene:
-    """Holds the radiance scene definitions"""
+    """Holds the radiance scene definitions
+
+    The primitives are streamed to a buffered file handle (or to any sink
+    with a write method) as they are added, so the scene is never held in
+    memory as a whole.
+    """
 
-    def __init__(self, filename):
+    def __init__(self, filename, sink=None):
         self.filename = filename
-        self.content = ""
+        self.file = sink if sink is not None else open(
+            filename, "w", buffering=BUFFER_SIZE
+        )
+        self.owned = sink is None  # a sink given by the caller is left open
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def write(self, s):
+        self.file.write(s)
 
     def save(self):
-        f = open(self.filename, "w")
-        f.write(self.content)
-        f.close()
+        if self.owned:
+            self.file.close()
+        elif hasattr(self.file, "flush"):
+            self.file.flush()
 
     # Material defintions
     def addMaterialLight(self, id, r, g, b):
-        self.content += f"void light {id} \n0 \n0 \n3 {r} {g} {b}\n"
-        self.content += "\n"
+        self.write(f"void light {id} \n0 \n0 \n3 {r} {g} {b}\n\n")
 
     def addMaterialGlass(self, id, r, g, b):
-        self.content += f"void glass {id} \n0 \n0 \n3 {r} {g} {b}\n"
-        self.content += "\n"
+        self.write(f"void glass {id} \n0 \n0 \n3 {r} {g} {b}\n\n")
 
     def addMaterialPlastic(self, id, r, g, b, specular=0.0, roughness=0.0):
-        self.content += f"void plastic {id} \n0 \n0 \n5 {r} {g} {b} \
-            {specular} {roughness}\n"
-        self.content += "\n"
+        self.write(
+            f"void plastic {id} \n0 \n0 \n5 {r} {g} {b} {specular} {roughness}\n\n"
+        )
 
     def addMaterialColorTexture(self, id, textureHdr, specular=0, roughness=0):
-        self.content += f"void colorpict {id + '_map'} \n7 red green blue \
-            {textureHdr} . frac(Lu)  frac(Lv) \n0 \n0"
-        self.content += "\n"
-        self.content += f"{id + '_map'} plastic {id} \n0 \n0 \n5 1 1 1 \
-            {specular} {roughness}\n"
-        self.content += "\n"
+        self.write(
+            f"void colorpict {id + '_map'} \n7 red green blue "
+            f"{textureHdr} . frac(Lu)  frac(Lv) \n0 \n0\n"
+        )
+        self.write(
+            f"{id + '_map'} plastic {id} \n0 \n0 \n5 1 1 1 {specular} {roughness}\n\n"
+        )
 
     # Geometry definitions
     def addMeshRtm(self, id, mat, file_rtm, xform=""):
-        s = f"{mat} mesh {id} \n1 {file_rtm} \n0 \n0 \n"
-        s += "\n"
-        f = open("tmp.rad", "w")
-        f.write(s)
-        f.close()
-
-        if xform:
-            command = f"xform {xform} tmp.rad > tmp.rad"
-            os.system(command)
-        f = open("tmp.rad")
-        self.content += f.read()
-        f.close()
-
-        command = f"rm tmp.rad"
-        os.system(command)
+        self.write(mesh_primitive(mat, id, file_rtm, xform) + "\n")
 
     def addSky(self, latitude, longitude, day, month, hour, year=""):
-        self.content += f"!gensky {month} {day} {hour} -a {latitude} -o \
-            {longitude}"
-        self.content += f" -y {year}\n\n" if year != "" else "\n\n"
+        self.write(gensky(month, day, hour, latitude, longitude, "+s", year or None))
+        self.write("\n")
 
-        self.content += f"skyfunc glow sky_glow \n0 \n0 \n4 .9 .9 1.15 0\n"
-        self.content += f"sky_glow source sky \n0 \n0 \n4 0 0 1 180\n"
-        self.content += f"skyfunc glow ground_glow \n0 \n0 \n4 1.4 .9 .6 0\n"
-        self.content += f"ground_glow source ground \n0 \n0 \n4 0 0 -1 180\n"
+        self.write(f"skyfunc glow sky_glow \n0 \n0 \n4 .9 .9 1.15 0\n")
+        self.write(f"sky_glow source sky \n0 \n0 \n4 0 0 1 180\n")
+        self.write(f"skyfunc glow ground_glow \n0 \n0 \n4 1.4 .9 .6 0\n")
+        self.write(f"ground_glow source ground \n0 \n0 \n4 0 0 -1 180\n")
 
 
+@traced("blend2mesh")
 def blend2mesh(materials, *argv):
     """Converts the blender scene meshes to radiance meshes"""
-    bpy.ops.object.select_all(action="DESELECT")
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    commands = []
     for arg in argv:
         ob = bpy.data.objects[arg]
         if ob.type == "MESH":
-            ob.select_set(True)
-            bpy.ops.export_scene.obj(
-                filepath=f"{ob.name}.obj",
-                use_selection=True,
-                axis_forward="Y",
-                axis_up="Z",
+            with stage("obj export", object=ob.name):
+                ob2obj(ob, depsgraph, f"{ob.name}.obj", ob.matrix_world)
+            commands.append(
+                ["obj2mesh", "-a", materials, f"{ob.name}.obj", f"{ob.name}.rtm"]
             )
-
-            command = f"obj2mesh -a {materials} {ob.name}.obj {ob.name}.rtm"
-            os.system(command)
-            ob.select_set(False)
         else:
             raise Exception(f"{ob} is not a Blender mesh")
+    with stage("mesh conversion", meshes=len(commands)):
+        check(run_all(commands))
 
 
 def objview(*argv):
@@ -92,7 +104,7 @@ def objview(*argv):
     command = f"objview"
     for arg in argv:
         command += f" {arg}"
-    os.system(command)
+    system(command)
 
 
 def cam2view(camera):
@@ -114,18 +126,18 @@ def cam2view(camera):
 
 def rad_interact(view, *argv):
     """Runs Radiance rvu program"""
-    command = f"oconv {' '.join(argv)} > scene.oct"
-    os.system(command)
-    command = f"rvu -vf {view} -ab 4 scene.oct"
-    os.system(command)
+    with stage("octree"):
+        octree = OctreeCache().get(argv)
+    command = f"rvu -vf {view} -ab 4 {octree}"
+    system(command)
 
 
 def rad_image(view, *argv):
     """Runs Radiance rpict program"""
-    command = f"oconv {' '.join(argv)} > scene.oct"
-    os.system(command)
-    command = f"rpict -vf {view} -ab 4 scene.oct > output.hdr"
-    os.system(command)
+    with stage("octree"):
+        octree = OctreeCache().get(argv)
+    command = f"rpict -vf {view} -ab 4 {octree} > output.hdr"
+    system(command)
 
 
 def main():
@@ -141,12 +153,17 @@ def main():
     s = Scene("geometry.rad")
     s.addMeshRtm("pedret1", "void", "pedret2.rtm")
     s.addMeshRtm("gwindow", "void", "windows.rtm")
-    s.addSky(42.10745931228419, 1.8836540623509863, 1, 8, "16:00CEST", 1990)
     s.save()
     # objview(s.filename)
 
+    # the sky has a file of its own, so a new date keeps the geometry octree
+    sky = Scene("sky.rad")
+    sky.addSky(42.10745931228419, 1.8836540623509863, 1, 8, "16:00CEST", 1990)
+    sky.save()
+
     view = cam2view("Door")
-    rad_interact(view, s.filename)
+    rad_interact(view, s.filename, sky.filename)
 
 
-main()
+if __name__ == "__main__":
+    main()
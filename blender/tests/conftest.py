@@ -0,0 +1,24 @@
+import os
+import stat
+import sys
+
+import pytest
+
+# the addon modules import each other by name, as Blender loads them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addon"))
+
+
+@pytest.fixture
+def programs(tmp_path, monkeypatch):
+    """install(name, script) puts a stand-in program first on the PATH"""
+    bin = tmp_path / "bin"
+    bin.mkdir()
+    monkeypatch.setenv("PATH", f"{bin}{os.pathsep}{os.environ['PATH']}")
+
+    def install(name, script):
+        path = bin / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+        return str(path)
+
+    return install
@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+from cache import Manifest, hash_materials
+
+
+def test_empty_slots_hash():
+    assert hash_materials([None]) == hash_materials([None])
+    assert hash_materials([None, None]) != hash_materials([None])
+
+
+def test_manifest_round_trip(tmp_path):
+    filename = str(tmp_path / "scene.manifest")
+    manifest = Manifest(filename)
+    assert manifest.changed("mesh", "materials", "a")
+    manifest.set("mesh", materials="a", chunks=2)
+    manifest.save()
+    manifest = Manifest(filename)
+    assert not manifest.changed("mesh", "materials", "a")
+    assert manifest.get("mesh", "chunks") == 2
+    assert manifest.get("other", "chunks", 0) == 0
+
+
+def test_failed_chunk_fails_its_group(tmp_path):
+    manifest = Manifest(str(tmp_path / "scene.manifest"))
+    mesh = {"mesh": "m", "materials": "a", "chunks": 2}
+    conversions = [
+        (("wall", "chunks"), "wall", mesh), (("wall", "chunks"), "wall", mesh),
+        (("wall", "lod"), "wall", {"lod": "l"}),
+        # other values, the same keys
+        (("floor", "chunks"), "floor", {**mesh, "mesh": "f"}),
+    ]
+    results = [SimpleNamespace(returncode=r) for r in (0, 1, 0, 0)]
+    manifest.converted(conversions, results)
+    assert manifest.objects == {"wall": {"lod": "l"}, "floor": {**mesh, "mesh": "f"}}
@@ -0,0 +1,15 @@
+import numpy as np
+
+from falsecolor import falsecolor_picture
+from hdr import Header, write_hdr
+
+
+def test_exposure_is_undone(tmp_path):
+    rgb = np.random.default_rng(1).uniform(0, 5, (40, 60, 3)).astype(np.float32)
+    write_hdr(str(tmp_path / "plain.hdr"), rgb)
+    # as pfilt -e 4 writes it
+    write_hdr(str(tmp_path / "exposed.hdr"), rgb * 4, Header(["EXPOSURE=4"]))
+    for name in ("plain", "exposed"):
+        falsecolor_picture(str(tmp_path / f"{name}.hdr"), str(tmp_path / f"{name}.png"),
+                           scale=1000, background=str(tmp_path / f"{name}.hdr"))
+    assert (tmp_path / "plain.png").read_bytes() == (tmp_path / "exposed.png").read_bytes()
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from hdr import Header, read_hdr, read_rgbe, rgbe_decode, rgbe_encode, write_hdr
+
+
+def picture(height=20, width=30):
+    rng = np.random.default_rng(0)
+    rgb = rng.uniform(0, 100, (height, width, 3)).astype(np.float32)
+    rgb[:, :10] = [1.5, 2.5, 3.5]  # long runs
+    rgb[0, 0] = 0
+    return rgb
+
+
+@pytest.mark.parametrize("rle", [True, False])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_round_trip(tmp_path, rle, mmap):
+    rgb = picture()
+    filename = str(tmp_path / "p.hdr")
+    write_hdr(filename, rgb, Header(["VIEW= -vtv -vh 45", "EXPOSURE=2"]), rle=rle)
+    out, header = read_hdr(filename, mmap)
+    assert out.dtype == np.float32 and out.shape == rgb.shape
+    # RGBE keeps 8 bits of mantissa of the largest channel
+    assert np.all(np.abs(out - rgb) <= rgb.max(axis=-1, keepdims=True) / 128)
+    assert header.view == "-vtv -vh 45" and header.exposure == 2
+    assert header.resolution == "-Y 20 +X 30"
+    rgbe, _ = read_rgbe(filename, mmap)
+    np.testing.assert_array_equal(rgbe, rgbe_encode(rgb))
+
+
+def test_decode_is_float32():
+    rgbe = rgbe_encode(picture())
+    assert rgbe_decode(rgbe).dtype == np.float32
+    np.testing.assert_array_equal(rgbe_encode(rgbe_decode(rgbe)), rgbe)
+
+
+def test_orientation(tmp_path):
+    rgb = picture(4, 12)
+    flat = rgbe_encode(rgb)
+    filename = tmp_path / "p.hdr"
+    # bottom row first, right to left
+    filename.write_bytes(
+        b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n+Y 4 -X 12\n" + flat[::-1, ::-1].tobytes()
+    )
+    np.testing.assert_array_equal(read_rgbe(str(filename))[0], flat)
+
+
+@pytest.mark.parametrize("rle", [True, False])
+def test_truncated(tmp_path, rle):
+    filename = tmp_path / "p.hdr"
+    write_hdr(str(filename), picture(), rle=rle)
+    filename.write_bytes(filename.read_bytes()[:-50])
+    with pytest.raises(Exception, match="truncated"):
+        read_hdr(str(filename))
+
+
+def test_old_style_runs_rejected(tmp_path):
+    filename = tmp_path / "p.hdr"
+    pixels = np.array([[100, 50, 25, 130], [1, 1, 1, 29]], dtype=np.uint8)
+    filename.write_bytes(b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y 1 +X 30\n" + pixels.tobytes())
+    with pytest.raises(Exception, match="old-style"):
+        read_hdr(str(filename))
+    # as long as a flat picture, it is memory mapped
+    filename.write_bytes(
+        b"#?RADIANCE\nFORMAT=32-bit_rle_rgbe\n\n-Y 1 +X 2\n" + pixels.tobytes()
+    )
+    with pytest.raises(Exception, match="old-style"):
+        read_hdr(str(filename))
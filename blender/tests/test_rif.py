@@ -0,0 +1,43 @@
+from rif import Rif, rpict_options
+
+# as rad -n prints it for QUALITY= High, INDIRECT= 9
+RPICT = (
+    "rpict -t 60 -vf lib_view/window.vf -x 1536 -y 1536 -dp 4096 -ar 128 -ms 0.13 "
+    "-ds .1 -dj .9 -dt .05 -dc .75 -dr 3 -ss 16 -st .01 -ab 9 -af scene.amb "
+    "-aa .075 -ad 4096 -as 2048 -av 0.18 0.18 0.18 -lr 12 -lw 1e-5 -ps 1 -pt .04 "
+    "scene.oct > scene_window.unf"
+)
+OPTIONS = (
+    "-t 60 -dp 4096 -ar 128 -ms 0.13 -ds .1 -dj .9 -dt .05 -dc .75 -dr 3 -ss 16 "
+    "-st .01 -ab 9 -aa .075 -ad 4096 -as 2048 -av 0.18 0.18 0.18 -lr 12 -lw 1e-5 "
+    "-ps 1 -pt .04"
+).split()
+
+
+def test_rpict_options(tmp_path):
+    assert rpict_options(RPICT, str(tmp_path)) == OPTIONS
+    view = "rpict -vtv -vp 1 2 3 -vd 0 1 0 -vu 0 0 1 -vh 45 -vv 45 -vo 0 -va 0 -vs 0 -vl 0"
+    assert rpict_options(f"{view} -ab 1 -x 10 -y 10 s.oct > p.unf", ".") == ["-ab", "1"]
+
+
+def test_option_file(tmp_path):
+    (tmp_path / "scene.opt").write_text("-ab 2 -av .1 .1 .1\n")
+    line = "rpict -vf v.vf @scene.opt -ps 4 -x 10 -y 10 -af a.amb s.oct > p.unf"
+    assert rpict_options(line, str(tmp_path)) == "-ab 2 -av .1 .1 .1 -ps 4".split()
+
+
+def test_render_options_come_from_rad(tmp_path, programs):
+    calls = tmp_path / "calls"
+    # rad only renders a picture that does not exist
+    programs("rad", f"""#!/bin/sh
+echo "$@" >> {calls}
+grep -q "^PICTURE= .*probe" "$2" || exit 1
+echo oconv scene.rad '>' scene.oct
+echo "{RPICT}"
+echo pfilt -x /3 -y /3 scene_window.unf '>' scene_window.hdr
+""")
+    (tmp_path / "scene.rif").write_text("PICTURE= pic\nQUALITY= High\nINDIRECT= 9\n")
+    rif = Rif(str(tmp_path / "scene.rif"), str(tmp_path))
+    assert rif.render_options() == OPTIONS
+    assert rif.render_options() == OPTIONS
+    assert len(calls.read_text().splitlines()) == 1
@@ -0,0 +1,104 @@
+import stat
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from rtpool import RtracePool, output_values
+
+# Stands in for rtrace -ff -ov: echoes the origin of each ray, and answers
+# a zero direction ray with a record of zeros, as rtrace does. A ray from
+# x = -1 kills the process the first time it is seen, SLEEP slows chunks.
+RTRACE = """#!{python}
+import os, struct, sys
+crash = os.environ.get("CRASH_MARKER")
+sleep = float(os.environ.get("SLEEP", "0"))
+stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+while True:
+    data = stdin.read(24)
+    if len(data) < 24:
+        break
+    ray = struct.unpack("6f", data)
+    if ray[0] == -1 and crash and not os.path.exists(crash):
+        open(crash, "w").close()
+        sys.exit(1)
+    if ray[3:] == (0, 0, 0):
+        if sleep:
+            import time
+            time.sleep(sleep)
+        stdout.write(struct.pack("3f", 0, 0, 0))
+        stdout.flush()
+    else:
+        stdout.write(struct.pack("3f", *ray[:3]))
+"""
+
+
+@pytest.fixture
+def rtrace(tmp_path):
+    path = tmp_path / "rtrace"
+    path.write_text(RTRACE.format(python=sys.executable))
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def rays(n):
+    r = np.zeros((n, 6), dtype=np.float32)
+    r[:, 0] = np.arange(n)
+    r[:, 1] = 2 * np.arange(n)
+    r[:, 5] = 1
+    return r
+
+
+def test_output_values():
+    assert output_values([]) == 3
+    assert output_values(["-ab", "1", "-ovl"]) == 4
+    with pytest.raises(Exception):
+        output_values(["-om"])
+
+
+def test_chunks_keep_ray_order(rtrace):
+    r = rays(10000)
+    with RtracePool("scene.oct", workers=3, binary=rtrace, chunk=333) as pool:
+        out = pool.trace(r)
+    np.testing.assert_array_equal(out, r[:, :3])
+
+
+def test_progress_and_submit(rtrace):
+    fractions = []
+    with RtracePool("scene.oct", workers=2, binary=rtrace, chunk=10) as pool:
+        pool.trace(rays(35), progress=fractions.append)
+        future = pool.submit(rays(5))
+        np.testing.assert_array_equal(future.result(), rays(5)[:, :3])
+    assert fractions == [0.25, 0.5, 0.75, 1.0]
+
+
+def test_backpressure(rtrace, monkeypatch):
+    monkeypatch.setenv("SLEEP", "0.2")
+    with RtracePool("scene.oct", workers=1, binary=rtrace, max_pending=1) as pool:
+        start = time.time()
+        futures = [pool.submit(rays(4)) for _ in range(3)]
+        # the third chunk waits for room until the first one is done
+        assert time.time() - start >= 0.15
+        for f in futures:
+            f.result()
+
+
+def test_restart_after_crash(rtrace, tmp_path, monkeypatch):
+    marker = tmp_path / "crashed"
+    monkeypatch.setenv("CRASH_MARKER", str(marker))
+    r = rays(100)
+    r[50, 0] = -1
+    with RtracePool("scene.oct", workers=2, binary=rtrace, chunk=20) as pool:
+        out = pool.trace(r)
+    assert marker.exists()
+    np.testing.assert_array_equal(out, r[:, :3])
+
+
+def test_crash_every_time_raises(tmp_path):
+    path = tmp_path / "rtrace"
+    path.write_text(f"#!{sys.executable}\nimport sys\nsys.stderr.write('no octree')\nsys.exit(1)\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    with RtracePool("scene.oct", workers=1, binary=str(path)) as pool:
+        with pytest.raises(Exception, match="no octree"):
+            pool.trace(rays(10))
@@ -0,0 +1,105 @@
+import pytest
+
+from scenegraph import CommandCache, SceneGraph
+
+MATERIALS = """void plastic wall
+0
+0
+5 0.5 0.5 0.5 0 0
+
+void plastic copy  # the same as wall
+0
+0
+5 .5 .5 .5 0 0
+
+void light flame
+0
+0
+3 3.1 0.9 0
+"""
+SCENE = """wall polygon floor
+0
+0
+9 0 0 0 1 0 0 1 1 0
+
+void mesh candle
+5 candle.rtm -t 1 2 3
+0
+0
+"""
+
+
+@pytest.fixture
+def scene(tmp_path):
+    (tmp_path / "scene.mat").write_text(MATERIALS)
+    (tmp_path / "scene.rad").write_text(SCENE)
+    return tmp_path
+
+
+def load(cwd):
+    graph = SceneGraph(str(cwd))
+    graph.load("scene.mat")
+    graph.load("scene.rad")
+    return graph
+
+
+def test_text_round_trip(scene):
+    graph = load(scene)
+    assert [p.name for p in graph] == ["wall", "copy", "flame", "floor", "candle"]
+    assert graph[0].text() == "void plastic wall\n0\n0\n5 0.5 0.5 0.5 0 0\n"
+    assert graph[-1].strings == ["candle.rtm", "-t", "1", "2", "3"]
+    (scene / "all.rad").write_text(graph.text())
+    again = SceneGraph(str(scene)).load("all.rad")
+    assert again.text() == graph.text()
+
+
+def test_unused_with_compiled_mesh(scene):
+    # obj2mesh stores the names of the materials as null terminated strings
+    (scene / "candle.rtm").write_bytes(b"#?RADIANCE\n\n\x00\x01flame\x00\x02")
+    assert [p.name for p in load(scene).unused()] == ["copy"]
+
+
+def test_unused_with_obj(scene):
+    (scene / "candle.obj").write_text("v 0 0 0\nusemtl copy\nf 1 1 1\n")
+    assert [p.name for p in load(scene).unused()] == ["flame"]
+
+
+def test_unused_without_mesh_files(scene):
+    # the .mat materials may all have been given to obj2mesh
+    assert load(scene).unused() == []
+    (scene / "other.rad").write_text(MATERIALS.replace("wall", "stone"))
+    graph = load(scene)
+    graph.load("other.rad")
+    # a .rad material is not taken by obj2mesh
+    assert [p.name for p in graph.unused()] == ["stone"]
+
+
+def test_duplicates_and_redefined(scene):
+    graph = load(scene)
+    [group] = graph.duplicates()
+    assert [p.name for p in group] == ["wall", "copy"]
+    graph.load("scene.mat")
+    assert sorted(graph.redefined()) == ["copy", "flame", "wall"]
+
+
+def test_command_cache_key(scene):
+    cache = CommandCache(cwd=str(scene))
+    line = "!xform -t 1 0 0 scene.rad"
+    key = cache.key(line, [str(scene)])
+    assert cache.key(line, [str(scene)]) == key
+    assert cache.key("!xform -t 2 0 0 scene.rad", [str(scene)]) != key
+    (scene / "scene.rad").write_text(SCENE.replace("1 2 3", "1 2 4"))
+    assert cache.key(line, [str(scene)]) != key
+
+
+def test_command_output_is_cached(scene, monkeypatch):
+    line = "!sed s/floor/ground/ scene.rad\n"
+    graph = SceneGraph(str(scene))
+    graph.parse(line, 0, [str(scene)])
+    assert [p.name for p in graph] == ["ground", "candle"]
+    assert graph.sources == [line.strip()]
+    # loaded again from the cache, without running the command
+    monkeypatch.setenv("PATH", "")
+    again = SceneGraph(str(scene))
+    again.parse(line, 0, [str(scene)])
+    assert again.text() == graph.text()
@@ -0,0 +1,103 @@
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import sky
+
+GENSKY = [
+    "1 8 11:00CEST -a 42.1073 -o 1.8835 +s",
+    "12 24 14:00CET -a 42.1073 -o 1.8835 -c",
+    "4 23 14:00CEST -a 42.1073 -o 1.8835 +i",
+    "4 23 16:00CEST -a 42.1073 -o 1.8835 -i",
+    "6 21 12 -u",
+    "3 1 9:30 -a 37.8 -o 122.3 -m 120 -s",
+    # the almanac solar position
+    "4 23 14:00CEST -y 1990 -a 42.1073 -o 1.8835 +s",
+    "11 3 +10:00 -y 2024 -a -33.9 -o -151.2 +s",
+]
+# absolute tolerances, the output is printed with 3 to 6 digits
+TOLERANCE = {"time": 0.02, "angles": 0.15}
+
+
+def values(text):
+    """Numbers of the comments and of the primitives of a sky description"""
+    numbers = {}
+    lines = text.splitlines()
+    for i, line in enumerate(lines):
+        if line.startswith("# Local solar time:"):
+            numbers["time"] = [float(line.split()[-1])]
+        elif line.startswith("# Solar altitude and azimuth:"):
+            numbers["angles"] = [float(w) for w in line.split()[-2:]]
+        elif line in ("void light solar", "solar source sun", "void brightfunc skyfunc"):
+            numbers[line] = [float(w) for w in lines[i + 3].split()[1:]]
+    return numbers
+
+
+@pytest.mark.skipif(shutil.which("gensky") is None, reason="needs Radiance's gensky")
+@pytest.mark.parametrize("args", GENSKY)
+def test_matches_gensky(args):
+    expected = values(subprocess.run(
+        ["gensky", *args.split()], capture_output=True, text=True, check=True
+    ).stdout)
+    computed = values(sky.gensky_command(args.split()))
+    assert computed.keys() == expected.keys()
+    for name in expected:
+        np.testing.assert_allclose(
+            computed[name], expected[name], rtol=0.01, atol=TOLERANCE.get(name, 2e-3),
+            err_msg=name,
+        )
+
+
+def hemisphere(n=400):
+    """Directions of the upper hemisphere and their solid angle x cosine"""
+    mu = (np.arange(n) + 0.5) / n
+    phi = (np.arange(2 * n) + 0.5) / (2 * n) * 2 * np.pi
+    mu, phi = (a.ravel() for a in np.meshgrid(mu, phi, indexing="ij"))
+    s = np.sqrt(1 - mu**2)
+    dirs = np.stack([s * np.cos(phi), s * np.sin(phi), mu], axis=1)
+    return dirs, dirs[:, 2] * (1 / n) * (np.pi / n)
+
+
+@pytest.mark.parametrize("sky_type", ["-s", "-c", "-u", "-i"])
+def test_diffuse_illuminance(sky_type):
+    # the ground brightness of a sky without sun is its diffuse horizontal
+    # irradiance over pi, times the ground reflectance: the normalization
+    # polynomials of gensky must fit the integral of skybright.cal
+    dirs, weights = hemisphere()
+    for altitude in (10, 30, 60, 80):
+        v = sky.sky_values(sky_type, [altitude], [20.0])
+        irradiance = sky.skybright(v, dirs)[0] @ weights
+        assert irradiance == pytest.approx(
+            np.pi * v["ground"][0] / sky.GROUND_REFLECTANCE, rel=0.03
+        )
+
+
+def test_almanac_sun():
+    # the solstice declination and the extremes of the equation of time
+    for date, declination, eot in [
+        ((2000, 6, 21), 23.44, -1.8),
+        ((2000, 11, 3), -15.25, 16.4),
+        ((2000, 2, 11), -14.15, -14.2),
+    ]:
+        sd, e = sky.almanac_sun(sky.julian_days(*date, 12))
+        assert np.degrees(sd) == pytest.approx(declination, abs=0.05)
+        assert e * 60 == pytest.approx(eot, abs=0.2)
+
+
+def test_year_moves_the_sun():
+    # a leap year shifts the date against the yearly approximation
+    a = sky.sun_position(3, 1, 12.0, 40.0, 0.0, 0.0, year=2023)
+    b = sky.sun_position(3, 1, 12.0, 40.0, 0.0, 0.0, year=2024)
+    assert a[1] != b[1]
+    assert abs(float(a[1]) - float(b[1])) < 1.0
+
+
+def test_gensky_defaults():
+    args = sky.parse_gensky(["6", "21", "12"])
+    assert args["latitude"] == pytest.approx(37.815, abs=1e-3)
+    assert args["longitude"] == pytest.approx(122.04, abs=1e-2)
+    assert args["meridian"] == 120
+    assert sky.parse_gensky(["6", "21", "12PST"])["meridian"] is None
+    assert sky.parse_gensky(["6", "21", "12", "-m", "105"])["meridian"] == 105
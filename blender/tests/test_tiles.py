@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+from hdr import read_hdr
+from rif import Rif
+from tiles import TiledRender, image_size, parse_view, resolution, splits
+
+ADDON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addon")
+
+# Stands in for rpict: the red and green of each pixel are the image plane
+# coordinates of its center (offset to stay positive), in its own view.
+RPICT = """#!{python}
+import sys
+import numpy as np
+sys.path.insert(0, {addon!r})
+from tiles import image_size, parse_view
+from hdr import write_hdr
+args = sys.argv[1:]
+view = parse_view(args)
+x, y = int(args[args.index("-x") + 1]), int(args[args.index("-y") + 1])
+u = ((np.arange(x) + 0.5) / x - 0.5 + view["-vs"]) * image_size(view, view["-vh"])
+v = ((np.arange(y)[::-1] + 0.5) / y - 0.5 + view["-vl"]) * image_size(view, view["-vv"])
+rgb = np.ones((y, x, 3))
+rgb[..., 0] = u[None, :] + {offset}
+rgb[..., 1] = v[:, None] + {offset}
+write_hdr("/dev/stdout", rgb)
+"""
+OFFSET = 5
+
+
+def test_splits():
+    assert splits(11, 3) == [4, 4, 3]
+    assert splits(7, 2) == [4, 3]
+    assert splits(12, 4) == [3, 3, 3, 3]
+
+
+@pytest.mark.parametrize("options", [
+    "-vtv -vp 0 0 0 -vd 0 1 0 -vh 60 -vv 40",
+    "-vtl -vp 0 0 0 -vd 0 1 0 -vh 6 -vv 4 -vs 0.25 -vl -0.1",
+])
+def test_stitched_picture_is_the_full_view(tmp_path, programs, options):
+    programs("rpict", RPICT.format(python=sys.executable, addon=ADDON, offset=OFFSET))
+    programs("rad", "#!/bin/sh\necho rpict -x 26 -y 14 -ab 1 -av .1 .1 .1 scene.oct '>' p.unf\n")
+    (tmp_path / "tiles").mkdir()
+    (tmp_path / "scene.rif").write_text(
+        f"RESOLUTION= 13 7\nOCTREE= scene.oct\nPICTURE= pic\nview= a {options}\n"
+    )
+    rif = Rif(str(tmp_path / "scene.rif"), str(tmp_path))
+
+    # 3 by 2 tiles, neither size divides the resolution
+    assert TiledRender(rif, 6).render_view("a", options, None) == []
+
+    view = parse_view(options.split())
+    x, y = resolution(view, 13, 7)
+    assert (x % 3, y % 2) != (0, 0)
+    rgb, _ = read_hdr(str(tmp_path / "pic_a.hdr"))
+    assert rgb.shape == (y, x, 3)
+    u = ((np.arange(x) + 0.5) / x - 0.5 + view["-vs"]) * image_size(view, view["-vh"])
+    v = ((np.arange(y)[::-1] + 0.5) / y - 0.5 + view["-vl"]) * image_size(view, view["-vv"])
+    np.testing.assert_allclose(rgb[0, :, 0], u + OFFSET, rtol=0.01)
+    np.testing.assert_allclose(rgb[:, 0, 1], v + OFFSET, rtol=0.01)
@@ -0,0 +1,121 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import pool
+import tracing
+from jobs import Job
+
+ADDON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "addon")
+ALLOCATE = "import sys; b = bytearray(64 << 20); print(open(sys.argv[1]).read())"
+
+
+def events(filename):
+    with open(filename) as f:
+        return json.load(f)["traceEvents"]
+
+
+def test_run_records_process(tmp_path):
+    tracer = tracing.Tracer(str(tmp_path / "trace.json"))
+    (tmp_path / "input.txt").write_text("x" * 1000)
+    result = tracer.run(
+        [sys.executable, "-c", ALLOCATE, "input.txt"], capture_output=True, text=True,
+        cwd=str(tmp_path),
+    )
+    assert result.returncode == 0
+    assert result.stdout == "x" * 1000 + "\n"
+    [e] = tracer.events
+    assert e["cat"] == "process" and e["ph"] == "X" and e["dur"] > 0
+    assert e["args"]["exit"] == 0
+    assert e["args"]["inputs"] == {"input.txt": 1000}
+    assert e["args"]["input_bytes"] == 1000
+    assert e["args"]["peak_rss"] >= 64 << 20
+
+
+def test_run_records_failures(tmp_path):
+    tracer = tracing.Tracer(str(tmp_path / "trace.json"))
+    assert tracer.run([sys.executable, "-c", "exit(3)"]).returncode == 3
+    assert tracer.system("exit 2") == 2
+    with pytest.raises(ValueError):
+        with tracer.stage("parse"):
+            raise ValueError("bad")
+    assert [e["args"].get("exit") for e in tracer.events[:2]] == [3, 2]
+    assert tracer.events[2]["name"] == "parse"
+    assert "ValueError" in tracer.events[2]["args"]["error"]
+
+
+def test_disabled_runs_untraced(tmp_path):
+    tracer = tracing.Tracer()
+    assert tracer.run([sys.executable, "-c", "print(1)"], capture_output=True).stdout == b"1\n"
+    with tracer.stage("nothing"):
+        pass
+    tracer.save()
+    assert tracer.events == []
+
+
+def test_processes_merge_into_one_trace(tmp_path):
+    filename = str(tmp_path / "trace.json")
+    tracer = tracing.Tracer(filename)
+    with tracer.stage("export"):
+        time.sleep(0.01)
+    tracer.save()
+    env = {**os.environ, tracing.ENV: filename}
+    script = (f"import sys; sys.path.insert(0, {ADDON!r}); import pool; "
+              "pool.run([sys.executable, '-c', 'exit(1)'])")
+    children = [subprocess.Popen([sys.executable, "-c", script], env=env) for _ in range(3)]
+    for c in children:
+        assert c.wait() == 0
+    tracer.save()  # again, its own events are not duplicated
+
+    merged = events(filename)
+    assert len({e["pid"] for e in merged}) == 4
+    assert sum(e["name"] == "export" for e in merged) == 1
+    assert sum(e["cat"] == "process" for e in merged) == 3
+    with open(tmp_path / "trace.txt") as f:
+        table = f.read().splitlines()
+    assert table[0].split() == ["name", "count", "total", "s", "max", "s", "RSS", "MiB", "failed"]
+    rows = {(line.split()[0], line.split()[1]): line.split()[2:] for line in table[1:]}
+    count, _, _, _, failed = rows[("process", os.path.basename(sys.executable))]
+    assert (count, failed) == ("3", "3")
+    assert rows[("stage", "export")][0] == "1"
+
+
+def test_summary_sorts_by_total_time():
+    def event(name, dur, **args):
+        return {"name": name, "cat": "process", "dur": dur, "args": args}
+
+    table = tracing.summary([
+        event("oconv", 1_000_000, exit=0, peak_rss=2 << 20),
+        event("rpict", 3_000_000, exit=0, peak_rss=8 << 20),
+        event("rpict", 2_000_000, exit=1, peak_rss=4 << 20),
+    ]).splitlines()
+    assert [line.split()[:6] for line in table[1:]] == [
+        ["process", "rpict", "2", "5.000", "3.000", "8.0"],
+        ["process", "oconv", "1", "1.000", "1.000", "2.0"],
+    ]
+    assert table[1].split()[-1] == "1"
+
+
+def test_enable_traces_pool_and_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracing.TRACER, "filename", None)
+    monkeypatch.setattr(tracing.TRACER, "events", [])
+    monkeypatch.setenv(tracing.ENV, "")
+    filename = str(tmp_path / "trace.json")
+    tracing.enable(filename)
+    assert tracing.TRACER.enabled and os.environ[tracing.ENV] == filename
+
+    assert pool.run([sys.executable, "-c", "print('hi')"]).stdout == "hi\n"
+    job = Job("job", [[sys.executable, "-c", "exit(0)"], [sys.executable, "-c", "exit(4)"]])
+    job.start()
+    while not job.finished:
+        job.poll()
+        time.sleep(0.01)
+    assert job.state == "failed"
+    tracing.save()
+
+    exits = [e["args"]["exit"] for e in events(filename) if e["cat"] == "process"]
+    assert exits == [0, 0, 4]
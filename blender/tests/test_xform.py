@@ -0,0 +1,28 @@
+import pytest
+
+from xform import is_similarity, parse_xform, xform_args
+
+NON_UNIFORM = ((2, 0, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1))
+SHEAR = ((1, 0.5, 0, 0), (0, 1, 0, 0), (0, 0, 1, 0), (0, 0, 0, 1))
+
+
+def close(a, b):
+    return all(abs(x - y) < 1e-6 for ra, rb in zip(a, b) for x, y in zip(ra, rb))
+
+
+@pytest.mark.parametrize("args", [
+    "-rx 30 -ry 20 -rz 10 -s 2 -t 1 2 3",
+    "-mx -rz 90 -s 0.5",
+    "-t 0 0 5",
+])
+def test_similarity_round_trip(args):
+    m = parse_xform(args)
+    assert is_similarity(m)
+    assert close(parse_xform(xform_args(m)), m)
+
+
+@pytest.mark.parametrize("m", [NON_UNIFORM, SHEAR])
+def test_non_similarity_is_refused(m):
+    assert not is_similarity(m)
+    with pytest.raises(Exception):
+        xform_args(m)